@@ -0,0 +1,126 @@
+"""
+Микро-бенчмарк поиска информации в описании книги: старые функции digger.read_rows и digger.find_info против
+scanner.scan_book. Для каждого варианта выводится среднее время на книгу, количество прочитанных байт и количество
+книг, у которых найдена информация.
+
+Запуск из папки app:
+
+    python -m benchmarks.bench_scanner --books 2000
+"""
+import io
+import time
+
+import click
+
+import utilities.digger as d
+import utilities.scanner as sc
+from benchmarks.corpus import render_book
+
+
+class CountingReader(io.BufferedReader):
+    """
+    Буферизированный поток, считающий количество байт, прочитанных из исходного потока.
+    """
+
+    def __init__(self, raw):
+        self.counter = CountingRaw(raw)
+        super().__init__(self.counter)
+
+
+class CountingRaw(io.RawIOBase):
+    """
+    Обертка над BytesIO, считающая прочитанные байты.
+    """
+
+    def __init__(self, data: bytes):
+        self._data = io.BytesIO(data)
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = self._data.readinto(buffer)
+        self.bytes_read += size
+        return size
+
+
+def make_books(count: int) -> list:
+    """
+    Создает книги с разными кодировками и размерами описания.
+    :param count: количество книг
+    :return: список книг в байтах
+    """
+    books = []
+    for number in range(count):
+        books.append(
+            render_book(
+                number,
+                encoding="windows-1251" if number % 3 == 0 else "utf-8",
+                first_name=f"Имя{number}",
+                last_name=f"Фамилия{number}",
+                year=1950 + number % 70,
+                annotation_paragraphs=number % 20,
+                body_paragraphs=2000,
+            )
+        )
+    return books
+
+
+def legacy_scan(stream) -> list:
+    """
+    Старый способ: чтение строк функцией read_rows в кодировке utf8 и поиск тегов функцией find_info.
+    """
+    return d.find_info(d.read_rows(io.TextIOWrapper(stream, encoding="utf8")))
+
+
+def new_scan(stream) -> list:
+    """
+    Новый способ: чтение байт до тега </description> и поиск тегов за один проход функцией scan_book.
+    """
+    return sc.scan_book(stream)
+
+
+def run(scan, books: list) -> dict:
+    """
+    Прогоняет функцию поиска по всем книгам.
+    :param scan: функция поиска, принимающая бинарный поток
+    :param books: список книг в байтах
+    :return: словарь с результатами замера
+    """
+    bytes_read = 0
+    found = 0
+    start = time.perf_counter()
+    for book in books:
+        stream = CountingReader(book)
+        if scan(stream):
+            found += 1
+        bytes_read += stream.counter.bytes_read
+    elapsed = time.perf_counter() - start
+
+    return {
+        "us_per_book": elapsed / len(books) * 1e6,
+        "bytes_per_book": bytes_read / len(books),
+        "found": found,
+    }
+
+
+@click.command()
+@click.option("--books", "-n", type=click.IntRange(min=1), default=2000, help="Количество книг")
+@click.option("--repeat", "-r", type=click.IntRange(min=1), default=3, help="Количество повторов, берется лучший")
+def bench_scanner(books, repeat):
+    """
+    Сравнивает старый и новый способы поиска информации в описании книги.
+    """
+    corpus = make_books(books)
+    for name, scan in (("read_rows + find_info", legacy_scan), ("scan_book", new_scan)):
+        result = min((run(scan, corpus) for _ in range(repeat)), key=lambda item: item["us_per_book"])
+        print(
+            f"{name:<22} {result['us_per_book']:>9.1f} мкс/книга "
+            f"{result['bytes_per_book']:>10.0f} байт/книга "
+            f"найдено {result['found']}/{books}"
+        )
+
+
+if __name__ == "__main__":
+    bench_scanner()
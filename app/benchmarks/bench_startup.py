@@ -0,0 +1,103 @@
+"""
+Бенчмарк времени запуска команд: отдельные программы digger, seeker, wiper и migration против общей программы
+catalog, которая импортирует модуль команды только при ее вызове, и цепочки команд catalog в одном процессе против
+отдельного процесса на каждую команду. Для каждого варианта выводится лучшее и медианное время запуска.
+
+Команды запускаются отдельными процессами с пустой базой данных во временной директории. Запуск из папки app:
+
+    python -m benchmarks.bench_startup --repeat 20 --chain 10
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_process(args: list, env: dict) -> float:
+    """
+    Запускает интерпретатор Python с аргументами.
+    :param args: аргументы интерпретатора
+    :param env: переменные окружения
+    :return: время выполнения в секундах
+    """
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *args], cwd=APP_DIR, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return time.perf_counter() - start
+
+
+def measure(runs: list, env: dict, repeat: int) -> dict:
+    """
+    :param runs: список запусков, каждый запуск - список аргументов интерпретатора
+    :param env: переменные окружения
+    :param repeat: количество повторов
+    :return: словарь с лучшим и медианным временем выполнения всех запусков в миллисекундах
+    """
+    seconds = [sum(run_process(args, env) for args in runs) for _ in range(repeat)]
+    return {"best_ms": min(seconds) * 1000, "median_ms": statistics.median(seconds) * 1000}
+
+
+def scenarios(chain: int) -> list:
+    """
+    :param chain: количество команд в цепочке
+    :return: список кортежей (название, запуски отдельных программ, запуски catalog)
+    """
+    search = ["-a", "Имя автора", "-l", "1"]
+    chained = []
+    for _ in range(chain):
+        chained += ["seek", *search, "then"]
+    return [
+        (
+            "--help",
+            [["-m", "utilities.digger", "--help"]],
+            [["-m", "utilities.launcher", "--help"]],
+        ),
+        (
+            "wiper -n 1 --dry-run",
+            [["-m", "utilities.wiper", "-n", "1", "--dry-run"]],
+            [["-m", "utilities.launcher", "wipe", "-n", "1", "--dry-run"]],
+        ),
+        (
+            "seeker -a ... -l 1",
+            [["-m", "utilities.seeker", *search]],
+            [["-m", "utilities.launcher", "seek", *search]],
+        ),
+        (
+            f"{chain} x seeker",
+            [["-m", "utilities.seeker", *search]] * chain,
+            [["-m", "utilities.launcher", *chained[:-1]]],
+        ),
+    ]
+
+
+@click.command()
+@click.option("--repeat", "-r", type=click.IntRange(min=1), default=10, help="Количество повторов каждого запуска")
+@click.option("--chain", "-c", type=click.IntRange(min=1), default=10, help="Количество команд в цепочке")
+def bench_startup(repeat, chain):
+    """
+    Сравнивает время запуска отдельных программ и программы catalog.
+    """
+    with tempfile.TemporaryDirectory(prefix="lab_task_startup_") as work_dir:
+        env = dict(os.environ, LAB_TASK_DB=os.path.join(work_dir, "main.db"))
+        run_process(["-m", "db_and_migration.migration.migration"], env)
+
+        baseline = measure([["-c", "pass"]], env, repeat)
+        print(f"{'python -c pass':<24} {baseline['best_ms']:>8.1f} мс")
+        for name, separate, launcher in scenarios(chain):
+            old = measure(separate, env, repeat)
+            new = measure(launcher, env, repeat)
+            print(
+                f"{name:<24} отдельная программа {old['best_ms']:>8.1f} мс (медиана {old['median_ms']:.1f}), "
+                f"catalog {new['best_ms']:>8.1f} мс (медиана {new['median_ms']:.1f})"
+            )
+
+
+if __name__ == "__main__":
+    bench_startup()
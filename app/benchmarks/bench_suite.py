@@ -0,0 +1,323 @@
+"""
+Набор бенчмарков digger, seeker и wiper на синтетическом корпусе из benchmarks.corpus. Результаты выводятся в формате
+JSON, чтобы сравнивать запуски между собой:
+
+    digger: файлов и книг в секунду для первого заполнения и для обновления (-u --force) в один и в несколько
+    процессов, а также для повторного запуска без изменений
+    seeker: p50 и p99 времени выполнения типичных запросов
+    wiper: удаление книг по одной, списком id, диапазоном id, по условию и очистка всей базы данных для каталогов
+    заданных размеров
+
+digger запускается отдельным процессом с базой данных во временной директории, seeker и wiper выполняются в текущем
+процессе. Для бенчмарков seeker каталог заполняется digger, даже если бенчмарки digger пропущены. Запуск из папки app:
+
+    python -m benchmarks.bench_suite --books 10000 --wipe-sizes 10000,100000,1000000 --output result.json
+"""
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import peewee as pw
+
+import db_and_migration.migration.models as md
+from benchmarks.corpus import generate_corpus
+from db_and_migration.migration.migration import upgrade
+from utilities.seeker import build_query
+from utilities.wiper import delete_books
+from utilities.writer import BatchWriter
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["digger", "seeker", "wiper"]
+# Сколько книг удаляется по одной для каждого размера каталога
+SINGLE_DELETES = 200
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    :param values: список значений
+    :param percent: процентиль от 0 до 100
+    :return: значение процентиля по методу ближайшего ранга
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def latency_summary(seconds: list) -> dict:
+    """
+    :param seconds: список длительностей в секундах
+    :return: словарь с p50, p99 и средним значением в миллисекундах
+    """
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 3),
+        "mean_ms": round(sum(seconds) / len(seconds) * 1000, 3),
+    }
+
+
+def run_command(module: str, args: list, db_path: str) -> float:
+    """
+    Запускает команду отдельным процессом с базой данных db_path.
+    :param module: модуль команды, например utilities.digger
+    :param args: аргументы команды
+    :param db_path: путь до базы данных
+    :return: время выполнения в секундах
+    """
+    env = dict(os.environ, LAB_TASK_DB=db_path)
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", module, *args],
+        cwd=APP_DIR,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def use_database(db_path: str) -> None:
+    """
+    Переключает модели текущего процесса на базу данных db_path и применяет миграции.
+    :param db_path: путь до базы данных
+    """
+    md.db.init(db_path)
+    with md.db.connection_context():
+        upgrade(md.db)
+
+
+def bench_digger(corpus_dir: str, work_dir: str, corpus_info: dict, workers: int) -> tuple:
+    """
+    :param corpus_dir: директория с корпусом
+    :param work_dir: директория для баз данных, должна быть пустой
+    :param corpus_info: результат generate_corpus
+    :param workers: количество процессов для параллельного запуска
+    :return: кортеж (словарь с результатами, путь до заполненной базы данных)
+    """
+    results = {}
+    runs = [
+        ("fresh_serial", "serial.db", ["-w", "1"]),
+        ("update_serial", "serial.db", ["-w", "1", "-u", "--force"]),
+        ("fresh_parallel", "parallel.db", ["-w", str(workers)]),
+        ("update_parallel", "parallel.db", ["-w", str(workers), "-u", "--force"]),
+        ("rescan_unchanged", "parallel.db", ["-w", str(workers)]),
+    ]
+    for name, db_name, args in runs:
+        db_path = os.path.join(work_dir, db_name)
+        if not os.path.exists(db_path):
+            run_command("db_and_migration.migration.migration", [], db_path)
+        seconds = run_command("utilities.digger", [corpus_dir, *args], db_path)
+        results[name] = {
+            "seconds": round(seconds, 3),
+            "files_per_sec": round(corpus_info["files"] / seconds, 1),
+            "books_per_sec": round(corpus_info["books"] / seconds, 1),
+        }
+        click.echo(f"digger {name}: {results[name]}", err=True)
+    return results, os.path.join(work_dir, "parallel.db")
+
+
+def seeker_queries(rng: random.Random, repeat: int) -> dict:
+    """
+    Составляет типичные запросы seeker по данным из каталога.
+    :param rng: генератор случайных чисел
+    :param repeat: количество запросов каждого вида
+    :return: словарь, где ключ - название вида запросов, а значение - список наборов условий для build_query
+    """
+    with md.db:
+        books = list(
+            md.Book.select(md.Book.id, md.Author.name, md.Book.title, md.Book.year)
+            .join(md.Author)
+            .order_by(pw.fn.Random())
+            .limit(repeat)
+            .tuples()
+        )
+    samples = [books[number % len(books)] for number in range(repeat)]
+    return {
+        "author": [{"author": author} for _, author, _, _ in samples],
+        "title": [{"book_name": title} for _, _, title, _ in samples],
+        "author_ignore_case": [{"author": author, "ignore_case": True} for _, author, _, _ in samples],
+        "year_range": [{"year_from": year, "year_to": year + 5} for _, _, _, year in samples],
+        "title_prefix": [{"title_prefix": title[:3]} for _, _, title, _ in samples],
+        "author_prefix": [{"author_prefix": author[:5]} for _, author, _, _ in samples],
+        "full_text": [{"query": rng.choice(title.split()), "limit": 100} for _, _, title, _ in samples],
+        "page": [{"limit": 100, "after_id": book_id} for book_id, _, _, _ in samples],
+    }
+
+
+def bench_seeker(db_path: str, repeat: int, seed: int) -> dict:
+    """
+    :param db_path: путь до заполненной базы данных
+    :param repeat: количество запросов каждого вида
+    :param seed: начальное значение генератора случайных чисел
+    :return: словарь с результатами для каждого вида запросов
+    """
+    use_database(db_path)
+    results = {}
+    for name, filters_list in seeker_queries(random.Random(seed), repeat).items():
+        seconds = []
+        rows = 0
+        for filters in filters_list:
+            start = time.perf_counter()
+            with md.db:
+                rows += len(build_query(**filters).tuples())
+            seconds.append(time.perf_counter() - start)
+        results[name] = {**latency_summary(seconds), "mean_rows": round(rows / len(filters_list), 1)}
+        click.echo(f"seeker {name}: {results[name]}", err=True)
+    return results
+
+
+def fill_catalog(size: int) -> None:
+    """
+    Заполняет текущую базу данных синтетическими книгами через BatchWriter.
+    :param size: количество книг
+    """
+    with BatchWriter(update=False, batch_size=5000) as writer:
+        for number in range(size):
+            author = number % max(1, size // 10)
+            writer.add(
+                [f"Имя{author} Фамилия{author}", f"Книга {number}", 1900 + number % 125, "ru", None, None, None]
+            )
+
+
+def timed_delete(**kwargs) -> dict:
+    """
+    Удаляет книги функцией wiper.delete_books и замеряет время.
+    :param kwargs: параметры delete_books
+    :return: словарь с количеством удаленных книг, временем и скоростью удаления
+    """
+    start = time.perf_counter()
+    books, _ = delete_books(**kwargs)
+    seconds = time.perf_counter() - start
+    return {"books": books, "seconds": round(seconds, 3), "books_per_sec": round(books / seconds, 1)}
+
+
+def bench_wiper(work_dir: str, sizes: list, seed: int) -> dict:
+    """
+    :param work_dir: директория для баз данных
+    :param sizes: размеры каталогов
+    :param seed: начальное значение генератора случайных чисел
+    :return: словарь с результатами для каждого размера каталога
+    """
+    rng = random.Random(seed)
+    results = {}
+    for size in sizes:
+        use_database(os.path.join(work_dir, f"wiper_{size}.db"))
+        start = time.perf_counter()
+        fill_catalog(size)
+        fill_seconds = time.perf_counter() - start
+
+        with md.db:
+            ids = [book_id for book_id, in md.Book.select(md.Book.id).tuples()]
+        rng.shuffle(ids)
+        single_ids, ids = ids[:SINGLE_DELETES], ids[SINGLE_DELETES:]
+        seconds = []
+        for book_id in single_ids:
+            start = time.perf_counter()
+            delete_books(ids=[book_id])
+            seconds.append(time.perf_counter() - start)
+
+        bulk = {}
+        list_ids = ids[: size // 10]
+        bulk["id_list"] = timed_delete(ids=list_ids)
+        first_id = min(ids[size // 10 :] or [0])
+        bulk["id_range"] = timed_delete(ranges=[(first_id, first_id + size // 10)])
+        bulk["filter"] = timed_delete(filters={"year": 1900})
+        bulk["delete_all"] = timed_delete(delete_all=True)
+
+        results[str(size)] = {
+            "fill_seconds": round(fill_seconds, 3),
+            "single_delete": {**latency_summary(seconds), "books_per_sec": round(len(seconds) / sum(seconds), 1)},
+            **bulk,
+        }
+        click.echo(f"wiper {size}: {results[str(size)]}", err=True)
+    return results
+
+
+def environment_info() -> dict:
+    """
+    :return: словарь с информацией об окружении, в котором выполнялись бенчмарки
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=APP_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+@click.command()
+@click.option("--books", "-n", type=click.IntRange(min=1), default=10_000, help="Количество книг в корпусе")
+@click.option("--seed", type=int, default=0, help="Начальное значение генератора случайных чисел")
+@click.option("--workers", "-w", type=click.IntRange(min=1), default=os.cpu_count(), help="Процессов для digger")
+@click.option("--repeat", "-r", type=click.IntRange(min=1), default=100, help="Запросов seeker каждого вида")
+@click.option(
+    "--wipe-sizes",
+    default="10000,100000,1000000",
+    show_default=True,
+    help="Размеры каталогов для wiper через запятую",
+)
+@click.option("--skip", type=click.Choice(SCENARIOS), multiple=True, help="Пропустить группу бенчмарков")
+@click.option("--work-dir", type=click.Path(file_okay=False), help="Директория для корпуса и баз данных")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="Файл для результатов, по умолчанию stdout")
+def bench_suite(books, seed, workers, repeat, wipe_sizes, skip, work_dir, output):
+    """
+    Запускает бенчмарки digger, seeker и wiper и выводит результаты в формате JSON.
+    """
+    keep = work_dir is not None
+    work_dir = os.path.abspath(work_dir or tempfile.mkdtemp(prefix="lab_task_bench_"))
+    os.makedirs(work_dir, exist_ok=True)
+    result = {
+        "environment": environment_info(),
+        "parameters": {"books": books, "seed": seed, "workers": workers, "repeat": repeat},
+    }
+
+    try:
+        if "digger" not in skip or "seeker" not in skip:
+            corpus_dir = os.path.join(work_dir, "corpus")
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+            result["corpus"] = generate_corpus(corpus_dir, books, seed)
+            digger_dir = os.path.join(work_dir, "digger")
+            shutil.rmtree(digger_dir, ignore_errors=True)
+            os.makedirs(digger_dir)
+            result["digger"], db_path = bench_digger(corpus_dir, digger_dir, result["corpus"], workers)
+            if "digger" in skip:
+                del result["digger"]
+            if "seeker" not in skip:
+                result["seeker"] = bench_seeker(db_path, repeat, seed)
+        if "wiper" not in skip:
+            wiper_dir = os.path.join(work_dir, "wiper")
+            shutil.rmtree(wiper_dir, ignore_errors=True)
+            os.makedirs(wiper_dir)
+            result["wiper"] = bench_wiper(wiper_dir, [int(size) for size in wipe_sizes.split(",")], seed)
+    finally:
+        if not keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    bench_suite()
@@ -0,0 +1,186 @@
+"""
+Генератор синтетического корпуса книг fb2 для бенчмарков. Книги сохраняются как fb2, fb2.zip, fb2.gz и архивы
+fb2.zip с несколькими книгами. Кодировка, размер описания и размер текста книг меняются, авторы повторяются. При
+одинаковых параметрах создается одинаковый корпус.
+
+Запуск из папки app:
+
+    python -m benchmarks.corpus /tmp/corpus --books 10000
+"""
+import gzip as gz
+import os
+import random
+import zipfile as zf
+
+import click
+
+BOOK_TEMPLATE = """<?xml version="1.0" encoding="{encoding}"?>
+<FictionBook xmlns="http://www.gribuser.ru/xml/fictionbook/2.0">
+<description>
+ <title-info>
+  <genre>sf</genre>
+  <author>
+   <first-name>{first_name}</first-name>
+   <middle-name>Отчество</middle-name>
+   <last-name>{last_name}</last-name>
+  </author>
+  <book-title>{title}</book-title>
+  <annotation>{annotation}</annotation>
+  <lang>{lang}</lang>
+ </title-info>
+ <document-info>
+  <program-used>FictionBook Editor 2.6</program-used>
+  <src-url>http://example.com/{number}</src-url>
+  <version>1.{number}</version>
+ </document-info>
+ <publish-info><year>{year}</year></publish-info>
+</description>
+<body><title><p>Глава 1</p></title>{body}</body>
+</FictionBook>
+"""
+
+ENCODINGS = ["utf-8", "utf-8", "windows-1251"]
+LANGUAGES = ["ru", "ru", "ru", "en", "uk"]
+TITLE_WORDS = ["Голубая", "луна", "Дорога", "домой", "Тень", "ветра", "Город", "Звезды", "Море", "Сказка", "Ночь"]
+# Доли книг в отдельных файлах fb2, fb2.zip и fb2.gz, остальные книги попадают в архивы с несколькими книгами
+FORMAT_WEIGHTS = [("fb2", 4), ("fb2.zip", 2), ("fb2.gz", 2), ("collection", 2)]
+
+
+def render_book(
+    number: int,
+    encoding: str = "utf-8",
+    first_name: str = "Имя",
+    last_name: str = "Фамилия",
+    title: str = None,
+    lang: str = "ru",
+    year: int = 2000,
+    annotation_paragraphs: int = 0,
+    body_paragraphs: int = 100,
+) -> bytes:
+    """
+    Создает книгу fb2.
+    :param number: номер книги, используется в ссылке, версии и названии по умолчанию
+    :param encoding: кодировка книги
+    :param first_name: имя автора
+    :param last_name: фамилия автора
+    :param title: название книги
+    :param lang: язык книги
+    :param year: год издания книги
+    :param annotation_paragraphs: количество абзацев аннотации, от него зависит размер описания книги
+    :param body_paragraphs: количество абзацев текста книги
+    :return: книга в байтах
+    """
+    text = BOOK_TEMPLATE.format(
+        encoding=encoding,
+        number=number,
+        first_name=first_name,
+        last_name=last_name,
+        title=title or f"Книга номер {number}",
+        lang=lang,
+        year=year,
+        annotation="<p>Аннотация к книге.</p>\n" * annotation_paragraphs,
+        body="<p>Текст книги.</p>\n" * body_paragraphs,
+    )
+    return text.encode(encoding)
+
+
+def random_book(number: int, rng: random.Random, authors: int) -> bytes:
+    """
+    Создает книгу со случайными кодировкой, автором из authors возможных, названием, годом и размерами.
+    :param number: номер книги
+    :param rng: генератор случайных чисел
+    :param authors: количество разных авторов в корпусе
+    :return: книга в байтах
+    """
+    author = rng.randrange(authors)
+    title = " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 3)))
+    return render_book(
+        number,
+        encoding=rng.choice(ENCODINGS),
+        first_name=f"Имя{author}",
+        last_name=f"Фамилия{author}",
+        title=f"{title} {number}",
+        lang=rng.choice(LANGUAGES),
+        year=rng.randint(1900, 2024),
+        annotation_paragraphs=rng.choice([0, 1, 5, 50]),
+        body_paragraphs=rng.choice([50, 500, 2000]),
+    )
+
+
+def write_zip(path: str, members: list) -> None:
+    """
+    :param path: путь до архива
+    :param members: список кортежей (имя книги в архиве, книга в байтах)
+    """
+    with zf.ZipFile(path, "w", zf.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+
+
+def generate_corpus(out_dir: str, books: int, seed: int = 0, authors: int = None, collection_size: int = 50) -> dict:
+    """
+    Создает корпус книг в директории out_dir. Книги раскладываются по вложенным директориям по 1000 файлов.
+    :param out_dir: директория для корпуса
+    :param books: количество книг
+    :param seed: начальное значение генератора случайных чисел
+    :param authors: количество разных авторов, по умолчанию в среднем 10 книг на автора
+    :param collection_size: количество книг в одном архиве с несколькими книгами
+    :return: словарь с количеством книг каждого формата и количеством файлов
+    """
+    rng = random.Random(seed)
+    authors = authors or max(1, books // 10)
+    formats, weights = zip(*FORMAT_WEIGHTS)
+    counts = dict.fromkeys(formats, 0)
+    files = 0
+    collection = []
+
+    def file_path(name: str) -> str:
+        directory = os.path.join(out_dir, f"{files // 1000:04d}")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    for number in range(books):
+        data = random_book(number, rng, authors)
+        book_format = rng.choices(formats, weights)[0]
+        counts[book_format] += 1
+        name = f"book{number:07d}.fb2"
+
+        if book_format == "collection":
+            collection.append((name, data))
+            if len(collection) < collection_size:
+                continue
+            write_zip(file_path(f"collection{number:07d}.fb2.zip"), collection)
+            collection = []
+        elif book_format == "fb2.zip":
+            write_zip(file_path(f"{name}.zip"), [(name, data)])
+        elif book_format == "fb2.gz":
+            with gz.open(file_path(f"{name}.gz"), "wb") as book:
+                book.write(data)
+        else:
+            with open(file_path(name), "wb") as book:
+                book.write(data)
+        files += 1
+
+    if collection:
+        write_zip(file_path(f"collection{books:07d}.fb2.zip"), collection)
+        files += 1
+
+    return {"books": books, "files": files, "formats": counts}
+
+
+@click.command()
+@click.argument("out_dir", type=click.Path(file_okay=False))
+@click.option("--books", "-n", type=click.IntRange(min=1), default=10_000, help="Количество книг")
+@click.option("--seed", type=int, default=0, help="Начальное значение генератора случайных чисел")
+@click.option("--authors", type=click.IntRange(min=1), help="Количество разных авторов")
+@click.option("--collection-size", type=click.IntRange(min=1), default=50, help="Книг в архиве с несколькими книгами")
+def corpus(out_dir, books, seed, authors, collection_size):
+    """
+    Создает синтетический корпус книг в директории OUT_DIR.
+    """
+    result = generate_corpus(out_dir, books, seed, authors, collection_size)
+    print(f"Создано {result['books']} книг в {result['files']} файлах: {result['formats']}")
+
+
+if __name__ == "__main__":
+    corpus()
@@ -1,3 +1,93 @@
+import configparser
+import contextlib
+import os
+
 import peewee as pw
 
-connection = pw.SqliteDatabase("db_and_migration/main.db")
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.environ.get("LAB_TASK_CONFIG", os.path.join(APP_DIR, "config.ini"))
+DEFAULT_DB_PATH = "db_and_migration/main.db"
+DEFAULT_BUSY_TIMEOUT = 5000
+
+
+def read_config(path: str = CONFIG_PATH) -> configparser.ConfigParser:
+    """
+    :param path: путь до файла конфигурации
+    :return: конфигурация, пустая, если файла нет
+    """
+    config = configparser.ConfigParser()
+    config.read(path, encoding="utf-8")
+    return config
+
+
+def database_path(config: configparser.ConfigParser, config_path: str = CONFIG_PATH) -> str:
+    """
+    Находит путь до базы данных: сначала в переменной окружения LAB_TASK_DB, затем в файле конфигурации. Относительный
+    путь считается от директории файла конфигурации, поэтому не зависит от текущей директории.
+    :param config: конфигурация
+    :param config_path: путь до файла конфигурации
+    :return: абсолютный путь до базы данных
+    """
+    path = os.environ.get("LAB_TASK_DB") or config.get("sqliteDB", "db", fallback=DEFAULT_DB_PATH).strip("\"'")
+    return os.path.join(os.path.dirname(os.path.abspath(config_path)), os.path.expanduser(path))
+
+
+def read_pragmas(config: configparser.ConfigParser, section: str) -> dict:
+    """
+    :param config: конфигурация
+    :param section: название секции с настройками SQLite
+    :return: словарь, где ключ - название настройки, а значение - ее значение
+    """
+    if not config.has_section(section):
+        return {}
+    return dict(config.items(section))
+
+
+def make_profiles(config: configparser.ConfigParser) -> dict:
+    """
+    :param config: конфигурация
+    :return: словарь профилей настроек SQLite: default и bulk. Профиль bulk дополняет профиль default
+    """
+    default = read_pragmas(config, "pragmas")
+    return {"default": default, "bulk": {**default, **read_pragmas(config, "bulk_pragmas")}}
+
+
+config = read_config()
+profiles = make_profiles(config)
+busy_timeout = config.getint("sqliteDB", "busy_timeout", fallback=DEFAULT_BUSY_TIMEOUT)
+
+connection = pw.SqliteDatabase(
+    database_path(config),
+    pragmas=profiles["default"],
+    timeout=busy_timeout / 1000,
+)
+
+
+def use_profile(name: str) -> None:
+    """
+    Переключает настройки SQLite, с которыми открываются новые подключения к базе данных. Должна вызываться, когда
+    подключение закрыто.
+    :param name: название профиля: default или bulk
+    """
+    connection.init(connection.database, pragmas=profiles[name], timeout=busy_timeout / 1000)
+
+
+def use_database(path: str) -> None:
+    """
+    Переключает подключение на другой файл базы данных, например на шард каталога. Должна вызываться, когда
+    подключение закрыто.
+    :param path: путь до базы данных
+    """
+    connection.init(path, pragmas=profiles["default"], timeout=busy_timeout / 1000)
+
+
+@contextlib.contextmanager
+def bulk_load():
+    """
+    Контекстный менеджер, на время работы которого используется профиль массовой загрузки.
+    """
+    use_profile("bulk")
+    try:
+        yield
+    finally:
+        use_profile("default")
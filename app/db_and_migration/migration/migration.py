@@ -1,16 +1,330 @@
+import datetime
+import os
+import random
+
 import click
 
 import db_and_migration.migration.models as md
 
+# Количество книг, добавляемых в полнотекстовый индекс в одной транзакции
+BACKFILL_CHUNK_SIZE = 10_000
 
-@click.command()
-def migration():
+# Триггеры, поддерживающие полнотекстовый индекс books_fts в соответствии с таблицей книг
+SEARCH_INDEX_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author, language)
+        VALUES (new.id, new.title, (SELECT name FROM authors WHERE id = new.author_id), new.language);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+        INSERT INTO books_fts(rowid, title, author, language)
+        VALUES (new.id, new.title, (SELECT name FROM authors WHERE id = new.author_id), new.language);
+    END""",
+]
+
+
+# Индексы для поиска по имени автора и названию книги без учета регистра, в том числе по префиксу
+NOCASE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS authors_name_nocase ON authors (name COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS books_title_nocase ON books (title COLLATE NOCASE)",
+]
+
+
+# Удаление дубликатов, созданных до появления уникальных индексов. Остается запись с наименьшим id, книги дубликатов
+# автора переносятся на оставшегося автора
+DEDUPLICATE_QUERIES = [
+    """UPDATE books SET author_id = (
+        SELECT MIN(same.id) FROM authors AS author JOIN authors AS same ON same.name = author.name
+        WHERE author.id = books.author_id
+    )
+    WHERE author_id IN (
+        SELECT author.id FROM authors AS author
+        WHERE EXISTS (SELECT 1 FROM authors AS same WHERE same.name = author.name AND same.id < author.id)
+    )""",
+    """DELETE FROM authors
+    WHERE EXISTS (SELECT 1 FROM authors AS same WHERE same.name = authors.name AND same.id < authors.id)""",
+    """DELETE FROM books
+    WHERE id NOT IN (SELECT MIN(id) FROM books GROUP BY IFNULL(author_id, 0), title, IFNULL(year, 0))""",
+]
+
+# Уникальные индексы: имя автора и сочетание автор, название, год. NULL заменяется на 0, так как в уникальном
+# индексе NULL не совпадают
+UNIQUE_INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS authors_name_unique ON authors (name)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS books_unique ON books (IFNULL(author_id, 0), title, IFNULL(year, 0))",
+]
+
+# Триггер, удаляющий связи удаленной книги с файлами манифеста
+FILE_BOOKS_TRIGGER = """CREATE TRIGGER IF NOT EXISTS manifest_books_delete AFTER DELETE ON books BEGIN
+        DELETE FROM manifest_books WHERE book_id = old.id;
+    END"""
+
+# Измерения статистики каталога и столбцы таблицы книг, по которым считается количество книг
+STATS_DIMENSIONS = {"year": "year", "language": "language", "author": "author_id", "program_used": "program_used"}
+
+# Уникальный индекс статистики. NULL заменяется пустым BLOB, который не совпадает ни с одним годом, строкой или id
+STATS_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS catalog_stats_key ON catalog_stats (dimension, IFNULL(value, X''))"
+
+STATS_INCREMENT = """INSERT INTO catalog_stats(dimension, value, books) VALUES ('{dimension}', new.{column}, 1)
+        ON CONFLICT (dimension, IFNULL(value, X'')) DO UPDATE SET books = books + 1;"""
+STATS_DECREMENT = """UPDATE catalog_stats SET books = books - 1
+        WHERE dimension = '{dimension}' AND IFNULL(value, X'') = IFNULL(old.{column}, X'');"""
+
+
+def stats_triggers() -> list:
     """
-    Функция для создания таблиц.
+    Составляет триггеры, поддерживающие статистику каталога: при добавлении и удалении книги меняется количество книг
+    всех измерений, при изменении книги - только измерений, значение которых изменилось. Значения, у которых не
+    осталось книг, остаются в таблице с нулевым количеством, чтобы удаление книги не требовало лишних запросов.
+    :return: список запросов, создающих триггеры
     """
-    with md.db as db:
+    dimensions = STATS_DIMENSIONS.items()
+    increments = "\n        ".join(STATS_INCREMENT.format(dimension=name, column=column) for name, column in dimensions)
+    decrements = "\n        ".join(STATS_DECREMENT.format(dimension=name, column=column) for name, column in dimensions)
+    triggers = [
+        f"""CREATE TRIGGER IF NOT EXISTS catalog_stats_insert AFTER INSERT ON books BEGIN
+        {increments}
+    END""",
+        f"""CREATE TRIGGER IF NOT EXISTS catalog_stats_delete AFTER DELETE ON books BEGIN
+        {decrements}
+    END""",
+    ]
+    for name, column in STATS_DIMENSIONS.items():
+        triggers.append(
+            f"""CREATE TRIGGER IF NOT EXISTS catalog_stats_update_{name} AFTER UPDATE OF {column} ON books
+    WHEN old.{column} IS NOT new.{column} BEGIN
+        {STATS_DECREMENT.format(dimension=name, column=column)}
+        {STATS_INCREMENT.format(dimension=name, column=column)}
+    END"""
+        )
+    return triggers
+
+
+def create_catalog_tables(db) -> None:
+    """
+    Создает таблицы авторов и книг.
+    :param db: база данных
+    """
+    with db.atomic():
         db.create_tables([md.Author, md.Book])
 
 
+def create_manifest_table(db) -> None:
+    """
+    Создает таблицу manifest с уже обработанными файлами.
+    :param db: база данных
+    """
+    with db.atomic():
+        db.create_tables([md.FileManifest])
+
+
+def create_search_index(db) -> None:
+    """
+    Создает полнотекстовый индекс книг и триггеры, которые поддерживают его при добавлении, изменении и удалении книг,
+    после чего добавляет в индекс уже имеющиеся книги.
+    :param db: база данных
+    """
+    with db.atomic():
+        md.BookIndex.create_table(safe=True)
+        for trigger in SEARCH_INDEX_TRIGGERS:
+            db.execute_sql(trigger)
+    backfill_search_index(db)
+
+
+def backfill_search_index(db, chunk_size: int = BACKFILL_CHUNK_SIZE) -> None:
+    """
+    Добавляет в полнотекстовый индекс книги, которых в нем еще нет. Книги добавляются частями по диапазонам id, каждая
+    часть в отдельной транзакции, поэтому база данных не блокируется для записи на все время заполнения индекса, а
+    прерванное заполнение продолжается при следующем запуске. Книги, добавленные после создания триггеров, попадают в
+    индекс через триггеры.
+    :param db: база данных
+    :param chunk_size: количество id книг в одной транзакции
+    """
+    max_id = md.Book.select(md.Book.id).order_by(md.Book.id.desc()).scalar() or 0
+    for start in range(0, max_id, chunk_size):
+        with db.atomic():
+            db.execute_sql(
+                """INSERT INTO books_fts(rowid, title, author, language)
+                SELECT books.id, books.title, authors.name, books.language
+                FROM books LEFT JOIN authors ON authors.id = books.author_id
+                WHERE books.id > ? AND books.id <= ?
+                AND books.id NOT IN (SELECT rowid FROM books_fts WHERE rowid > ? AND rowid <= ?)""",
+                (start, start + chunk_size, start, start + chunk_size),
+            )
+        click.echo(f"Полнотекстовый индекс: {min(start + chunk_size, max_id)}/{max_id}", err=True)
+
+
+def create_nocase_indexes(db) -> None:
+    """
+    Создает индексы для поиска без учета регистра.
+    :param db: база данных
+    """
+    for index in NOCASE_INDEXES:
+        with db.atomic():
+            db.execute_sql(index)
+
+
+def create_unique_indexes(db) -> None:
+    """
+    Удаляет дубликаты авторов и книг и создает уникальные индексы. Таблицы поколения каталога на этом этапе еще нет,
+    результаты поиска, закэшированные до удаления дубликатов, становятся недействительными после миграции 7, которая
+    начинает поколение с нового значения.
+    :param db: база данных
+    """
+    with db.atomic():
+        for query in DEDUPLICATE_QUERIES:
+            db.execute_sql(query)
+    for index in UNIQUE_INDEXES:
+        with db.atomic():
+            db.execute_sql(index)
+
+
+def rebuild_catalog_stats(db) -> None:
+    """
+    Пересчитывает статистику каталога по таблице книг одним запросом группировки на каждое измерение. Нужна после
+    загрузки книг без триггеров и для проверки статистики, при обычной работе статистику поддерживают триггеры.
+    :param db: база данных
+    """
+    with db.atomic():
+        md.CatalogStat.delete().execute()
+        for name, column in STATS_DIMENSIONS.items():
+            db.execute_sql(
+                f"""INSERT INTO catalog_stats(dimension, value, books)
+                SELECT '{name}', {column}, COUNT(*) FROM books GROUP BY {column}"""
+            )
+
+
+def create_catalog_stats(db) -> None:
+    """
+    Создает таблицу статистики каталога и триггеры, которые поддерживают ее при добавлении, изменении и удалении книг,
+    после чего считает статистику уже имеющихся книг.
+    :param db: база данных
+    """
+    with db.atomic():
+        db.create_tables([md.CatalogStat])
+        db.execute_sql(STATS_INDEX)
+        for trigger in stats_triggers():
+            db.execute_sql(trigger)
+        rebuild_catalog_stats(db)
+
+
+def create_catalog_generation(db) -> None:
+    """
+    Создает таблицу поколения каталога. Поколение начинается со случайного значения, поэтому результаты поиска в
+    кэше и снимок каталога, построенные до этой миграции или для другой базы данных с тем же путем, не совпадут с
+    ним по поколению и не будут использованы.
+    :param db: база данных
+    """
+    with db.atomic():
+        db.create_tables([md.CatalogGeneration])
+        if not md.CatalogGeneration.select().exists():
+            md.CatalogGeneration.create(value=random.randrange(1, 2**62))
+
+
+def create_file_books(db) -> None:
+    """
+    Создает таблицу связи файлов манифеста с книгами и триггер, который удаляет связи удаленной книги. Книги,
+    записанные раньше, связываются с файлами при следующем запуске digger с флагом --force.
+    :param db: база данных
+    """
+    with db.atomic():
+        db.create_tables([md.FileBook])
+        db.execute_sql(FILE_BOOKS_TRIGGER)
+
+
+# Миграции применяются по порядку номеров, каждая один раз. Миграции можно только добавлять в конец списка. Каждая
+# миграция безопасна для базы данных, созданной до появления таблицы schema_version, в которой часть таблиц и
+# индексов уже есть
+MIGRATIONS = [
+    (1, "Таблицы авторов и книг", create_catalog_tables),
+    (2, "Таблица manifest", create_manifest_table),
+    (3, "Полнотекстовый индекс books_fts", create_search_index),
+    (4, "Индексы NOCASE", create_nocase_indexes),
+    (5, "Уникальные индексы авторов и книг", create_unique_indexes),
+    (6, "Статистика каталога catalog_stats", create_catalog_stats),
+    (7, "Поколение каталога catalog_generation", create_catalog_generation),
+    (8, "Связь файлов с книгами manifest_books", create_file_books),
+]
+
+
+def applied_migrations(db) -> dict:
+    """
+    :param db: база данных
+    :return: словарь, где ключ - номер примененной миграции, а значение - время ее применения
+    """
+    with db.atomic():
+        db.create_tables([md.SchemaVersion])
+        return dict(md.SchemaVersion.select(md.SchemaVersion.version, md.SchemaVersion.applied_at).tuples())
+
+
+def upgrade(db) -> list:
+    """
+    Применяет миграции, которые еще не были применены. Каждая миграция выполняется в своих транзакциях, номер
+    миграции записывается после ее успешного завершения, поэтому прерванную миграцию можно запустить еще раз.
+    :param db: база данных
+    :return: номера примененных миграций
+    """
+    applied = applied_migrations(db)
+    upgraded = []
+    for version, description, step in MIGRATIONS:
+        if version in applied:
+            continue
+        click.echo(f"Применяется миграция {version}: {description}", err=True)
+        step(db)
+        with db.atomic():
+            md.SchemaVersion.create(version=version, description=description, applied_at=datetime.datetime.now())
+        upgraded.append(version)
+    return upgraded
+
+
+def show_status(db) -> None:
+    """
+    Выводит список миграций и время их применения.
+    :param db: база данных
+    """
+    from tabulate import tabulate
+
+    applied = applied_migrations(db)
+    table = []
+    for version, description, _ in MIGRATIONS:
+        applied_at = applied[version].strftime("%Y-%m-%d %H:%M:%S") if version in applied else "не применена"
+        table.append([version, description, applied_at])
+    print(tabulate(table, headers=["Версия", "Описание", "Применена"], tablefmt="github"))
+
+
+@click.command()
+@click.option(
+    "--status",
+    is_flag=True,
+    help="Если этот флаг есть, то будет выведен список миграций и время их применения",
+)
+@click.option(
+    "--upgrade",
+    "run_upgrade",
+    is_flag=True,
+    help="Применить миграции, которые еще не были применены. Выполняется, если не указан --status",
+)
+def migration(status, run_upgrade):
+    """
+    Функция для создания и обновления схемы базы данных. Применяются только миграции, которые еще не были применены,
+    поэтому команду можно запускать повторно, а обновление схемы не требует повторного заполнения базы данных.
+    Директория базы данных создается, если ее еще нет.
+    """
+    os.makedirs(os.path.dirname(md.db.database), exist_ok=True)
+    with md.db.connection_context():
+        if status and not run_upgrade:
+            show_status(md.db)
+            return
+
+        upgraded = upgrade(md.db)
+        if upgraded:
+            print(f"Применены миграции: {', '.join(map(str, upgraded))}")
+        else:
+            print("Схема базы данных уже актуальна")
+
+
 if __name__ == "__main__":
     migration()
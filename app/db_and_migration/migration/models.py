@@ -1,4 +1,5 @@
 import peewee as pw
+from playhouse.sqlite_ext import FTS5Model, SearchField
 
 from connection import connection
 
@@ -68,3 +69,144 @@ class Book(BaseModel):
 
     class Meta:
         db_table = "books"
+
+
+class FileManifest(BaseModel):
+    """
+    Модель манифеста файлов. Наследуется от базовой модели.
+    Описывает таблицу уже обработанных файлов с книгами, по которой digger определяет, какие файлы не изменились с
+    прошлого запуска и могут быть пропущены.
+    Путь до файла уникален.
+
+    path: абсолютный путь до файла, строка
+    size: размер файла в байтах, integer
+    mtime: время последнего изменения файла в наносекундах, integer
+    fingerprint: отпечаток содержимого файла, строка
+
+    class Meta:
+        db_table: название таблицы, которе будет использоваться в бд
+    """
+
+    path = pw.CharField(unique=True)
+    size = pw.BigIntegerField()
+    mtime = pw.BigIntegerField()
+    fingerprint = pw.CharField()
+
+    class Meta:
+        db_table = "manifest"
+
+
+class FileBook(BaseModel):
+    """
+    Модель связи файлов манифеста с книгами. Наследуется от базовой модели.
+    Описывает таблицу, в которой для каждой книги указаны файлы, из которых она была прочитана, чтобы при удалении
+    файла из директории можно было удалить книги, которых нет в других файлах. Связь с удаленной книгой удаляется
+    триггером на таблице книг, который создает команда migration.
+    Сочетание пути и id книги уникально, id книги проиндексирован.
+
+    path: абсолютный путь до файла, строка
+    book_id: id книги, integer
+
+    class Meta:
+        db_table: название таблицы, которе будет использоваться в бд
+        indexes: уникальный индекс пути и id книги
+    """
+
+    path = pw.CharField()
+    book_id = pw.IntegerField(index=True)
+
+    class Meta:
+        db_table = "manifest_books"
+        indexes = ((("path", "book_id"), True),)
+
+
+class SchemaVersion(BaseModel):
+    """
+    Модель версии схемы. Наследуется от базовой модели.
+    Описывает таблицу примененных миграций, по которой команда migration определяет, какие миграции еще нужно
+    применить.
+
+    version: номер миграции, integer
+    description: описание миграции, строка
+    applied_at: время применения миграции
+
+    class Meta:
+        db_table: название таблицы, которе будет использоваться в бд
+    """
+
+    version = pw.IntegerField(unique=True)
+    description = pw.CharField()
+    applied_at = pw.DateTimeField()
+
+    class Meta:
+        db_table = "schema_version"
+
+
+class CatalogStat(BaseModel):
+    """
+    Модель статистики каталога. Наследуется от базовой модели.
+    Описывает таблицу с количеством книг для каждого значения года, языка, автора и использованной программы. Таблица
+    поддерживается триггерами на таблице книг, которые создает команда migration, поэтому она меняется в той же
+    транзакции, что и книги.
+    Сочетание измерения и значения уникально, NULL считается отдельным значением.
+
+    dimension: измерение: year, language, author или program_used
+    value: год, язык, id автора или использованная программа, значение без типа
+    books: количество книг с этим значением, integer
+
+    class Meta:
+        db_table: название таблицы, которе будет использоваться в бд
+    """
+
+    dimension = pw.CharField()
+    value = pw.BareField(null=True)
+    books = pw.IntegerField()
+
+    class Meta:
+        db_table = "catalog_stats"
+
+
+class CatalogGeneration(BaseModel):
+    """
+    Модель поколения каталога. Наследуется от базовой модели.
+    Описывает таблицу из одной строки с номером поколения каталога, который увеличивается в каждой транзакции,
+    изменившей книги. По поколению seeker определяет, что закэшированные результаты поиска и снимок каталога
+    устарели. Поколение хранится в основной базе данных, поэтому меняется в одной транзакции с книгами.
+
+    value: номер поколения, integer
+
+    class Meta:
+        db_table: название таблицы, которе будет использоваться в бд
+    """
+
+    value = pw.BigIntegerField()
+
+    class Meta:
+        db_table = "catalog_generation"
+
+
+class BookIndex(FTS5Model):
+    """
+    Модель полнотекстового индекса книг. Описывает виртуальную таблицу FTS5, в которой для каждой книги хранятся
+    название, имя автора и язык. rowid записи совпадает с id книги. Таблица заполняется триггерами на таблице книг,
+    которые создает команда migration.
+    Для ускорения поиска по префиксу строятся префиксные индексы длиной 2 и 3 символа.
+
+    title: название книги
+    author: имя автора
+    language: язык книги
+
+    class Meta:
+        database: база данных, к которой осуществляется подключение
+        db_table: название таблицы, которе будет использоваться в бд
+        options: параметры виртуальной таблицы FTS5
+    """
+
+    title = SearchField()
+    author = SearchField()
+    language = SearchField()
+
+    class Meta:
+        database = db
+        db_table = "books_fts"
+        options = {"tokenize": "unicode61 remove_diacritics 2", "prefix": "2 3"}
@@ -10,6 +10,7 @@ setup(
             "digger=utilities.digger:digger",
             "seeker=utilities.seeker:seeker",
             "wiper=utilities.wiper:wiper",
+            "catalog=utilities.launcher:main",
             "migration=db_and_migration.migration.migration:migration",
         ],
     },
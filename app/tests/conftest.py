@@ -0,0 +1,21 @@
+import db_and_migration.migration.models as md
+import utilities.cache as c
+import pytest
+from db_and_migration.migration.migration import upgrade
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    Подключает основную базу данных и кэш к временным файлам и применяет миграции.
+    """
+    main_path = md.db.database
+    md.db.init(str(tmp_path / "main.db"))
+    c.cache_db.init(str(tmp_path / "main_cache.db"))
+    with c.cache_db:
+        c.cache_db.create_tables([c.CacheEntry, c.CacheCounter])
+    with md.db.connection_context():
+        upgrade(md.db)
+    yield md.db
+    md.db.init(main_path)
+    c.cache_db.init(None)
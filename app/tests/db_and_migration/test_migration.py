@@ -0,0 +1,68 @@
+import db_and_migration.migration.migration as m
+import db_and_migration.migration.models as md
+import pytest
+
+
+@pytest.fixture
+def database(tmp_path):
+    """
+    Подключает основную базу данных к временному файлу.
+    """
+    main_path = md.db.database
+    md.db.init(str(tmp_path / "main.db"))
+    with md.db.connection_context():
+        yield md.db
+    md.db.init(main_path)
+
+
+def test_upgrade_applies_each_migration_once(database):
+    """
+    Повторный запуск не применяет уже примененные миграции.
+    """
+    assert m.upgrade(database) == [version for version, _, _ in m.MIGRATIONS]
+    assert m.upgrade(database) == []
+    assert set(m.applied_migrations(database)) == {version for version, _, _ in m.MIGRATIONS}
+    assert md.CatalogGeneration.select().count() == 1
+
+
+def test_backfill_search_index_in_chunks(database):
+    """
+    Книги, добавленные до создания полнотекстового индекса, попадают в него, в том числе при заполнении несколькими
+    частями и при повторном заполнении.
+    """
+    m.create_catalog_tables(database)
+    author = md.Author.create(name="Саймон Грин")
+    for number in range(5):
+        md.Book.create(author_id=author.id, title=f"Голубая луна {number}", language="ru")
+
+    m.create_search_index(database)
+    m.backfill_search_index(database, chunk_size=2)
+    query = md.BookIndex.select().where(md.BookIndex.match("грин"))
+    assert query.count() == 5
+
+
+def test_catalog_stats_follow_books(database):
+    """
+    Триггеры поддерживают статистику каталога при добавлении, изменении и удалении книг так же, как ее пересчет.
+    """
+    m.upgrade(database)
+    green = md.Author.create(name="Саймон Грин")
+    baker = md.Author.create(name="Александр Бакулин")
+    books = [
+        md.Book.create(author_id=green.id, title="Голубая луна", year=2019, language="ru", program_used="FB Tools"),
+        md.Book.create(author_id=green.id, title="Хейвен", year=2005, language="ru"),
+        md.Book.create(author_id=baker.id, title="Грань", language="en"),
+        md.Book.create(title="Без автора", year=2019),
+    ]
+    md.Book.update(year=None, language="en").where(md.Book.id == books[0].id).execute()
+    md.Book.update(author_id=baker.id).where(md.Book.id == books[1].id).execute()
+    books[2].delete_instance()
+
+    def stats() -> set:
+        query = md.CatalogStat.select(md.CatalogStat.dimension, md.CatalogStat.value, md.CatalogStat.books)
+        return set(query.where(md.CatalogStat.books > 0).tuples())
+
+    maintained = stats()
+    assert ("year", None, 1) in maintained and ("author", baker.id, 1) in maintained
+    m.rebuild_catalog_stats(database)
+    assert stats() == maintained
@@ -0,0 +1,47 @@
+import os
+
+import connection as c
+
+
+def test_database_path_is_relative_to_config(tmp_path, monkeypatch):
+    """
+    Относительный путь до базы данных считается от директории файла конфигурации, а не от текущей директории.
+    """
+    monkeypatch.delenv("LAB_TASK_DB", raising=False)
+    config_path = tmp_path / "config.ini"
+    config_path.write_text('[sqliteDB]\ndb = "data/main.db"\n', encoding="utf-8")
+    config = c.read_config(str(config_path))
+    assert c.database_path(config, str(config_path)) == os.path.join(str(tmp_path), "data/main.db")
+
+
+def test_database_path_from_environment(tmp_path, monkeypatch):
+    """
+    Переменная окружения LAB_TASK_DB имеет приоритет над файлом конфигурации.
+    """
+    monkeypatch.setenv("LAB_TASK_DB", "/var/books/main.db")
+    config = c.read_config(str(tmp_path / "missing.ini"))
+    assert c.database_path(config, str(tmp_path / "missing.ini")) == "/var/books/main.db"
+
+
+def test_bulk_profile_extends_default(tmp_path):
+    """
+    Профиль массовой загрузки дополняет профиль по умолчанию.
+    """
+    config_path = tmp_path / "config.ini"
+    config_path.write_text(
+        "[pragmas]\njournal_mode = wal\nsynchronous = normal\n[bulk_pragmas]\nsynchronous = off\n",
+        encoding="utf-8",
+    )
+    profiles = c.make_profiles(c.read_config(str(config_path)))
+    assert profiles["default"] == {"journal_mode": "wal", "synchronous": "normal"}
+    assert profiles["bulk"] == {"journal_mode": "wal", "synchronous": "off"}
+
+
+def test_config_keeps_database_path(monkeypatch):
+    """
+    Путь до базы данных из config.ini не изменился, поэтому существующая база данных продолжает использоваться.
+    """
+    monkeypatch.delenv("LAB_TASK_DB", raising=False)
+    config_path = os.path.join(c.APP_DIR, "config.ini")
+    path = c.database_path(c.read_config(config_path), config_path)
+    assert path == os.path.join(c.APP_DIR, "db_and_migration/database/main.db")
@@ -0,0 +1,110 @@
+import gzip
+import os
+import tarfile
+import zipfile
+
+import utilities.archives as ar
+import pytest
+
+BOOK = "<description><author><first-name>Саймон</first-name></author><book-title>Книга {number}</book-title>" \
+       "</description><body>" + "текст " * 5000 + "</body>"
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """
+    Архив с книгами, сжатыми разными методами, и файлом, не являющимся книгой.
+    """
+    path = tmp_path / "books.fb2.zip"
+    with zipfile.ZipFile(path, "w") as zp:
+        zp.writestr("notes.txt", "<book-title>Не книга</book-title>")
+        for number in range(3):
+            compress_type = zipfile.ZIP_DEFLATED if number % 2 else zipfile.ZIP_STORED
+            zp.writestr(f"dir/{number}.fb2", BOOK.format(number=number), compress_type=compress_type)
+    return str(path)
+
+
+def test_zip_book_members_sorted_by_offset(archive):
+    """
+    Возвращаются только книги fb2 в порядке их расположения в архиве.
+    """
+    members = ar.zip_book_members(archive)
+    assert [info.filename for info in members] == ["dir/0.fb2", "dir/1.fb2", "dir/2.fb2"]
+    assert [info.header_offset for info in members] == sorted(info.header_offset for info in members)
+
+
+def test_scan_zip_members(archive):
+    """
+    Книги читаются без повторного чтения центрального каталога, испорченная книга попадает в список ошибок.
+    """
+    members = ar.zip_book_members(archive)
+    members[1].header_offset += 1
+
+    info_lists, errors = ar.scan_zip_members(archive, members)
+    assert [info_list[1] for info_list in info_lists] == ["Книга 0", "Книга 2"]
+    assert errors == [(f"{archive}:dir/1.fb2", "BadZipFile: неверный локальный заголовок книги dir/1.fb2")]
+
+
+@pytest.mark.parametrize(
+    ["members", "chunk_size", "expected_result"],
+    [
+        ([1, 2, 3], 2, [[1, 2], [3]]),
+        ([], 2, [[]])
+    ]
+)
+def test_split_members(members, chunk_size, expected_result):
+    """
+    :param members: описания книг
+    :param chunk_size: максимальное количество книг в части
+    :param expected_result: список частей
+    """
+    assert ar.split_members(members, chunk_size) == expected_result
+
+
+@pytest.mark.parametrize("mode", ["w", "w:gz", "w:xz"])
+def test_scan_tar(tmp_path, archive, mode):
+    """
+    Книги fb2, fb2.gz и fb2.zip читаются из архива tar без извлечения на диск, испорченная книга попадает в
+    список ошибок.
+    """
+    book = tmp_path / "book.fb2"
+    book.write_text(BOOK.format(number=10), encoding="utf8")
+    book_gz = tmp_path / "book.fb2.gz"
+    with gzip.open(book_gz, "wt", encoding="utf8") as file:
+        file.write(BOOK.format(number=11))
+    broken_gz = tmp_path / "broken.fb2.gz"
+    broken_gz.write_bytes(b"not a gzip")
+
+    path = tmp_path / "books.tar"
+    with tarfile.open(path, mode) as tar:
+        for name in [book, book_gz, broken_gz, archive]:
+            tar.add(name, arcname=f"lib/{os.path.basename(name)}")
+
+    info_lists, errors = ar.scan_tar(str(path))
+    assert [info_list[1] for info_list in info_lists] == ["Книга 10", "Книга 11", "Книга 0", "Книга 1", "Книга 2"]
+    assert [error[0] for error in errors] == [f"{path}:lib/broken.fb2.gz"]
+
+
+def test_iter_tar_keeps_books_before_broken_tail(tmp_path):
+    """
+    Книги возвращаются по мере чтения архива, а если архив обрывается, книги до места обрыва остаются, а обрыв
+    попадает в список ошибок.
+    """
+    path = tmp_path / "books.tar.gz"
+    with tarfile.open(path, "w:gz") as tar:
+        for number in range(20):
+            book = tmp_path / f"{number}.fb2"
+            book.write_text(BOOK.format(number=number), encoding="utf8")
+            tar.add(book, arcname=book.name)
+    data = path.read_bytes()
+    path.write_bytes(data[: len(data) // 2])
+
+    records = ar.iter_tar(str(path))
+    assert next(records) == (["Саймон", "Книга 0", None, None, None, None, None], None)
+
+    rest = list(records)
+    info_lists = [info_list for info_list, error in rest if error is None]
+    errors = [error for info_list, error in rest if error is not None]
+    assert 0 < len(info_lists) < 19
+    assert [info_list[1] for info_list in info_lists] == [f"Книга {number}" for number in range(1, len(info_lists) + 1)]
+    assert len(errors) == 1
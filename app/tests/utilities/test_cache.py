@@ -0,0 +1,80 @@
+import os
+
+import db_and_migration.migration.models as md
+import utilities.cache as c
+import utilities.writer as w
+
+
+def test_make_key_ignores_empty_filters_and_order():
+    """
+    Пустые условия поиска не влияют на ключ, порядок условий не важен.
+    """
+    first = c.make_key({"author": "Саймон Грин", "year": 2019, "query": None, "ignore_case": False})
+    second = c.make_key({"year": 2019, "author": "Саймон Грин"})
+    assert first == second
+    assert first != c.make_key({"author": "Саймон Грин", "year": 2019, "ignore_case": True})
+
+
+def test_lookup_returns_stored_rows(database):
+    """
+    Сохраненный результат возвращается до смены поколения каталога.
+    """
+    rows = [(1, "Саймон Грин", "Голубая луна", 2019, "ru", None, None, "1.0")]
+    key = c.make_key({"author": "Саймон Грин"})
+    assert c.lookup(key) is None
+
+    generation = c.current_generation()
+    list(c.caching(iter(rows), key, generation))
+    assert c.lookup(key) == rows
+    assert c.stats() == {"entries": 1, "hits": 1, "misses": 1, "generation": generation}
+
+    with md.db:
+        c.bump_generation()
+    assert c.lookup(key) is None
+    assert c.stats()["entries"] == 0
+
+
+def test_store_skips_results_of_old_generation(database):
+    """
+    Результат, во время получения которого каталог изменился, не сохраняется.
+    """
+    generation = c.current_generation()
+    with md.db:
+        c.bump_generation()
+    c.store("key", [(1,)], generation)
+    assert c.stats()["entries"] == 0
+
+
+def test_store_evicts_least_recently_used(database):
+    """
+    При переполнении кэша удаляется результат, к которому дольше всего не обращались.
+    """
+    generation = c.current_generation()
+    c.store("first", [(1,)], generation, max_entries=2)
+    c.store("second", [(2,)], generation, max_entries=2)
+    c.lookup("first")
+    c.store("third", [(3,)], generation, max_entries=2)
+    assert c.lookup("second") is None
+    assert c.lookup("first") == [(1,)]
+
+
+def test_generation_changes_with_books_in_main_database(database):
+    """
+    Поколение каталога меняется в транзакции записи книг и хранится в основной базе данных, поэтому удаление файла
+    кэша не возвращает устаревшие результаты, а запись без изменения книг не меняет поколение.
+    """
+    key = c.make_key({"author": "Саймон Грин"})
+    generation = c.current_generation()
+    c.store(key, [(1,)], generation)
+
+    c.cache_db.close()
+    os.remove(c.cache_db.database)
+    c.cache_db.init(None)
+    with w.BatchWriter(update=False) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None])
+    assert c.current_generation() == generation + 1
+    assert c.lookup(key) is None
+
+    with w.BatchWriter(update=False) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None])
+    assert c.current_generation() == generation + 1
@@ -0,0 +1,92 @@
+import io
+
+import click
+import db_and_migration.migration.models as md
+import utilities.catalog as ct
+import utilities.seeker as s
+import utilities.writer as w
+import pytest
+
+BOOKS = [
+    ["Саймон Грин", "Голубая луна", 2019, "ru", "FB Tools", None, "1.0"],
+    ["Саймон Грин", "Хейвен", 2005, "ru", None, "http://example.com", None],
+    ["Александр Бакулин", "Грань", None, "en", None, None, None],
+    [None, "Без автора", 2019, None, None, None, None],
+]
+
+
+@pytest.fixture
+def dump(database):
+    """
+    Заполняет временную базу данных книгами и возвращает их выгрузку частями по две строки.
+    """
+    with w.BatchWriter(update=False) as writer:
+        for info_list in BOOKS:
+            writer.add(info_list)
+    file = io.BytesIO()
+    assert ct.export_catalog(file, chunk_rows=2) == [2, 4]
+    yield file.getvalue()
+
+
+def search(**filters) -> list:
+    """
+    :param filters: условия поиска
+    :return: найденные книги
+    """
+    with md.db:
+        return list(s.build_query(**filters).tuples())
+
+
+def test_round_trip(dump):
+    """
+    После загрузки выгрузки каталог, индексы и полнотекстовый поиск совпадают с исходными.
+    """
+    books = search()
+    found = search(query="луна")
+    with md.db:
+        indexes = set(md.db.execute_sql("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')"))
+
+    with pytest.raises(click.ClickException):
+        ct.import_catalog(io.BytesIO(dump), replace=False)
+    assert ct.import_catalog(io.BytesIO(dump), replace=True) == [2, 4]
+
+    assert search() == books
+    assert search(query="луна") == found
+    with md.db:
+        assert set(md.db.execute_sql("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")) == indexes
+
+
+@pytest.mark.parametrize("damage", ["checksum", "truncated"])
+def test_damaged_dump(dump, damage):
+    """
+    Поврежденная или обрезанная выгрузка не загружается, и каталог не меняется.
+    :param damage: вид повреждения
+    """
+    books = search()
+    if damage == "checksum":
+        offset = ct.FILE_HEADER.size + ct.CHUNK_HEADER.size - 4
+        dump = dump[:offset] + bytes([dump[offset] ^ 1]) + dump[offset + 1 :]
+    else:
+        dump = dump[: len(dump) // 2]
+
+    with pytest.raises(click.ClickException, match="Выгрузка"):
+        ct.import_catalog(io.BytesIO(dump), replace=True)
+    assert search() == books
+
+
+def test_import_into_old_schema(dump):
+    """
+    Выгрузка не загружается в базу данных, к которой применены не все миграции, и каталог, индексы и триггеры не
+    меняются.
+    """
+    books = search()
+    with md.db:
+        md.db.execute_sql("DROP TABLE manifest_books")
+        md.SchemaVersion.delete().where(md.SchemaVersion.version == 8).execute()
+        objects = set(md.db.execute_sql("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')"))
+
+    with pytest.raises(click.ClickException, match="миграции \\[8\\]"):
+        ct.import_catalog(io.BytesIO(dump), replace=True)
+    assert search() == books
+    with md.db:
+        assert set(md.db.execute_sql("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")) == objects
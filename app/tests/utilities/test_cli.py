@@ -0,0 +1,35 @@
+import click
+from click.testing import CliRunner
+
+from utilities.cli import DefaultGroup
+
+
+@click.group(cls=DefaultGroup, default_command="ingest", directory_first=True)
+def group():
+    pass
+
+
+@group.command()
+@click.argument("dir_path")
+def ingest(dir_path):
+    click.echo(f"ingest {dir_path}")
+
+
+@group.command()
+@click.argument("dir_path")
+def extract(dir_path):
+    click.echo(f"extract {dir_path}")
+
+
+def test_default_group_prefers_existing_directory(tmp_path, monkeypatch):
+    """
+    Без названия команды вызывается команда по умолчанию, а существующая директория с названием команды передается
+    команде по умолчанию.
+    """
+    monkeypatch.chdir(tmp_path)
+    runner = CliRunner()
+    assert runner.invoke(group, ["books"]).output == "ingest books\n"
+    assert runner.invoke(group, ["extract", "books"]).output == "extract books\n"
+
+    (tmp_path / "extract").mkdir()
+    assert runner.invoke(group, ["extract"]).output == "ingest extract\n"
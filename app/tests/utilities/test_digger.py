@@ -1,5 +1,13 @@
+import multiprocessing as mp
+import os
+import tarfile
+import zipfile
+
 import pytest
 import utilities.digger as d
+import utilities.manifest as m
+import utilities.stats as st
+import utilities.writer as w
 
 
 @pytest.mark.parametrize(
@@ -82,5 +90,57 @@ def test_read_rows(path_to_book, expected_result):
     assert actual_result == expected_result
 
 
+def test_extract_fb2_zip_skips_other_members(tmp_path):
+    """
+    Файлы архива, не являющиеся книгами fb2, не должны давать записей.
+    """
+    path_to_book = tmp_path / "books.fb2.zip"
+    with zipfile.ZipFile(path_to_book, "w") as zp:
+        zp.writestr("book.fb2", "<author><first-name>Саймон</first-name></author><book-title>Книга</book-title>")
+        zp.writestr("readme.txt", "<book-title>Не книга</book-title>")
+
+    actual_result = d.extract_file(str(path_to_book))
+    assert actual_result == [["Саймон", "Книга", None, None, None, None, None]]
+
+
+def test_process_tar_yields_parts(tmp_path, monkeypatch):
+    """
+    Книги архива tar возвращаются частями, отпечаток передается только с последней частью.
+    """
+    monkeypatch.setattr(d, "ZIP_CHUNK_SIZE", 2)
+    path = tmp_path / "books.tar"
+    with tarfile.open(path, "w") as tar:
+        for number in range(5):
+            book = tmp_path / f"{number}.fb2"
+            book.write_text(f"<book-title>Книга {number}</book-title>", encoding="utf8")
+            tar.add(book, arcname=book.name)
+
+    parts = list(d.process_tar(str(path), path.stat(), None))
+    assert [context[2] for context, _ in parts] == [(2, None), (4, None), (5, 5)]
+    assert [len(info_lists) for _, (_, info_lists, _) in parts] == [2, 2, 1]
+    assert [fingerprint is None for _, (fingerprint, _, _) in parts] == [True, True, False]
+
+
+def test_parse_files_updates_manifest(database, tmp_path):
+    """
+    Повторный вызов с тем же манифестом и пулом процессов, как при наблюдении за директорией, не читает книги,
+    обработанные в прошлый раз, даже если у файла изменилось только время изменения.
+    """
+    paths = [tmp_path / f"{number}.fb2" for number in range(2)]
+    for number, path in enumerate(paths):
+        path.write_text(f"<book-title>Книга {number}</book-title>", encoding="utf8")
+    manifest = m.Manifest({})
+
+    with mp.Pool(2) as pool, w.BatchWriter(update=False) as writer:
+        files = [(str(path), path.stat()) for path in paths]
+        assert d.parse_files(files, writer, manifest, False, 2, pool=pool) == []
+        assert sorted(manifest.entries) == [str(path) for path in paths]
 
+        os.utime(paths[0], ns=(0, 0))
+        stats = st.RunStats()
+        files = [(str(path), path.stat()) for path in paths]
+        assert d.parse_files(files, writer, manifest, False, 2, stats, pool) == []
 
+    assert stats.counts["files_skipped"] == 1
+    assert stats.counts["files_content_unchanged"] == 1
+    assert stats.counts["files_parsed"] == 0
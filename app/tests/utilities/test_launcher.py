@@ -0,0 +1,55 @@
+import subprocess
+import sys
+
+import db_and_migration.migration.models as md
+import utilities.launcher as ln
+import utilities.writer as w
+import pytest
+
+
+@pytest.mark.parametrize(
+    ["args", "expected_result"],
+    [
+        (["seek", "-a", "Автор"], [["seek", "-a", "Автор"]]),
+        (["dig", "books", "then", "seek", "-l", "1"], [["dig", "books"], ["seek", "-l", "1"]]),
+        (["seek", "then"], [["seek"], []]),
+    ],
+)
+def test_split_chain(args, expected_result):
+    """
+    :param args: аргументы командной строки
+    :param expected_result: аргументы каждой команды цепочки
+    """
+    assert ln.split_chain(args) == expected_result
+
+
+def test_help_does_not_import_commands():
+    """
+    Список команд выводится без импорта модулей команд и peewee.
+    """
+    code = (
+        "import sys; import utilities.launcher as ln; ln.main(['--help']); "
+        "print(sorted({'peewee', 'tabulate', 'utilities.seeker'} & set(sys.modules)))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert "seek" in result.stdout
+    assert result.stdout.rstrip().endswith("[]")
+
+
+def test_chain_runs_in_one_process(database, capsys):
+    """
+    Команды цепочки выполняются по очереди, каждая следующая начинает с основной базы данных, даже если предыдущая
+    работала с шардом.
+    """
+    with w.BatchWriter(update=False) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None])
+    main_path = md.db.database
+
+    ln.main(["seek", "-s", "-f", "csv", "then", "dig", "load", "--help", "then", "wipe", "-n", "1", "--dry-run"])
+    assert capsys.readouterr().out.splitlines()[:2] == ["id", "1"]
+
+    with pytest.raises(SystemExit):
+        ln.main(["seek", "--db-shard", "nope", "then", "seek"])
+    ln.main(["dig", "load", "--db-shard", "en", "/dev/null", "then", "seek", "-s", "-f", "csv"])
+    assert md.db.database == main_path
+    assert capsys.readouterr().out.splitlines()[-2:] == ["id", "1"]
@@ -0,0 +1,61 @@
+import os
+
+import db_and_migration.migration.models as md
+import utilities.manifest as m
+import utilities.writer as w
+
+
+def test_file_fingerprint_ignores_mtime(tmp_path):
+    """
+    Отпечаток зависит только от содержимого файла, а не от времени его изменения.
+    """
+    path = tmp_path / "book.fb2"
+    path.write_bytes("<book-title>Книга</book-title>".encode() * 10000)
+    size = path.stat().st_size
+    fingerprint = m.file_fingerprint(str(path), size)
+
+    os.utime(path, ns=(0, 0))
+    assert m.file_fingerprint(str(path), size) == fingerprint
+
+    path.write_bytes("<book-title>Другая книга</book-title>".encode() * 10000)
+    assert m.file_fingerprint(str(path), path.stat().st_size) != fingerprint
+
+
+def test_manifest_reports_removed_files(tmp_path):
+    """
+    Файлы из манифеста, не встреченные за запуск, считаются удаленными, только если лежали в той же директории.
+    """
+    path = tmp_path / "book.fb2"
+    path.write_text("<book-title>Книга</book-title>")
+    stat = path.stat()
+    manifest = m.Manifest(
+        {
+            str(path): (stat.st_size, stat.st_mtime_ns, "abc"),
+            str(tmp_path / "removed.fb2"): (1, 1, "def"),
+            "/other/book.fb2": (1, 1, "ghi"),
+        }
+    )
+
+    assert manifest.is_unchanged(str(path), stat)
+    assert manifest.known_fingerprint(str(path)) == "abc"
+    assert manifest.removed(str(tmp_path)) == [str(tmp_path / "removed.fb2")]
+
+
+def test_purge_removes_books_of_removed_files(database):
+    """
+    Книги удаленного файла удаляются вместе с записью манифеста, а книга, которая есть и в другом файле, остается.
+    """
+    with w.BatchWriter(update=False) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None], "/books/a.fb2")
+        writer.add(["Саймон Грин", "Хейвен", 2005, "ru", None, None, None], "/books/a.fb2")
+        writer.add(["Саймон Грин", "Хейвен", 2005, "ru", None, None, None], "/books/b.fb2")
+        writer.add(["Александр Бакулин", "Книга", 2001, "en", None, None, None], "/books/a.fb2")
+        writer.add_file("/books/a.fb2", 1, 1, "abc")
+        writer.add_file("/books/b.fb2", 1, 1, "def")
+
+    assert m.Manifest.purge(["/books/a.fb2"]) == 2
+    with md.db:
+        assert [book.title for book in md.Book.select()] == ["Хейвен"]
+        assert [author.name for author in md.Author.select()] == ["Саймон Грин"]
+        assert [entry.path for entry in md.FileManifest.select()] == ["/books/b.fb2"]
+        assert [(link.path, link.book_id) for link in md.FileBook.select()] == [("/books/b.fb2", 2)]
@@ -0,0 +1,87 @@
+import gzip
+
+import click
+import utilities.records as r
+import pytest
+
+
+@pytest.mark.parametrize(["value", "expected_result"], [("1/4", (1, 4)), ("4/4", (4, 4)), (None, None)])
+def test_parse_shard(value, expected_result):
+    """
+    :param value: номер части в формате K/N
+    :param expected_result: кортеж (K, N)
+    """
+    assert r.parse_shard(None, None, value) == expected_result
+
+
+@pytest.mark.parametrize("value", ["0/4", "5/4", "1", "a/b"])
+def test_parse_shard_rejects_bad_values(value):
+    """
+    :param value: неверный номер части
+    """
+    with pytest.raises(click.BadParameter):
+        r.parse_shard(None, None, value)
+
+
+def test_in_shard_assigns_each_file_to_one_shard():
+    """
+    Каждый файл попадает ровно в одну часть.
+    """
+    paths = [f"dir{number % 7}/book{number}.fb2" for number in range(100)]
+    for path in paths:
+        assert sum(r.in_shard(path, (number, 3)) for number in range(1, 4)) == 1
+    assert all(r.in_shard(path, None) for path in paths)
+
+
+def test_read_records_from_concatenated_gzip(tmp_path):
+    """
+    Сжатые файлы, объединенные в один, читаются целиком, неверные строки попадают в ошибки.
+    """
+    first = ["Саймон Грин", "Голубая луна", 2019, "ru", None, None, "1.0"]
+    second = [None, "Без автора", None, None, None, None, None]
+    paths = [tmp_path / "1.jsonl.gz", tmp_path / "2.jsonl.gz"]
+    for path, info_list in zip(paths, [first, second]):
+        with r.open_output(str(path), compress=False) as file:
+            file.write(r.info_to_record(info_list) + "\n")
+    joined = tmp_path / "all.jsonl.gz"
+    joined.write_bytes(b"".join(path.read_bytes() for path in paths) + gzip.compress(b'{"title": 1\n{"author": "A"}\n'))
+
+    errors = []
+    assert list(r.read_records(str(joined), errors)) == [first, second]
+    assert [line for line, _ in errors] == [f"{joined}:3"]
+
+
+def test_read_records_skips_bad_lines_and_broken_tail(tmp_path):
+    """
+    Строки с неверной кодировкой пропускаются, а если сжатый файл обрывается, записи до места обрыва остаются.
+    """
+    info_list = ["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None]
+    lines = [b"\xff\xfe\n"] + [(r.info_to_record(info_list) + "\n").encode("utf-8")] * 1000
+    data = gzip.compress(b"".join(lines))
+    path = tmp_path / "books.jsonl.gz"
+    path.write_bytes(data[: len(data) - 10])
+
+    errors = []
+    records = list(r.read_records(str(path), errors))
+    assert 0 < len(records) < 1000
+    assert all(record == info_list for record in records)
+    assert [line for line, _ in errors] == [f"{path}:1", f"{path}:{len(records) + 2}"]
+    assert "чтение файла прервано" in errors[1][1]
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        '{"title": ["Голубая", "луна"]}',
+        '{"title": "Голубая луна", "author": {"name": "Саймон Грин"}}',
+        '{"title": "Голубая луна", "language": 1}',
+        '{"title": "Голубая луна", "year": 4294967296}',
+        '{"title": "Голубая луна", "year": true}',
+    ],
+)
+def test_record_to_info_rejects_bad_fields(line):
+    """
+    :param line: запись с полем неверного типа или годом вне диапазона
+    """
+    with pytest.raises(ValueError):
+        r.record_to_info(line)
@@ -0,0 +1,67 @@
+import io
+
+import utilities.scanner as sc
+import pytest
+
+HEADER = """<?xml version="1.0" encoding="{encoding}"?>
+<FictionBook><description><title-info><author>
+      <first-name>Саймон</first-name>
+      <last-name>Грин</last-name>
+    </author><book-title>...Сказал он,
+    смеясь &amp; плача</book-title><lang>ru</lang></title-info>
+<document-info><author><first-name>Лол</first-name></author><program-used>FB Tools</program-used></document-info>
+<publish-info><year>2013 г.</year></publish-info></description>
+<body><title><book-title>Не описание</book-title></title></body></FictionBook>"""
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "windows-1251"])
+@pytest.mark.parametrize("chunk_size", [7, 8192])
+def test_scan_book(encoding, chunk_size):
+    """
+    :param encoding: кодировка книги, указанная в прологе XML
+    :param chunk_size: размер читаемого фрагмента в байтах
+    """
+    book = io.BytesIO(HEADER.format(encoding=encoding).encode(encoding))
+    actual_result = sc.scan_book(book, chunk_size)
+    assert actual_result == ["Саймон Грин", "...Сказал он, смеясь & плача", 2013, "ru", "FB Tools", None, None]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 8192])
+def test_read_header_stops_at_description_end(chunk_size):
+    """
+    :param chunk_size: размер читаемого фрагмента в байтах
+    """
+    book = io.BytesIO(b"<description>abc</description><body>text</body>")
+    assert sc.read_header(book, chunk_size) == b"<description>abc</description>"
+
+
+@pytest.mark.parametrize(
+    ["header", "expected_result"],
+    [
+        (b'<?xml version="1.0" encoding="windows-1251"?><a/>', "windows-1251"),
+        (b"\xef\xbb\xbf<?xml version='1.0' encoding='UTF-8'?>", "UTF-8"),
+        (b'<?xml version="1.0" encoding="unknown-encoding"?>', "utf8"),
+        (b"<FictionBook>", "utf8")
+    ]
+)
+def test_get_encoding(header, expected_result):
+    """
+    :param header: начало книги
+    :param expected_result: название кодировки
+    """
+    assert sc.get_encoding(header) == expected_result
+
+
+@pytest.mark.parametrize(
+    ["fields", "expected_result"],
+    [
+        ({"book-title": "Книга", "year": "нет"}, [None, "Книга", None, None, None, None, None]),
+        ({"author": {"last-name": "Грин"}}, [])
+    ]
+)
+def test_info_from_fields(fields, expected_result):
+    """
+    :param fields: словарь найденных тегов
+    :param expected_result: список с информацией о книге, если название книги не найдено, вернется пустой список
+    """
+    assert sc.info_from_fields(fields) == expected_result
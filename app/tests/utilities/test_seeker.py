@@ -1,4 +1,7 @@
+import db_and_migration.migration.models as md
 import utilities.seeker as s
+import utilities.wiper as wp
+import utilities.writer as w
 import pytest
 
 
@@ -17,3 +20,85 @@ def test_make_table(capsys, table, headers, expected_result):
     s.make_table(table, headers)
     actual_result = capsys.readouterr()
     assert actual_result.out == expected_result
+
+
+@pytest.mark.parametrize(
+    ["text", "expected_result"],
+    [
+        ("Грин", '"Грин"*'),
+        ("  сказал   он ", '"сказал"* "он"*'),
+        ('книга "1"', '"книга"* """1"""*')
+    ]
+)
+def test_make_match_expression(text, expected_result):
+    """
+    :param text: поисковый запрос
+    :param expected_result: выражение для MATCH
+    """
+    assert s.make_match_expression(text) == expected_result
+
+
+@pytest.mark.parametrize(
+    ["prefix", "expected_result"],
+    [
+        ("abc", "abd"),
+        ("Гри", "Грй"),
+        ("a\U0010ffff", "b"),
+        ("\U0010ffff", None)
+    ]
+)
+def test_prefix_upper_bound(prefix, expected_result):
+    """
+    :param prefix: префикс
+    :param expected_result: верхняя граница диапазона строк с этим префиксом
+    """
+    assert s.prefix_upper_bound(prefix) == expected_result
+
+
+def test_build_query_uses_ranges():
+    """
+    Поиск по префиксу и диапазону лет превращается в сравнения, для которых SQLite может использовать индексы.
+    """
+    sql, params = s.build_query(year_from=1990, year_to=2000, title_prefix="Гра", ignore_case=True).sql()
+    assert "LIKE" not in sql
+    assert '"title" COLLATE NOCASE >= ?' in sql
+    assert params == [1990, 2000, "Гра", "Грб"]
+
+
+ROWS = [(1, "Саймон Грин", "Книга, первая", 2013, None, None, None, None), (2, None, "Книга", None, "ru", None, None, "1.0")]
+
+
+@pytest.mark.parametrize(
+    ["identifier", "output_format", "expected_result"],
+    [
+        (False, "csv", 'id,author,title,year,language,program_used,src_url,version\n'
+                       '1,Саймон Грин,"Книга, первая",2013,,,,\n2,,Книга,,ru,,,1.0\n'),
+        (True, "tsv", "id\n1\n2\n"),
+        (True, "jsonl", '{"id": 1}\n{"id": 2}\n')
+    ]
+)
+def test_write_rows(capsys, identifier, output_format, expected_result):
+    """
+    :param identifier: флаг, если True, то выводятся только id книг
+    :param output_format: формат вывода
+    :param expected_result: вывод в stdout
+    """
+    s.write_rows(iter(ROWS), identifier, output_format)
+    assert capsys.readouterr().out == expected_result
+
+
+def test_stats_query(database):
+    """
+    Статистика каталога обновляется при записи и удалении книг и выводится по убыванию количества книг.
+    """
+    with w.BatchWriter(update=False) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None])
+        writer.add(["Саймон Грин", "Хейвен", 2005, "ru", None, None, None])
+        writer.add(["Alan Green", "Graphs", 2019, "en", None, None, None])
+    with md.db:
+        assert list(s.stats_query("author").tuples()) == [("Саймон Грин", 2), ("Alan Green", 1)]
+        assert list(s.stats_query("year", limit=1).tuples()) == [(2019, 2)]
+
+    wp.delete_books(filters={"language": "ru"})
+    with md.db:
+        assert list(s.stats_query("language").tuples()) == [("en", 1)]
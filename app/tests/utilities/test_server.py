@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+import db_and_migration.migration.models as md
+import utilities.server as sv
+import utilities.writer as w
+import pytest
+
+
+def test_parse_search_params():
+    """
+    Параметры запроса преобразуются в условия поиска, а количество книг ограничивается max_limit.
+    """
+    filters = sv.parse_search_params("author=%D0%93%D1%80%D0%B8%D0%BD&year=2019&ignore_case=true&limit=5000", 100)
+    assert filters == {"author": "Грин", "year": 2019, "ignore_case": True, "limit": 100}
+
+
+@pytest.mark.parametrize("query_string", ["year=abc", "color=red", "query=луна&after_id=3", "limit=-1", "limit=0"])
+def test_parse_search_params_rejects_bad_requests(query_string):
+    """
+    :param query_string: строка параметров с ошибкой
+    """
+    with pytest.raises(sv.RequestError) as error:
+        sv.parse_search_params(query_string, 100)
+    assert error.value.status == 400
+
+
+def test_latency_metrics():
+    """
+    Метрики считают запросы по кодам ответа и процентили времени ответа.
+    """
+    metrics = sv.LatencyMetrics()
+    for milliseconds in range(1, 101):
+        metrics.record(200, milliseconds / 1000)
+    metrics.record(404, 0.5)
+
+    summary = metrics.summary()
+    assert summary["requests"] == 101
+    assert summary["statuses"] == {"200": 100, "404": 1}
+    assert summary["latency_ms"]["p50"] == 51
+    assert summary["latency_ms"]["max"] == 500
+
+
+async def request(port: int, target: str, headers: str = "Host: localhost\r\n") -> tuple:
+    """
+    Отправляет запрос GET сервису и закрывает соединение.
+    :return: кортеж (строка статуса, тело ответа)
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {target} HTTP/1.1\r\n{headers}Connection: close\r\n\r\n".encode())
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return head.split(b"\r\n")[0].decode(), json.loads(body)
+
+
+def test_search_server(database):
+    """
+    Сервис находит книги в пуле потоков и учитывает запросы в метриках.
+    """
+    with w.BatchWriter(update=False) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None])
+        writer.add(["Александр Бакулин", "Книга", 2001, "en", None, None, None])
+
+    async def scenario():
+        server = sv.SearchServer(workers=2)
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            search = await request(port, "/search?year=2019")
+            missing = await request(port, "/unknown")
+            metrics = await request(port, "/metrics")
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+        return search, missing, metrics
+
+    search, missing, metrics = asyncio.run(scenario())
+    assert search[0] == "HTTP/1.1 200 OK"
+    assert [book["title"] for book in search[1]["books"]] == ["Голубая луна"]
+    assert missing[0] == "HTTP/1.1 404 Not Found"
+    assert metrics[1]["statuses"] == {"200": 1, "404": 1}
+
+
+def test_search_server_reports_database_errors(tmp_path):
+    """
+    Ошибка базы данных, например отсутствие таблиц в пустой базе данных, возвращается ответом с кодом 500 и
+    учитывается в метриках.
+    """
+    main_path = md.db.database
+    md.db.init(str(tmp_path / "empty.db"))
+
+    async def scenario():
+        server = sv.SearchServer(workers=1)
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            search = await request(port, "/search?year=2019")
+            metrics = await request(port, "/metrics")
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+        return search, metrics
+
+    try:
+        search, metrics = asyncio.run(scenario())
+    finally:
+        md.db.init(main_path)
+    assert search[0] == "HTTP/1.1 500 Internal Server Error"
+    assert "no such table" in search[1]["error"]
+    assert metrics[1]["statuses"] == {"500": 1}
+
+
+def test_search_server_rejects_oversized_requests():
+    """
+    Слишком длинная строка запроса или заголовка и слишком много заголовков возвращаются ответом с кодом 400, а не
+    обрывают соединение без ответа.
+    """
+
+    async def scenario():
+        server = sv.SearchServer(workers=1)
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            long_line = await request(port, "/health?" + "a" * 100_000)
+            long_header = await request(port, "/health", f"X-Long: {'a' * 100_000}\r\n")
+            many_headers = await request(port, "/health", "X-Header: 1\r\n" * (sv.MAX_HEADERS + 1))
+            metrics = await request(port, "/metrics")
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            server.close()
+        return long_line, long_header, many_headers, metrics
+
+    long_line, long_header, many_headers, metrics = asyncio.run(scenario())
+    assert long_line[0] == "HTTP/1.1 400 Bad Request"
+    assert long_header[0] == "HTTP/1.1 400 Bad Request"
+    assert many_headers[0] == "HTTP/1.1 400 Bad Request"
+    assert metrics[1]["statuses"] == {"400": 3}
@@ -0,0 +1,111 @@
+import os
+
+import click
+import peewee as pw
+
+import db_and_migration.migration.models as md
+import utilities.seeker as s
+import utilities.shards as sh
+import utilities.writer as w
+import pytest
+
+
+def fill_shard(name: str, books: list, rebuild: bool = False) -> None:
+    """
+    Записывает книги в шард и переключает модели обратно на основную базу данных.
+    :param name: название шарда
+    :param books: список списков с информацией о книгах
+    :param rebuild: флаг, если True, то шард строится заново
+    """
+    main_path = md.db.database
+    if rebuild:
+        with sh.rebuilding_shard(name):
+            with w.BatchWriter(update=False) as writer:
+                for info_list in books:
+                    writer.add(info_list)
+    else:
+        sh.use_shard(name, create=True)
+        with w.BatchWriter(update=False) as writer:
+            for info_list in books:
+                writer.add(info_list)
+    sh.switch_database(main_path)
+
+
+def test_rebuild_replaces_previous_version(database):
+    """
+    Перестроенный шард становится видимым после записи всех книг, предыдущая версия удаляется, а при ошибке
+    остается.
+    """
+    fill_shard("ru", [["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None]])
+    directory = sh.shards_dir(md.db.database)
+    assert sh.shard_versions(directory) == {"ru": [1]}
+
+    fill_shard("ru", [["Саймон Грин", "Хейвен", 2005, "ru", None, None, None]], rebuild=True)
+    assert sh.shard_versions(directory) == {"ru": [2]}
+    assert not os.path.exists(sh.shard_file(directory, "ru", 1))
+
+    main_path = md.db.database
+    with pytest.raises(RuntimeError):
+        with sh.rebuilding_shard("ru"):
+            raise RuntimeError
+    assert md.db.database == main_path
+    assert sorted(os.listdir(directory)) == ["ru.2.db"]
+
+    sh.use_shard("ru")
+    with md.db:
+        assert [row[2] for row in s.build_query().tuples()] == ["Хейвен"]
+    sh.switch_database(main_path)
+
+
+def test_search_shards_merges_results(database):
+    """
+    Результаты шардов объединяются в порядке id, книги с одинаковыми id различаются названием шарда.
+    """
+    fill_shard("en", [["Alan Green", f"Graphs {number}", 1999, "en", None, None, None] for number in range(3)])
+    fill_shard("ru", [["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None]])
+    shards = sh.select_shards((), all_shards=True)
+
+    rows = list(s.search_shards(shards, {}))
+    assert [(row[0], row[1]) for row in rows] == [("en", 1), ("ru", 1), ("en", 2), ("en", 3)]
+    assert len(list(s.search_shards(shards, {"limit": 2}))) == 2
+    assert [row[0] for row in s.search_shards(shards, {"query": "луна"})] == ["ru"]
+
+
+def test_search_shards_interleaves_ranked_results(database):
+    """
+    При полнотекстовом поиске результаты шардов чередуются по месту книги в своем шарде, так как оценки bm25 разных
+    шардов несравнимы.
+    """
+    fill_shard("en", [["Alan Green", f"Moon {number}", 1999, "en", None, None, None] for number in range(3)])
+    fill_shard("ru", [["Саймон Грин", f"Moon луна {number}", 2019, "ru", None, None, None] for number in range(2)])
+    shards = sh.select_shards((), all_shards=True)
+
+    rows = list(s.search_shards(shards, {"query": "moon"}))
+    assert [row[0] for row in rows] == ["en", "ru", "en", "ru", "en"]
+
+
+def test_rebuild_blocks_writes_to_shard(database):
+    """
+    Пока шард перестраивается, запись в него и вторая перестройка отклоняются, а если предыдущая версия все же
+    изменилась, новая версия не заменяет ее.
+    """
+    fill_shard("ru", [["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None]])
+    main_path = md.db.database
+    directory = sh.shards_dir(main_path)
+
+    with pytest.raises(click.ClickException, match="изменился во время перестройки"):
+        with sh.rebuilding_shard("ru") as building:
+            # другие процессы digger и wiper подключены к основной базе данных
+            sh.switch_database(main_path)
+            with pytest.raises(click.ClickException, match="перестраивается"):
+                sh.use_shard("ru")
+            with pytest.raises(click.ClickException, match="уже перестраивается"):
+                with sh.rebuilding_shard("ru"):
+                    pass
+            with pw.SqliteDatabase(sh.shard_file(directory, "ru", 1)) as previous:
+                previous.execute_sql("UPDATE catalog_generation SET value = value + 1")
+            sh.switch_database(building)
+
+    assert md.db.database == main_path
+    assert sorted(os.listdir(directory)) == ["ru.1.db"]
+    fill_shard("ru", [["Саймон Грин", "Хейвен", 2005, "ru", None, None, None]])
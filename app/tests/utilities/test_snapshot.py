@@ -0,0 +1,106 @@
+import db_and_migration.migration.models as md
+import utilities.seeker as s
+import utilities.snapshot as sn
+import utilities.writer as w
+import pytest
+
+BOOKS = [
+    ["Саймон Грин", "Голубая луна", 2019, "ru", "FB Tools", None, "1.0"],
+    ["Саймон Грин", "Хейвен", 2005, "ru", None, "http://example.com", None],
+    ["Александр Бакулин", "Грань", None, "en", None, None, None],
+    [None, "Без автора", 2019, None, None, None, None],
+    ["Alan Green", "Graphs", 1999, "en", None, None, "2.0"],
+]
+
+
+@pytest.fixture
+def catalog(database):
+    """
+    Заполняет временную базу данных книгами.
+    """
+    with w.BatchWriter(update=False) as writer:
+        for info_list in BOOKS:
+            writer.add(info_list)
+    yield database
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"author": "Саймон Грин"},
+        {"author": "Нет такого"},
+        {"book_name": "Грань"},
+        {"year": 2019},
+        {"year_from": 2000},
+        {"year_to": 2010},
+        {"title_prefix": "Гр"},
+        {"author_prefix": "Са", "year": 2005},
+        {"title_prefix": "G", "language": "en"},
+        {"src_url": "http://example.com"},
+        {"after_id": 2, "limit": 2},
+        {"limit": 1},
+    ],
+)
+def test_search_matches_sql(catalog, filters):
+    """
+    Поиск по снимку находит те же книги в том же порядке, что и запрос к базе данных.
+    :param filters: условия поиска
+    """
+    sn.build_snapshot()
+    with md.db:
+        expected = list(s.build_query(**filters).tuples())
+    assert list(sn.open_snapshot().search(filters)) == expected
+
+
+def test_fresh_snapshot(catalog):
+    """
+    Снимок используется, пока каталог не изменился, и не используется для полнотекстового поиска.
+    """
+    assert sn.fresh_snapshot({}) is None
+
+    sn.build_snapshot()
+    assert sn.fresh_snapshot({"author": "Саймон Грин"}) is not None
+    assert sn.fresh_snapshot({"query": "луна"}) is None
+    assert sn.fresh_snapshot({"author": "alan green", "ignore_case": True}) is None
+
+    with w.BatchWriter(update=False) as writer:
+        writer.add(["Саймон Грин", "Темная сторона", 2003, "ru", None, None, None])
+    assert sn.fresh_snapshot({}) is None
+
+
+def test_refresh_snapshot(catalog):
+    """
+    После добавления книг снимок дополняется новыми книгами, после обновления книг строится заново.
+    """
+    assert sn.refresh_snapshot(0, update=False) is None
+    sn.build_snapshot()
+
+    start_generation = sn.cache.current_generation()
+    with w.BatchWriter(update=False) as writer:
+        writer.add(["Саймон Грин", "Темная сторона", 2003, "ru", None, None, None])
+    assert sn.refresh_snapshot(start_generation, update=False) == "incremental"
+    assert sn.refresh_snapshot(start_generation, update=False) is None
+
+    start_generation = sn.cache.current_generation()
+    with w.BatchWriter(update=True) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "en", "FB Tools", None, "1.0"])
+    assert sn.refresh_snapshot(start_generation, update=True) == "full"
+
+    snapshot = sn.fresh_snapshot({})
+    with md.db:
+        assert list(snapshot.search({})) == list(s.build_query().tuples())
+
+
+def test_snapshot_keeps_large_years(database):
+    """
+    Год вне 32-битного диапазона, который может записать digger load, сохраняется в снимке без ошибки.
+    """
+    with w.BatchWriter(update=False) as writer:
+        writer.add(["Саймон Грин", "Далекое будущее", 2**40, "ru", None, None, None])
+        writer.add(["Саймон Грин", "Далекое прошлое", -(2**40), "ru", None, None, None])
+
+    sn.build_snapshot()
+    snapshot = sn.open_snapshot()
+    assert [row[3] for row in snapshot.search({})] == [2**40, -(2**40)]
+    assert [row[2] for row in snapshot.search({"year_from": 2**35})] == ["Далекое будущее"]
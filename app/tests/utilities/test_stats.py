@@ -0,0 +1,80 @@
+import io
+
+import utilities.scanner as scanner
+import utilities.stats as st
+import pytest
+
+
+@pytest.mark.parametrize(
+    ["path", "expected_result"],
+    [
+        ("/books/book.fb2", "fb2"),
+        ("/books/book.fb2.zip", "zip"),
+        ("/books/book.fb2.gz", "gz"),
+        ("/books/books.tar.gz", "tar"),
+        ("/books/books.tgz", "tar"),
+    ],
+)
+def test_file_format(path, expected_result):
+    """
+    :param path: путь до файла
+    :param expected_result: формат файла
+    """
+    assert st.file_format(path) == expected_result
+
+
+def test_null_stats_records_nothing():
+    """
+    Пустая статистика возвращает итерируемый объект без обертки и один и тот же контекстный менеджер.
+    """
+    items = [1, 2]
+    assert st.NULL_STATS.iterate("walk", items) is items
+    assert st.NULL_STATS.stage("write") is st.NULL_STATS.stage("parse")
+
+
+def test_nested_stages_are_exclusive():
+    """
+    Время вложенного этапа не входит во время внешнего этапа.
+    """
+    stats = st.RunStats()
+    with stats.stage("parse"):
+        assert list(stats.iterate("walk", [1, 2])) == [1, 2]
+
+    assert stats.stages["walk"][2] == 3
+    assert stats.stages["parse"][2] == 1
+    assert stats.stages["parse"][0] >= 0
+
+
+def test_add_task_joins_archive_parts():
+    """
+    Задачи одного архива складываются в один файл, в списке самых долгих файлов остаются slowest_size файлов.
+    """
+    stats = st.RunStats(slowest_size=1)
+    stats.add_task("/books/a.fb2.zip", 100, 0.5, 0.4, 64, last=False)
+    stats.add_task("/books/a.fb2.zip", 100, 0.25, 0.2, 10, last=True)
+    stats.add_task("/books/b.fb2", 10, 0.1, 0.1, 1, last=True)
+
+    summary = stats.summary()
+    assert summary["formats"]["zip"]["files"] == 1
+    assert summary["formats"]["zip"]["books"] == 74
+    assert summary["formats"]["zip"]["wall_seconds"] == 0.75
+    assert summary["slowest"] == [{"path": "/books/a.fb2.zip", "format": "zip", "wall_seconds": 0.75}]
+
+
+def test_timed_call_separates_scan_time():
+    """
+    Время поиска информации в описаниях книг и прочитанные байты замеряются отдельно, время входит во время задачи,
+    после задачи замер отключается.
+    """
+    book = io.BytesIO("<description><book-title>Книга</book-title></description>".encode("utf8"))
+    result, wall, cpu, scan = st.timed_call(scanner.scan_book, (book,))
+    assert result[1] == "Книга"
+    assert 0 < scan[0] <= wall
+    assert scan[2] == len(book.getvalue())
+    assert scanner.scan_totals is None
+
+    stats = st.RunStats()
+    stats.add_task("/books/a.fb2", 10, wall, cpu, 1, last=True, scan=scan)
+    assert stats.task_stages["scan"][:1] == [scan[0]]
+    assert stats.task_stages["read"][0] == pytest.approx(wall - scan[0])
+    assert stats.summary()["formats"]["fb2"]["bytes_read"] == scan[2]
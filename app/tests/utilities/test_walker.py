@@ -0,0 +1,98 @@
+import os
+
+import utilities.walker as wk
+import pytest
+
+
+@pytest.fixture
+def library(tmp_path):
+    """
+    Библиотека с вложенными директориями:
+    a.fb2, notes.txt, sub/b.fb2.zip, sub/old/c.fb2.gz, sub/old/deep/d.fb2
+    """
+    for rel_path in ["a.fb2", "notes.txt", "sub/b.fb2.zip", "sub/old/c.fb2.gz", "sub/old/deep/d.fb2"]:
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("")
+    return tmp_path
+
+
+def walk(root, **kwargs) -> list:
+    """
+    :return: отсортированные пути до книг относительно root
+    """
+    return sorted(os.path.relpath(path, root) for path, _ in wk.walk_books(str(root), **kwargs))
+
+
+@pytest.mark.parametrize(
+    ["kwargs", "expected_result"],
+    [
+        ({}, ["a.fb2", "sub/b.fb2.zip", "sub/old/c.fb2.gz", "sub/old/deep/d.fb2"]),
+        ({"max_depth": 0}, ["a.fb2"]),
+        ({"max_depth": 1}, ["a.fb2", "sub/b.fb2.zip"]),
+        ({"exclude": ["sub/old"]}, ["a.fb2", "sub/b.fb2.zip"]),
+        ({"exclude": ["*.zip", "*.gz"]}, ["a.fb2", "sub/old/deep/d.fb2"]),
+        ({"include": ["*.txt"]}, ["notes.txt"])
+    ]
+)
+def test_walk_books(library, kwargs, expected_result):
+    """
+    :param kwargs: параметры обхода
+    :param expected_result: пути до найденных книг относительно корня библиотеки
+    """
+    assert walk(library, **kwargs) == expected_result
+
+
+def test_walk_books_skips_symlinks(library, tmp_path_factory):
+    """
+    Символические ссылки обходятся только с флагом follow_symlinks, а циклы не приводят к бесконечному обходу.
+    """
+    outside = tmp_path_factory.mktemp("outside")
+    (outside / "e.fb2").write_text("")
+    os.symlink(outside, library / "link")
+    os.symlink(library, library / "sub" / "loop")
+
+    assert "link/e.fb2" not in walk(library)
+    assert walk(library, follow_symlinks=True).count("link/e.fb2") == 1
+
+
+def test_walk_books_streams_entries_and_skips_unreadable_files(library, monkeypatch):
+    """
+    Книги возвращаются по мере чтения директории, а ошибка stat для одного файла пропускает только этот файл.
+    """
+    original = os.scandir
+    read = []
+
+    class Entries:
+        def __init__(self, path):
+            self._entries = original(path)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self._entries.close()
+
+        def __iter__(self):
+            for entry in sorted(self._entries, key=lambda item: item.name):
+                read.append(entry.name)
+                if entry.name == "m.fb2":
+                    entry = BrokenEntry(entry)
+                yield entry
+
+    class BrokenEntry:
+        def __init__(self, entry):
+            self.name, self.path = entry.name, entry.path
+            self.is_symlink, self.is_dir, self.is_file = entry.is_symlink, entry.is_dir, entry.is_file
+
+        def stat(self, follow_symlinks=True):
+            raise PermissionError(13, "Permission denied")
+
+    (library / "m.fb2").write_text("")
+    (library / "z.fb2").write_text("")
+    monkeypatch.setattr(wk.os, "scandir", Entries)
+    books = wk.walk_books(str(library), max_depth=0)
+    assert os.path.basename(next(books)[0]) == "a.fb2"
+    assert read == ["a.fb2"]
+    assert [os.path.basename(path) for path, _ in books] == ["z.fb2"]
+    assert read == ["a.fb2", "m.fb2", "notes.txt", "sub", "z.fb2"]
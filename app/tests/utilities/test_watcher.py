@@ -0,0 +1,59 @@
+import os
+
+import utilities.watcher as wt
+
+
+def test_poll_waits_until_file_settles(tmp_path):
+    """
+    Файл передается на обработку, когда его размер и время изменения не меняются settle секунд, и только один раз.
+    """
+    book = tmp_path / "book.fb2"
+    book.write_bytes(b"<FictionBook>")
+    watcher = wt.TreeWatcher(str(tmp_path), settle=2)
+
+    assert watcher.poll(now=0) == []
+    book.write_bytes(b"<FictionBook><body>")
+    assert watcher.poll(now=1) == []
+    assert watcher.poll(now=2) == []
+    assert [path for path, _ in watcher.poll(now=3)] == [str(book)]
+    assert watcher.poll(now=10) == []
+
+
+def test_poll_finds_new_files_in_subdirectories(tmp_path):
+    """
+    Новые файлы находятся во вложенных директориях, файлы, которые уже обработаны, и файлы, не подходящие под
+    шаблоны, пропускаются.
+    """
+    (tmp_path / "old.fb2").write_bytes(b"old")
+    watcher = wt.TreeWatcher(str(tmp_path), settle=0)
+    assert watcher.poll(is_unchanged=lambda path, stat: True, now=0) == []
+
+    subdir = tmp_path / "new"
+    subdir.mkdir()
+    (subdir / "book.fb2.zip").write_bytes(b"zip")
+    (subdir / "notes.txt").write_bytes(b"text")
+    assert [path for path, _ in watcher.poll(now=1)] == [str(subdir / "book.fb2.zip")]
+
+
+def test_poll_skips_unchanged_directories(tmp_path, monkeypatch):
+    """
+    Директории, время изменения которых не поменялось, не перечитываются до полного обхода.
+    """
+    (tmp_path / "book.fb2").write_bytes(b"book")
+    past = os.stat(tmp_path).st_mtime_ns - 10 * wt.RECENT_CHANGE_NS
+    os.utime(tmp_path, ns=(past, past))
+    watcher = wt.TreeWatcher(str(tmp_path), settle=0)
+    watcher.poll(now=0)
+
+    scanned = []
+    original = wt.scan_directory
+
+    def scan_directory(dir_path, *args):
+        scanned.append(dir_path)
+        return original(dir_path, *args)
+
+    monkeypatch.setattr(wt, "scan_directory", scan_directory)
+    watcher.poll(now=1)
+    assert scanned == []
+    watcher.poll(now=1 + wt.FULL_RESCAN_INTERVAL)
+    assert scanned == [str(tmp_path)]
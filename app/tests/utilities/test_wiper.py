@@ -0,0 +1,98 @@
+import click
+
+import db_and_migration.migration.models as md
+import utilities.cache as c
+import utilities.wiper as wp
+import utilities.writer as w
+import pytest
+
+
+@pytest.mark.parametrize(
+    ["values", "expected_result"],
+    [
+        (["5"], ([5], [])),
+        (["1,2", "10-20"], ([1, 2], [(10, 20)])),
+        (["3,\n", " 7 - 9 "], ([3], [(7, 9)])),
+    ],
+)
+def test_parse_ids(values, expected_result):
+    """
+    :param values: значения параметра --number или строки файла с id
+    :param expected_result: кортеж (список id, список диапазонов)
+    """
+    assert wp.parse_ids(values) == expected_result
+
+
+def test_parse_ids_rejects_garbage():
+    """
+    Значение, которое не является id или диапазоном, вызывает ошибку параметра.
+    """
+    with pytest.raises(click.BadParameter):
+        wp.parse_ids(["1,книга"])
+
+
+@pytest.mark.parametrize(
+    ["ids", "ranges", "expected_result"],
+    [
+        ([5, 1, 5], [], [(1, 1), (5, 5)]),
+        ([5], [(1, 10)], [(1, 10)]),
+        ([11, 3], [(1, 4), (6, 10), (9, 2)], [(1, 4), (6, 11)]),
+    ],
+)
+def test_merge_ranges(ids, ranges, expected_result):
+    """
+    :param ids: список id книг
+    :param ranges: список диапазонов id
+    :param expected_result: непересекающиеся диапазоны
+    """
+    assert wp.merge_ranges(ids, ranges) == expected_result
+
+
+@pytest.fixture
+def books(database):
+    """
+    Заполняет базу данных книгами двух авторов: у Саймона Грина книги с id 1-3, у Александра Бакулина с id 4-5.
+    """
+    with w.BatchWriter(update=False) as writer:
+        for number in range(3):
+            writer.add(["Саймон Грин", f"Голубая луна {number}", 2019, "ru", None, None, None])
+        for number in range(2):
+            writer.add(["Александр Бакулин", f"Книга {number}", 2001, "en", None, None, None])
+    return database
+
+
+def remaining_books() -> list:
+    """
+    :return: id оставшихся книг
+    """
+    with md.db.connection_context():
+        return [book_id for book_id, in md.Book.select(md.Book.id).order_by(md.Book.id).tuples()]
+
+
+def test_delete_books_by_ids_and_ranges(books):
+    """
+    Книги из списка id и диапазонов удаляются, а автор без книг удаляется вместе с ними.
+    """
+    generation = c.current_generation()
+    assert wp.delete_books(ids=[1], ranges=[(4, 5)], chunk_size=1) == (3, 1)
+    assert remaining_books() == [2, 3]
+    assert c.current_generation() == generation + 3
+
+
+def test_delete_books_filters_narrow_ids(books):
+    """
+    Условия поиска сужают список id, а без id выбирают все подходящие книги.
+    """
+    assert wp.delete_books(ranges=[(1, 5)], filters={"language": "en"}) == (2, 1)
+    assert remaining_books() == [1, 2, 3]
+    assert wp.delete_books(filters={"author": "Саймон Грин"}, chunk_size=2) == (3, 1)
+    assert remaining_books() == []
+
+
+def test_count_books_matches_delete_books(books):
+    """
+    Книга, указанная и отдельно, и в диапазоне, учитывается в пробном запуске один раз, как и при удалении.
+    """
+    assert wp.count_books(ids=[2, 2], ranges=[(1, 3), (3, 4)]) == 4
+    assert wp.delete_books(ids=[2, 2], ranges=[(1, 3), (3, 4)]) == (4, 1)
+    assert remaining_books() == [5]
@@ -0,0 +1,73 @@
+import db_and_migration.migration.models as md
+import utilities.writer as w
+import pytest
+
+
+@pytest.mark.parametrize(
+    ["items", "size", "expected_result"],
+    [
+        ([1, 2, 3, 4, 5], 2, [[1, 2], [3, 4], [5]]),
+        ([1, 2], 5, [[1, 2]]),
+        ([], 3, [])
+    ]
+)
+def test_chunks(items, size, expected_result):
+    """
+    :param items: список
+    :param size: максимальный размер части
+    :param expected_result: список частей
+    """
+    actual_result = list(w.chunks(items, size))
+    assert actual_result == expected_result
+
+
+def test_author_cache_evicts_least_recently_used():
+    """
+    При переполнении кэша удаляется автор, к которому дольше всего не обращались.
+    """
+    cache = w.AuthorCache(maxsize=2)
+    cache.put("Саймон Грин", 1)
+    cache.put("Александр Бакулин", 2)
+    cache.get("Саймон Грин")
+    cache.put("Лол Кеков", 3)
+
+    assert cache.get("Саймон Грин") == 1
+    assert cache.get("Александр Бакулин") is None
+    assert cache.get("Лол Кеков") == 3
+    assert len(cache) == 2
+
+
+@pytest.mark.parametrize(["update", "expected_language"], [(False, "ru"), (True, "en")])
+def test_batch_writer_upsert(database, update, expected_language):
+    """
+    Повторная книга с тем же автором, названием и годом не создает дубликат, а ее информация обновляется только при
+    флаге update. Книги без автора и года тоже не дублируются.
+    """
+    with w.BatchWriter(update) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "ru", None, None, "1.0"])
+        writer.add([None, "Без автора", None, "ru", None, None, None])
+    with w.BatchWriter(update) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "en", None, None, "1.0"])
+        writer.add([None, "Без автора", None, "en", None, None, None])
+
+    with database:
+        assert md.Author.select().count() == 1
+        assert sorted(md.Book.select(md.Book.language).tuples()) == [(expected_language,), (expected_language,)]
+
+
+def test_batch_writer_rechecks_cached_authors(database):
+    """
+    Автор, удаленный другим процессом, добавляется заново, а авторы пачки, вытесненные из кэша, не теряются.
+    """
+    with w.BatchWriter(update=False, cache_size=1) as writer:
+        writer.add(["Саймон Грин", "Голубая луна", 2019, "ru", None, None, None])
+        writer.flush()
+        with database:
+            md.Book.delete().execute()
+            md.Author.delete().execute()
+        writer.add(["Саймон Грин", "Хейвен", 2005, "ru", None, None, None])
+        writer.add(["Александр Бакулин", "Книга", 2001, "en", None, None, None])
+
+    with database:
+        books = md.Book.select(md.Author.name, md.Book.title).join(md.Author).order_by(md.Book.title).tuples()
+        assert list(books) == [("Александр Бакулин", "Книга"), ("Саймон Грин", "Хейвен")]
@@ -0,0 +1,243 @@
+import gzip as gz
+import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import zipfile as zf
+import zlib
+
+from utilities.scanner import scan_book
+
+# Количество книг архива в одной задаче для пула процессов
+ZIP_CHUNK_SIZE = 64
+# Архивы zip внутри tar копируются во временный файл, так как для чтения zip нужен произвольный доступ. Архивы меньше
+# этого размера остаются в памяти
+NESTED_ZIP_MEMORY_SIZE = 16 * 1024 * 1024
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+# Ошибки, при которых книга пропускается и попадает в сводку ошибок
+READ_ERRORS = (OSError, EOFError, zlib.error, zf.BadZipFile, tarfile.TarError, NotImplementedError, struct.error)
+
+LOCAL_HEADER = struct.Struct("<4s22xHH")
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+
+def describe_error(error: Exception) -> str:
+    """
+    :param error: исключение
+    :return: короткое описание ошибки для сводки
+    """
+    message = getattr(error, "strerror", None) or str(error)
+    return f"{type(error).__name__}: {message}" if message else type(error).__name__
+
+
+def is_book_member(info: zf.ZipInfo) -> bool:
+    """
+    :param info: описание файла из центрального каталога архива
+    :return: True, если файл является книгой fb2
+    """
+    return not info.is_dir() and info.filename.lower().endswith(".fb2")
+
+
+def zip_book_members(archive) -> list:
+    """
+    Читает центральный каталог архива один раз и возвращает книги fb2, отсортированные по смещению в архиве, чтобы
+    читать архив последовательно.
+    :param archive: путь до архива или открытый в бинарном режиме архив
+    :return: список описаний книг из центрального каталога
+    """
+    with zf.ZipFile(archive) as zp:
+        members = [info for info in zp.infolist() if is_book_member(info)]
+    members.sort(key=lambda info: info.header_offset)
+    return members
+
+
+class ZipMemberReader:
+    """
+    Поток, распаковывающий одну книгу из уже открытого архива по описанию из центрального каталога. Сжатые данные
+    читаются и распаковываются по мере чтения, поэтому для поиска описания книги распаковывается только ее начало,
+    а центральный каталог повторно не читается.
+
+    file: открытый в бинарном режиме архив
+    info: описание книги из центрального каталога
+    """
+
+    def __init__(self, file, info: zf.ZipInfo):
+        if info.flag_bits & 0x1:
+            raise NotImplementedError(f"книга {info.filename} зашифрована")
+        if info.compress_type == zf.ZIP_DEFLATED:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        elif info.compress_type == zf.ZIP_STORED:
+            self._decompressor = None
+        else:
+            raise NotImplementedError(f"метод сжатия {info.compress_type} не поддерживается")
+
+        file.seek(info.header_offset)
+        signature, name_length, extra_length = LOCAL_HEADER.unpack(file.read(LOCAL_HEADER.size))
+        if signature != LOCAL_HEADER_SIGNATURE:
+            raise zf.BadZipFile(f"неверный локальный заголовок книги {info.filename}")
+        file.seek(name_length + extra_length, os.SEEK_CUR)
+
+        self._file = file
+        self._remaining = info.compress_size
+        self._buffer = b""
+
+    def read(self, size: int) -> bytes:
+        """
+        :param size: количество байт
+        :return: не больше size распакованных байт, пустая строка в конце книги
+        """
+        while len(self._buffer) < size and self._remaining:
+            data = self._file.read(min(size, self._remaining))
+            if not data:
+                raise EOFError("архив обрывается внутри книги")
+            self._remaining -= len(data)
+            if self._decompressor is not None:
+                data = self._decompressor.decompress(data)
+            self._buffer += data
+
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def scan_zip_members(path_to_archive: str, members: list) -> tuple:
+    """
+    Ищет информацию о книгах архива с помощью функции scan_book. Архив открывается один раз, книги читаются в
+    переданном порядке. Функция не обращается к базе данных, поэтому может выполняться в отдельном процессе.
+    :param path_to_archive: путь до архива
+    :param members: описания книг из центрального каталога, полученные функцией zip_book_members
+    :return: кортеж (список списков с информацией о книгах, список ошибок). Ошибка - кортеж (путь до книги в архиве,
+    описание ошибки)
+    """
+    with open(path_to_archive, "rb") as file:
+        return scan_zip_file(file, members, path_to_archive)
+
+
+def scan_zip_file(file, members: list, archive_name: str) -> tuple:
+    """
+    Ищет информацию о книгах уже открытого архива с помощью функции scan_book.
+    :param file: открытый в бинарном режиме архив
+    :param members: описания книг из центрального каталога, полученные функцией zip_book_members
+    :param archive_name: название архива для списка ошибок
+    :return: кортеж (список списков с информацией о книгах, список ошибок)
+    """
+    info_lists = []
+    errors = []
+    for info_list, error in iter_zip_file(file, members, archive_name):
+        if error is not None:
+            errors.append(error)
+        else:
+            info_lists.append(info_list)
+    return info_lists, errors
+
+
+def iter_zip_file(file, members: list, archive_name: str):
+    """
+    Ищет информацию о книгах уже открытого архива с помощью функции scan_book и возвращает ее по мере чтения книг.
+    :param file: открытый в бинарном режиме архив
+    :param members: описания книг из центрального каталога, полученные функцией zip_book_members
+    :param archive_name: название архива для списка ошибок
+    :return: генератор кортежей (список с информацией о книге, None) или (None, ошибка). Книги без информации
+    пропускаются
+    """
+    for info in members:
+        try:
+            info_list = scan_book(ZipMemberReader(file, info))
+        except READ_ERRORS as error:
+            yield None, (f"{archive_name}:{info.filename}", describe_error(error))
+            continue
+        if info_list:
+            yield info_list, None
+
+
+def split_members(members: list, chunk_size: int = ZIP_CHUNK_SIZE) -> list:
+    """
+    Делит книги архива на части для параллельной обработки.
+    :param members: описания книг
+    :param chunk_size: максимальное количество книг в части
+    :return: список частей, всегда содержит хотя бы одну часть
+    """
+    return [members[start : start + chunk_size] for start in range(0, len(members), chunk_size)] or [[]]
+
+
+def is_tar_path(path: str) -> bool:
+    """
+    :param path: путь до файла
+    :return: True, если файл является архивом tar, в том числе сжатым gzip, bzip2 или xz
+    """
+    return path.lower().endswith(TAR_EXTENSIONS)
+
+
+def scan_tar_member(tar: tarfile.TarFile, member: tarfile.TarInfo, archive_name: str):
+    """
+    Ищет информацию о книгах в одном файле архива tar. Поддерживаются книги fb2, fb2.gz и fb2.zip, остальные файлы
+    пропускаются. Архив zip копируется во временный файл, так как для чтения ему нужен произвольный доступ, небольшие
+    архивы остаются в памяти.
+    :param tar: архив tar, открытый в потоковом режиме
+    :param member: описание файла в архиве
+    :param archive_name: название архива tar для списка ошибок
+    :return: генератор кортежей (список с информацией о книге, None) или (None, ошибка) для книг внутри архива zip
+    """
+    name = member.name.lower()
+    if name.endswith(".fb2"):
+        info_list = scan_book(tar.extractfile(member))
+        if info_list:
+            yield info_list, None
+
+    elif name.endswith(".fb2.gz"):
+        with gz.GzipFile(fileobj=tar.extractfile(member)) as book:
+            info_list = scan_book(book)
+        if info_list:
+            yield info_list, None
+
+    elif name.endswith(".fb2.zip"):
+        with tempfile.SpooledTemporaryFile(NESTED_ZIP_MEMORY_SIZE) as data:
+            shutil.copyfileobj(tar.extractfile(member), data)
+            yield from iter_zip_file(data, zip_book_members(data), f"{archive_name}:{member.name}")
+
+
+def iter_tar(path_to_archive: str):
+    """
+    Проходит по архиву tar (в том числе сжатому gzip, bzip2 или xz) один раз последовательно и возвращает информацию о
+    книгах по мере чтения, поэтому ее можно записывать в базу данных, не дожидаясь конца архива. Файлы на диск не
+    извлекаются, а память не зависит от размера архива: из каждой книги читается только описание, остаток книги
+    пропускается. Ошибка чтения файла архива пропускает только этот файл, а если архив обрывается или поврежден
+    дальше, книги, прочитанные до этого места, остаются, а в ошибки добавляется место обрыва.
+    :param path_to_archive: путь до архива
+    :return: генератор кортежей (список с информацией о книге, None) или (None, ошибка). Ошибка - кортеж (путь до
+    книги в архиве, описание ошибки)
+    :raises READ_ERRORS: если архив не удалось открыть
+    """
+    with tarfile.open(path_to_archive, "r|*") as tar:
+        members = iter(tar)
+        while True:
+            try:
+                member = next(members, None)
+            except READ_ERRORS as error:
+                yield None, (path_to_archive, describe_error(error))
+                return
+            if member is None:
+                return
+            if not member.isfile():
+                continue
+            try:
+                yield from scan_tar_member(tar, member, path_to_archive)
+            except READ_ERRORS as error:
+                yield None, (f"{path_to_archive}:{member.name}", describe_error(error))
+
+
+def scan_tar(path_to_archive: str) -> tuple:
+    """
+    Собирает в списки все, что возвращает iter_tar. Для больших архивов нужно использовать iter_tar, чтобы память не
+    зависела от размера архива.
+    :param path_to_archive: путь до архива
+    :return: кортеж (список списков с информацией о книгах, список ошибок)
+    """
+    info_lists = []
+    errors = []
+    for info_list, error in iter_tar(path_to_archive):
+        if error is not None:
+            errors.append(error)
+        else:
+            info_lists.append(info_list)
+    return info_lists, errors
@@ -0,0 +1,218 @@
+import json
+import os
+import time
+
+import peewee as pw
+
+import db_and_migration.migration.models as md
+from connection import connection
+
+# Результаты, в которых больше книг, не кэшируются
+MAX_CACHED_ROWS = 10_000
+DEFAULT_CACHE_SIZE = 1000
+
+cache_db = pw.SqliteDatabase(None, pragmas={"journal_mode": "wal"}, timeout=5)
+
+
+def cache_path(database_path: str) -> str:
+    """
+    :param database_path: путь до основной базы данных
+    :return: путь до файла кэша, который лежит рядом с основной базой данных
+    """
+    root, _ = os.path.splitext(database_path)
+    return f"{root}_cache.db"
+
+
+class CacheModel(pw.Model):
+    """
+    Базовая модель таблиц кэша. Кэш хранится в отдельном файле, поэтому запись в кэш не блокирует основную базу
+    данных. Поколение каталога хранится в основной базе данных, поэтому удаление или замена файла кэша не может
+    вернуть устаревшие результаты.
+
+    class Meta:
+        database: база данных кэша
+    """
+
+    class Meta:
+        database = cache_db
+
+
+class CacheEntry(CacheModel):
+    """
+    Модель закэшированного результата поиска.
+
+    key: нормализованный набор условий поиска
+    generation: поколение каталога, для которого получен результат
+    payload: строки результата в формате JSON
+    last_used: время последнего обращения, по нему удаляются давно не использовавшиеся результаты
+
+    class Meta:
+        db_table: название таблицы, которе будет использоваться в бд
+    """
+
+    key = pw.TextField(primary_key=True)
+    generation = pw.IntegerField()
+    payload = pw.TextField()
+    last_used = pw.FloatField(index=True)
+
+    class Meta:
+        db_table = "entries"
+
+
+class CacheCounter(CacheModel):
+    """
+    Модель счетчиков кэша: попаданий и промахов.
+
+    name: название счетчика
+    value: значение счетчика
+
+    class Meta:
+        db_table: название таблицы, которе будет использоваться в бд
+    """
+
+    name = pw.CharField(primary_key=True)
+    value = pw.IntegerField(default=0)
+
+    class Meta:
+        db_table = "counters"
+
+
+def open_cache() -> None:
+    """
+    При первом вызове подключает базу данных кэша, лежащую рядом с основной базой данных, и создает ее таблицы,
+    если их еще нет.
+    """
+    if cache_db.database is None:
+        cache_db.init(cache_path(connection.database))
+        with cache_db:
+            cache_db.create_tables([CacheEntry, CacheCounter])
+
+
+def get_counter(name: str) -> int:
+    """
+    :param name: название счетчика
+    :return: значение счетчика или 0, если его еще нет
+    """
+    counter = CacheCounter.get_or_none(CacheCounter.name == name)
+    return counter.value if counter is not None else 0
+
+
+def increment_counter(name: str) -> None:
+    """
+    Увеличивает счетчик на единицу.
+    :param name: название счетчика
+    """
+    CacheCounter.insert(name=name, value=1).on_conflict(
+        conflict_target=[CacheCounter.name],
+        update={CacheCounter.value: CacheCounter.value + 1},
+    ).execute()
+
+
+def bump_generation() -> None:
+    """
+    Увеличивает поколение каталога в основной базе данных, из-за чего результаты поиска в кэше и снимок каталога
+    становятся недействительными. Вызывается внутри транзакции, изменившей книги, поэтому поколение меняется вместе
+    с книгами: если процесс завершится до фиксации транзакции, не изменятся ни книги, ни поколение.
+    """
+    md.CatalogGeneration.update(value=md.CatalogGeneration.value + 1).execute()
+
+
+def make_key(filters: dict) -> str:
+    """
+    Нормализует набор условий поиска: пустые условия отбрасываются, остальные сортируются по названию.
+    :param filters: условия поиска
+    :return: ключ кэша
+    """
+    return json.dumps(
+        {name: value for name, value in filters.items() if value is not None and value is not False},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+
+
+def lookup(key: str) -> list or None:
+    """
+    Ищет результат в кэше и учитывает попадание или промах. Основная база данных открывается и при попадании, но
+    только для чтения поколения каталога, одной строки таблицы catalog_generation: поколение меняется в одной
+    транзакции с книгами, поэтому копия поколения вне основной базы данных могла бы устареть.
+    :param key: ключ кэша
+    :return: список строк результата или None, если результата нет или он получен для старого поколения каталога
+    """
+    generation = current_generation()
+    open_cache()
+    with cache_db:
+        entry = CacheEntry.get_or_none((CacheEntry.key == key) & (CacheEntry.generation == generation))
+        if entry is None:
+            increment_counter("misses")
+            # результаты предыдущих поколений больше не будут использованы
+            CacheEntry.delete().where(CacheEntry.generation != generation).execute()
+            return None
+
+        increment_counter("hits")
+        CacheEntry.update(last_used=time.time()).where(CacheEntry.key == key).execute()
+    return [tuple(row) for row in json.loads(entry.payload)]
+
+
+def store(key: str, rows: list, generation: int, max_entries: int = DEFAULT_CACHE_SIZE) -> None:
+    """
+    Сохраняет результат в кэше и удаляет давно не использовавшиеся результаты, если их стало больше max_entries.
+    :param key: ключ кэша
+    :param rows: список строк результата
+    :param generation: поколение каталога, прочитанное до выполнения запроса. Если за время запроса каталог
+    изменился, результат не сохраняется
+    :param max_entries: максимальное количество результатов в кэше
+    """
+    if generation != current_generation():
+        return
+    open_cache()
+    with cache_db:
+        CacheEntry.replace(
+            key=key, generation=generation, payload=json.dumps(rows, ensure_ascii=False), last_used=time.time()
+        ).execute()
+        stale = CacheEntry.select(CacheEntry.key).order_by(CacheEntry.last_used.desc()).offset(max_entries)
+        CacheEntry.delete().where(CacheEntry.key.in_(stale)).execute()
+
+
+def current_generation() -> int:
+    """
+    :return: текущее поколение каталога из основной базы данных
+    """
+    with md.db:
+        return md.CatalogGeneration.select(md.CatalogGeneration.value).scalar()
+
+
+def caching(rows, key: str, generation: int, max_entries: int = DEFAULT_CACHE_SIZE):
+    """
+    Передает строки результата дальше по мере чтения и, если их не больше MAX_CACHED_ROWS, после последней строки
+    сохраняет результат в кэше. Вывод при этом не ждет окончания запроса.
+    :param rows: итерируемый объект со строками результата
+    :param key: ключ кэша
+    :param generation: поколение каталога, прочитанное до выполнения запроса
+    :param max_entries: максимальное количество результатов в кэше
+    :return: генератор строк результата
+    """
+    collected = []
+    for row in rows:
+        if collected is not None:
+            collected.append(row)
+            if len(collected) > MAX_CACHED_ROWS:
+                collected = None
+        yield row
+
+    if collected is not None:
+        store(key, collected, generation, max_entries)
+
+
+def stats() -> dict:
+    """
+    :return: словарь со статистикой кэша: количество результатов, попаданий, промахов и текущее поколение каталога
+    """
+    generation = current_generation()
+    open_cache()
+    with cache_db:
+        return {
+            "entries": CacheEntry.select().count(),
+            "hits": get_counter("hits"),
+            "misses": get_counter("misses"),
+            "generation": generation,
+        }
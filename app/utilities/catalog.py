@@ -0,0 +1,339 @@
+import struct
+import sys
+import zlib
+from array import array
+
+import click
+
+import db_and_migration.migration.models as md
+from connection import bulk_load
+from db_and_migration.migration.migration import (
+    MIGRATIONS,
+    applied_migrations,
+    backfill_search_index,
+    rebuild_catalog_stats,
+)
+from utilities.cache import bump_generation, current_generation
+from utilities.snapshot import refresh_snapshot
+
+MAGIC = b"LTCATLG1"
+# Заголовок файла: метка формата, номер последней примененной миграции базы данных, из которой сделана выгрузка
+FILE_HEADER = struct.Struct("<8sI")
+# Заголовок части: номер таблицы, количество строк, размер сжатых данных, CRC32 несжатых данных
+CHUNK_HEADER = struct.Struct("<BIII")
+# Последняя часть вместо номера таблицы содержит END_MARK, а в данных - количество строк каждой таблицы
+END_MARK = 255
+# Количество строк в одной части. Части читаются и записываются по одной, поэтому память не зависит от размера каталога
+CHUNK_ROWS = 50_000
+
+# Таблицы в порядке выгрузки и их столбцы с типами: int - целое число, text - строка, любой столбец может быть NULL
+TABLES = [
+    ("authors", [("id", "int"), ("name", "text")]),
+    (
+        "books",
+        [
+            ("id", "int"),
+            ("author_id", "int"),
+            ("title", "text"),
+            ("year", "int"),
+            ("language", "text"),
+            ("program_used", "text"),
+            ("src_url", "text"),
+            ("version", "text"),
+        ],
+    ),
+]
+
+
+def to_little_endian(values: array) -> bytes:
+    """
+    :param values: массив чисел
+    :return: байты массива в порядке little-endian, чтобы выгрузку можно было загрузить на любой машине
+    """
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def from_little_endian(typecode: str, data) -> array:
+    """
+    :param typecode: тип элементов массива
+    :param data: байты в порядке little-endian
+    :return: массив чисел
+    """
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def encode_column(kind: str, values: list) -> bytes:
+    """
+    Кодирует столбец. Целые числа хранятся массивом int64 и маской NULL по байту на строку, строки - массивом длин в
+    байтах, где -1 означает NULL, и подряд идущими строками в utf-8.
+    :param kind: тип столбца: int или text
+    :param values: значения столбца
+    :return: закодированный столбец
+    """
+    if kind == "int":
+        mask = bytes(value is None for value in values)
+        return mask + to_little_endian(array("q", (0 if value is None else value for value in values)))
+
+    encoded = [None if value is None else value.encode("utf-8") for value in values]
+    lengths = array("i", (-1 if value is None else len(value) for value in encoded))
+    return to_little_endian(lengths) + b"".join(value for value in encoded if value is not None)
+
+
+def decode_column(kind: str, data: bytes, offset: int, count: int) -> tuple:
+    """
+    :param kind: тип столбца: int или text
+    :param data: данные части
+    :param offset: смещение столбца в данных
+    :param count: количество строк
+    :return: кортеж (значения столбца, смещение следующего столбца)
+    """
+    if kind == "int":
+        mask = data[offset : offset + count]
+        offset += count
+        numbers = from_little_endian("q", data[offset : offset + 8 * count])
+        return [None if null else number for null, number in zip(mask, numbers)], offset + 8 * count
+
+    lengths = from_little_endian("i", data[offset : offset + 4 * count])
+    offset += 4 * count
+    values = []
+    for length in lengths:
+        if length < 0:
+            values.append(None)
+            continue
+        values.append(data[offset : offset + length].decode("utf-8"))
+        offset += length
+    return values, offset
+
+
+def write_chunk(file, table: int, rows: list) -> None:
+    """
+    Записывает строки таблицы одной сжатой частью.
+    :param file: файл, открытый для записи в двоичном режиме
+    :param table: номер таблицы в TABLES
+    :param rows: строки таблицы
+    """
+    columns = TABLES[table][1]
+    data = b"".join(encode_column(kind, [row[number] for row in rows]) for number, (_, kind) in enumerate(columns))
+    compressed = zlib.compress(data, 6)
+    file.write(CHUNK_HEADER.pack(table, len(rows), len(compressed), zlib.crc32(data)))
+    file.write(compressed)
+
+
+def read_exactly(file, size: int) -> bytes:
+    """
+    :param file: файл, открытый для чтения в двоичном режиме
+    :param size: количество байт
+    :return: прочитанные байты
+    :raises click.ClickException: если файл закончился раньше
+    """
+    data = file.read(size)
+    if len(data) != size:
+        raise click.ClickException("Выгрузка обрезана: файл закончился раньше последней части")
+    return data
+
+
+def read_chunks(file):
+    """
+    Читает части выгрузки по одной и проверяет их контрольные суммы и количество строк каждой таблицы.
+    :param file: файл, открытый для чтения в двоичном режиме, после заголовка
+    :return: генератор кортежей (номер таблицы, список строк)
+    :raises click.ClickException: если выгрузка повреждена или обрезана
+    """
+    counts = [0] * len(TABLES)
+    while True:
+        table, count, size, checksum = CHUNK_HEADER.unpack(read_exactly(file, CHUNK_HEADER.size))
+        try:
+            data = zlib.decompress(read_exactly(file, size))
+        except zlib.error as error:
+            raise click.ClickException(f"Выгрузка повреждена: {error}")
+        if zlib.crc32(data) != checksum:
+            raise click.ClickException("Выгрузка повреждена: не совпадает контрольная сумма части")
+
+        if table == END_MARK:
+            expected = list(struct.unpack(f"<{len(TABLES)}Q", data))
+            if expected != counts:
+                raise click.ClickException(f"Выгрузка повреждена: ожидалось строк {expected}, прочитано {counts}")
+            return
+        if table >= len(TABLES):
+            raise click.ClickException(f"Выгрузка повреждена: неизвестная таблица {table}")
+
+        columns = []
+        offset = 0
+        for _, kind in TABLES[table][1]:
+            values, offset = decode_column(kind, data, offset, count)
+            columns.append(values)
+        counts[table] += count
+        yield table, list(zip(*columns))
+
+
+def schema_version(db) -> int:
+    """
+    :param db: база данных
+    :return: номер последней примененной миграции или 0
+    """
+    return max(applied_migrations(db), default=0)
+
+
+def missing_migrations(db) -> list:
+    """
+    :param db: база данных
+    :return: номера миграций, которые еще не применены к базе данных
+    """
+    applied = applied_migrations(db)
+    return [version for version, _, _ in MIGRATIONS if version not in applied]
+
+
+def export_catalog(file, chunk_rows: int = CHUNK_ROWS) -> list:
+    """
+    Выгружает таблицы авторов и книг частями по chunk_rows строк в одной транзакции чтения, поэтому выгрузка
+    согласована, даже если digger в это время добавляет книги.
+    :param file: файл, открытый для записи в двоичном режиме
+    :param chunk_rows: количество строк в одной части
+    :return: количество выгруженных строк каждой таблицы
+    """
+    counts = []
+    with md.db:
+        file.write(FILE_HEADER.pack(MAGIC, schema_version(md.db)))
+        for table, (name, columns) in enumerate(TABLES):
+            fields = ", ".join(column for column, _ in columns)
+            cursor = md.db.execute_sql(f"SELECT {fields} FROM {name} ORDER BY id")
+            count = 0
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                write_chunk(file, table, rows)
+                count += len(rows)
+            counts.append(count)
+
+    data = struct.pack(f"<{len(TABLES)}Q", *counts)
+    compressed = zlib.compress(data)
+    file.write(CHUNK_HEADER.pack(END_MARK, 0, len(compressed), zlib.crc32(data)))
+    file.write(compressed)
+    return counts
+
+
+def drop_table_indexes(db) -> list:
+    """
+    Удаляет индексы и триггеры таблиц авторов и книг, кроме первичных ключей.
+    :param db: база данных
+    :return: список запросов, которые создают удаленные индексы и триггеры заново
+    """
+    objects = db.execute_sql(
+        """SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND tbl_name IN ('authors', 'books') AND sql IS NOT NULL"""
+    ).fetchall()
+    for kind, name, _ in objects:
+        db.execute_sql(f'DROP {kind.upper()} "{name}"')
+    # сначала создаются индексы, затем триггеры
+    return [sql for kind, _, sql in sorted(objects, key=lambda item: item[0] != "index")]
+
+
+def import_catalog(file, replace: bool) -> list:
+    """
+    Загружает выгрузку в одной транзакции с профилем массовой загрузки: индексы и триггеры таблиц удаляются, строки
+    вставляются без обновления индексов, после чего индексы создаются заново, а полнотекстовый индекс и статистика
+    каталога заполняются одним проходом. Если выгрузка повреждена, транзакция откатывается, и база данных не меняется.
+    Загрузка проверяет, что к базе данных применены все миграции, до того как что-либо изменить, так как заполнение
+    полнотекстового индекса, статистики каталога и связей файлов с книгами требует последней схемы.
+    :param file: файл, открытый для чтения в двоичном режиме
+    :param replace: флаг, если True, то имеющиеся книги, авторы и манифест удаляются, иначе таблицы должны быть пустыми
+    :return: количество загруженных строк каждой таблицы
+    :raises click.ClickException: если выгрузка повреждена, сделана из более новой схемы, схема базы данных устарела
+    или каталог не пустой
+    """
+    magic, version = FILE_HEADER.unpack(read_exactly(file, FILE_HEADER.size))
+    if magic != MAGIC:
+        raise click.ClickException("Файл не является выгрузкой каталога")
+
+    with md.db:
+        missing = missing_migrations(md.db)
+    if missing:
+        raise click.ClickException(
+            f"Схема базы данных устарела, не применены миграции {missing}, выполните команду migration"
+        )
+
+    start_generation = current_generation()
+    counts = [0] * len(TABLES)
+    with bulk_load(), md.db:
+        if version > schema_version(md.db):
+            raise click.ClickException(f"Выгрузка сделана из схемы версии {version}, выполните команду migration")
+        if not replace and md.Book.select().exists():
+            raise click.ClickException("Каталог не пустой, для замены каталога укажите --replace")
+
+        recreate = drop_table_indexes(md.db)
+        try:
+            for table in ["books", "authors", "books_fts", "manifest", "manifest_books"]:
+                md.db.execute_sql(f"DELETE FROM {table}")
+
+            cursor = md.db.cursor()
+            for table, rows in read_chunks(file):
+                name, columns = TABLES[table]
+                fields = ", ".join(column for column, _ in columns)
+                placeholders = ", ".join("?" * len(columns))
+                cursor.executemany(f"INSERT INTO {name} ({fields}) VALUES ({placeholders})", rows)
+                counts[table] += len(rows)
+                click.echo(f"{name}: {counts[table]}", err=True)
+        finally:
+            # индексы и триггеры создаются заново и при ошибке, чтобы база данных не осталась без них, даже если
+            # транзакция не будет откачена
+            for query in recreate:
+                md.db.execute_sql(query)
+        backfill_search_index(md.db)
+        rebuild_catalog_stats(md.db)
+        bump_generation()
+
+    refresh_snapshot(start_generation, update=True)
+    return counts
+
+
+@click.group()
+def catalog():
+    """
+    Команды для выгрузки каталога в файл и загрузки каталога из файла без повторного парсинга книг.
+    """
+
+
+@catalog.command("export")
+@click.argument("output", type=click.File("wb"))
+@click.option(
+    "--chunk-rows",
+    type=click.IntRange(min=1),
+    default=CHUNK_ROWS,
+    show_default=True,
+    help="Количество строк в одной сжатой части выгрузки",
+)
+def export_command(output, chunk_rows):
+    """
+    Выгружает авторов и книги в OUTPUT, - для stdout. Таблицы записываются по столбцам частями, каждая часть сжата
+    zlib и содержит контрольную сумму CRC32.
+    """
+    authors, books = export_catalog(output, chunk_rows)
+    click.echo(f"Выгружено авторов: {authors}, книг: {books}", err=True)
+
+
+@catalog.command("import")
+@click.argument("source", type=click.File("rb"))
+@click.option(
+    "--replace",
+    is_flag=True,
+    help="Если этот флаг указан, то имеющиеся книги, авторы и манифест заменяются содержимым выгрузки",
+)
+def import_command(source, replace):
+    """
+    Загружает авторов и книги из выгрузки SOURCE, - для stdin. Индексы создаются после загрузки строк, а если
+    выгрузка повреждена, база данных не меняется.
+    """
+    authors, books = import_catalog(source, replace)
+    print(f"Загружено авторов: {authors}, книг: {books}")
+
+
+if __name__ == "__main__":
+    catalog()
@@ -0,0 +1,63 @@
+import importlib
+import os
+
+import click
+
+
+class DefaultGroup(click.Group):
+    """
+    Группа команд, которая вызывает команду по умолчанию, если первый аргумент не является названием команды группы.
+    Поэтому команду по умолчанию можно вызывать как раньше, без ее названия, например "seeker -a Автор" вместо
+    "seeker search -a Автор".
+
+    default_command: название команды по умолчанию
+    directory_first: флаг, если True, то первый аргумент, который является существующей директорией, передается
+    команде по умолчанию, даже если совпадает с названием команды группы
+    """
+
+    def __init__(self, *args, default_command: str, directory_first: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+        self.directory_first = directory_first
+
+    def parse_args(self, ctx: click.Context, args: list) -> list:
+        if not args or self.is_default_argument(ctx, args[0]):
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+    def is_default_argument(self, ctx: click.Context, arg: str) -> bool:
+        """
+        :param ctx: контекст click
+        :param arg: первый аргумент
+        :return: True, если аргумент относится к команде по умолчанию, а не является названием команды группы
+        """
+        if arg in self.get_help_option_names(ctx):
+            return False
+        return arg not in self.commands or (self.directory_first and os.path.isdir(arg))
+
+
+class LazyGroup(click.Group):
+    """
+    Группа команд, которая импортирует модуль команды только при ее вызове. Список команд выводится по заранее
+    известным описаниям, поэтому "--help" группы не импортирует ни одной команды.
+
+    lazy_commands: словарь, где ключ - название команды, а значение - кортеж (путь до команды в формате
+    модуль:объект, краткое описание команды)
+    """
+
+    def __init__(self, *args, lazy_commands: dict, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands
+
+    def list_commands(self, ctx: click.Context) -> list:
+        return list(self.lazy_commands)
+
+    def get_command(self, ctx: click.Context, name: str) -> click.Command or None:
+        if name not in self.lazy_commands:
+            return None
+        module_name, attribute = self.lazy_commands[name][0].split(":")
+        return getattr(importlib.import_module(module_name), attribute)
+
+    def format_commands(self, ctx: click.Context, formatter: click.HelpFormatter) -> None:
+        with formatter.section("Commands"):
+            formatter.write_dl([(name, short_help) for name, (_, short_help) in self.lazy_commands.items()])
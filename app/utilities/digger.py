@@ -1,11 +1,43 @@
 import gzip as gz
+import inspect
+import multiprocessing as mp
 import os
-import zipfile as zf
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext, redirect_stdout
 
 import click
-import peewee as pw
 
 import db_and_migration.migration.models as md
+from connection import bulk_load
+from utilities.cache import current_generation
+from utilities.cli import DefaultGroup
+from utilities.archives import (
+    READ_ERRORS,
+    ZIP_CHUNK_SIZE,
+    describe_error,
+    is_tar_path,
+    iter_tar,
+    scan_tar,
+    scan_zip_members,
+    split_members,
+    zip_book_members,
+)
+from utilities.manifest import Manifest, file_fingerprint
+from utilities.records import in_shard, info_to_record, open_output, parse_shard, read_records
+from utilities.scanner import scan_book
+from utilities.shards import parse_shard_names, rebuilding_shard, use_shard
+from utilities.snapshot import refresh_snapshot
+from utilities.stats import NULL_STATS, RunStats, timed_call, timed_parts
+from utilities.walker import DEFAULT_INCLUDE, walk_books
+from utilities.watcher import TreeWatcher
+from utilities.writer import BatchWriter
+
+MAX_TASKS_PER_WORKER = 16
+# Максимальное количество книг и время в миллисекундах, после которых digger load записывает книги в базу данных
+LOAD_BATCH_SIZE = 10_000
+LOAD_FLUSH_INTERVAL = 10_000
 
 
 def get_attribute(
@@ -96,7 +128,8 @@ def read_rows(book) -> str:
     """
     Получает открытую книгу и читает первые 100 строк или пока не встретит тег <title>. Прочтенные строки
     конкатинируются в одну, чтобы избежать ситуаций, когда теги находятся на разных строках (в этом случае информацию
-    о авторе, книге или годе можно потерять) и передаются функции add_data_to_db для добавления информации в бд.
+    о авторе, книге или годе можно потерять) и передаются функции find_info для поиска информации о книге.
+    Вместо этой функции digger использует scanner.scan_book, она оставлена для сравнения в benchmarks/bench_scanner.py.
     :param book: открытая книга
     :return: строка, состоящая из нескольких строк книги
     """
@@ -117,146 +150,408 @@ def read_rows(book) -> str:
     return book_text
 
 
-def add_data_to_db(data: str, update: bool) -> None:
+def extract_fb2(path_to_book: str) -> list:
     """
-    Ищет информацию с помощью функции find_info и передает ее в фукнции add_data_to_authors и add_data_to_books,
-    которые добавляют информацию в базу данных.
-    :param data: инофрмация в виде строки
-    :param update: флаг для функций add_data_to_books и add_data_to_authors
+    Функция для извлечения информации из книги в формате fb2. Читает описание книги до тега </description> и ищет в
+    нем информацию с помощью функции scan_book.
+    :param path_to_book: путь до книги
+    :return: список, состоящий из одного списка с информацией о книге, или пустой список, если информация не найдена
     """
-    info_list = find_info(data)
-    if info_list:
-        add_data_to_authors(info_list[0])
-        add_data_to_books(info_list, update)
+    with open(path_to_book, "rb") as book:
+        info_list = scan_book(book)
+
+    return [info_list] if info_list else []
 
 
-def parse_fb2(path_to_book: str, update: bool) -> None:
+def extract_fb2_zip(path_to_book: str) -> list:
     """
-    Функция для парсинга книги в формате fb2. Читает первые 100 строк или пока не встретит тег <title>.
-    Прочтенные строки конкатинируются в одну, чтобы избежать ситуаций, когда теги находятся на разных строках
-    (в этом случае информацию о авторе, книге или годе можно потерять) и передаются функции add_data_to_db для
-    добавления информации в бд.
-    :param path_to_book: путь до книги
-    :param update: флаг для функций add_data_to_books и add_data_to_authors
+    Функция для извлечения информации из книг в архиве fb2.zip. Для каждой книги fb2 в архиве читает описание книги
+    до тега </description> и ищет в нем информацию с помощью функции scan_book. Книги, которые не удалось прочитать,
+    пропускаются, чтобы получить список ошибок, нужно использовать archives.scan_zip_members.
+    :param path_to_book: путь до архива
+    :return: список списков с информацией о каждой найденной в архиве книге
     """
-    book_text = ""
-    try:
-        with open(path_to_book, encoding="utf8") as book:
-            book_text = read_rows(book)
-    except IOError:
-        print(f"Произошла ошибка во время чтения файла {path_to_book}")
-
-    add_data_to_db(book_text, update)
+    info_lists, _ = scan_zip_members(path_to_book, zip_book_members(path_to_book))
+    return info_lists
 
 
-def parse_fb2_zip(path_to_book: str, update: bool) -> None:
+def extract_fb2_gz(path_to_book: str) -> list:
     """
-    Функция для парсинга книги в формате fb2.zip. Читает первые 100 строк или пока не встретит тег <title>.
-    Прочтенные строки конкатинируются в одну, чтобы избежать ситуаций, когда теги находятся на разных строках
-    (в этом случае информацию о авторе, книге или годе можно потерять) и передаются функции add_data_to_db для
-    добавления информации в бд.
+    Функция для извлечения информации из книги в формате fb2.gz. Читает описание книги до тега </description> и ищет в
+    нем информацию с помощью функции scan_book.
     :param path_to_book: путь до книги
-    :param update: флаг для функций add_data_to_books и add_data_to_authors
+    :return: список, состоящий из одного списка с информацией о книге, или пустой список, если информация не найдена
     """
-    book_text = ""
-    try:
-        with zf.ZipFile(path_to_book) as zp:
-            book_names = zf.ZipFile.namelist(zp)
-            for book in book_names:
-                if book.endswith("fb2"):
-                    with zp.open(book) as bk:
-                        book_text = read_rows(bk)
-                add_data_to_db(book_text, update)
-    except zf.BadZipFile:
-        print(f"Произошла ошибка во время чтения архива zip {path_to_book}")
-
-
-def parse_fb2_gz(path_to_book: str, update: bool) -> None:
-    """
-    Функция для парсинга книги в формате fb2.gz. Читает первые 100 строк или пока не встретит тег <title>.
-    Прочтенные строки конкатинируются в одну, чтобы избежать ситуаций, когда теги находятся на разных строках
-    (в этом случае информацию о авторе, книге или годе можно потерять) и передаются функции add_data_to_db для
-    добавления информации в бд.
-    :param path_to_book: путь до книги
-    :param update: флаг для функций add_data_to_books и add_data_to_authors
-    """
-    book_text = ""
-    try:
-        with gz.open(path_to_book, "rb") as book:
-            book_text = read_rows(book)
-    except gz.BadGzipFile:
-        print(f"Произошла ошибка во время чтения архива gz {path_to_book}")
+    with gz.open(path_to_book, "rb") as book:
+        info_list = scan_book(book)
 
-    add_data_to_db(book_text, update)
+    return [info_list] if info_list else []
 
 
-def parse_file(book_path: str, update: bool) -> None:
+def extract_file(book_path: str) -> list:
     """
     В зависимости от расширения книги, вызывает нужный метод для получения информации об авторе, названии годе
-    выпуска и другой информации.
+    выпуска и другой информации. Функция не обращается к базе данных, поэтому может выполняться в отдельном процессе.
+    Если файл не удалось прочитать, выбрасывается одно из исключений archives.READ_ERRORS. Книги архива tar, которые не
+    удалось прочитать, пропускаются, чтобы получить список ошибок, нужно использовать archives.scan_tar.
     :param book_path: путь до книги
-    :param update: флаг для функций add_data_to_books и add_data_to_authors
+    :return: список списков с информацией о книгах, найденных в файле
     """
     if book_path.endswith("fb2"):
-        parse_fb2(book_path, update)
+        return extract_fb2(book_path)
 
     if book_path.endswith("fb2.zip"):
-        parse_fb2_zip(book_path, update)
+        return extract_fb2_zip(book_path)
 
     if book_path.endswith("fb2.gz"):
-        parse_fb2_gz(book_path, update)
+        return extract_fb2_gz(book_path)
 
+    if is_tar_path(book_path):
+        info_lists, _ = scan_tar(book_path)
+        return info_lists
 
-def parse_files_from_directory(dir_path: str, update: bool) -> None:
+    return []
+
+
+def process_file(book_path: str, stat: os.stat_result, known_fingerprint: str or None) -> tuple:
     """
-    Получает директорию, в которой хранятся книги. Для каждой книги вызывает метод parse_file.
-    :param dir_path: путь до директории с книгами
-    :param update: флаг для функций add_data_to_books и add_data_to_authors
+    Считает отпечаток файла и, если он отличается от уже известного, извлекает информацию о книгах. Функция не
+    обращается к базе данных, поэтому может выполняться в отдельном процессе.
+    :param book_path: путь до книги
+    :param stat: результат stat для файла
+    :param known_fingerprint: отпечаток файла из манифеста или None, если файл нужно распарсить в любом случае
+    :return: кортеж (отпечаток, список списков с информацией о книгах, список ошибок), вместо списка книг будет None,
+    если содержимое файла не изменилось, а вместо отпечатка None, если файл не удалось прочитать
     """
-    for book_path in os.listdir(dir_path):
-        parse_file(dir_path + book_path, update)
+    try:
+        fingerprint = file_fingerprint(book_path, stat.st_size)
+        if fingerprint == known_fingerprint:
+            return fingerprint, None, []
+        if book_path.endswith("fb2.zip"):
+            info_lists, errors = scan_zip_members(book_path, zip_book_members(book_path))
+            return fingerprint, info_lists, errors
+        return fingerprint, extract_file(book_path), []
+    except READ_ERRORS as error:
+        return None, [], [(book_path, describe_error(error))]
+
+
+def process_members(book_path: str, members: list, fingerprint: str or None) -> tuple:
+    """
+    Извлекает информацию о части книг архива. Функция не обращается к базе данных, поэтому может выполняться в
+    отдельном процессе.
+    :param book_path: путь до архива
+    :param members: описания книг из центрального каталога архива
+    :param fingerprint: отпечаток архива, передается только с последней частью архива, чтобы запись манифеста
+    появилась после всех книг архива
+    :return: кортеж (отпечаток, список списков с информацией о книгах, список ошибок)
+    """
+    try:
+        info_lists, errors = scan_zip_members(book_path, members)
+    except READ_ERRORS as error:
+        return None, [], [(book_path, describe_error(error))]
+    return fingerprint, info_lists, errors
 
 
-def add_data_to_authors(authors_name: str) -> None:
+def process_tar(book_path: str, stat: os.stat_result, known_fingerprint: str or None):
+    """
+    Считает отпечаток архива tar и, если он отличается от уже известного, извлекает информацию о книгах по мере чтения
+    архива частями по ZIP_CHUNK_SIZE книг, поэтому книги записываются в базу данных, не дожидаясь конца архива, а
+    память не зависит от количества книг в архиве. Если архив обрывается или поврежден, книги до этого места
+    остаются, а место обрыва попадает в список ошибок.
+    :param book_path: путь до архива
+    :param stat: результат stat для архива
+    :param known_fingerprint: отпечаток архива из манифеста или None, если архив нужно распарсить в любом случае
+    :return: генератор кортежей ((путь до архива, результат stat, прогресс), результат) с результатами как у
+    process_file. Отпечаток передается только с последней частью, у которой прогресс (количество книг, количество
+    книг), у остальных частей прогресс (количество книг, None)
     """
-    Добавляет в таблицу авторов информацию об авторе (его ФИО), если информации нет, то ничего не добавляем.
-    :param authors_name: имя автора или пустая строка, если автора нет
+    try:
+        fingerprint = file_fingerprint(book_path, stat.st_size)
+    except READ_ERRORS as error:
+        yield (book_path, stat, None), (None, [], [(book_path, describe_error(error))])
+        return
+    if fingerprint == known_fingerprint:
+        yield (book_path, stat, None), (fingerprint, None, [])
+        return
+
+    info_lists = []
+    errors = []
+    done = 0
+    try:
+        for info_list, error in iter_tar(book_path):
+            if error is not None:
+                errors.append(error)
+                continue
+            info_lists.append(info_list)
+            done += 1
+            if len(info_lists) >= ZIP_CHUNK_SIZE:
+                yield (book_path, stat, (done, None)), (None, info_lists, errors)
+                info_lists, errors = [], []
+    except READ_ERRORS as error:
+        # архив не удалось открыть, поэтому запись манифеста не добавляется
+        fingerprint = None
+        errors.append((book_path, describe_error(error)))
+    yield (book_path, stat, (done, done)), (fingerprint, info_lists, errors)
+
+
+def plan_tasks(files, manifest: Manifest, force: bool, stats=NULL_STATS):
     """
-    with md.db:
-        if authors_name:
-            md.Author.get_or_create(name=authors_name)
+    Составляет задачи для файлов, которые изменились с прошлого запуска. Для архива zip центральный каталог читается
+    один раз в текущем процессе, а книги архива делятся на части, которые обрабатываются как отдельные задачи. Архив
+    tar читается последовательно, поэтому для него составляется одна задача process_tar, которая возвращает книги
+    частями.
+    :param files: итерируемый объект с кортежами (абсолютный путь до книги, результат stat)
+    :param manifest: манифест уже обработанных файлов
+    :param force: флаг, если True, то книги парсятся, даже если не изменились с прошлого запуска
+    :param stats: статистика запуска
+    :return: генератор задач (функция, аргументы, (путь до книги, результат stat, прогресс)), где прогресс - кортеж
+    (количество обработанных книг архива, количество книг в архиве) или None для остальных файлов
+    """
+    for book_path, stat in files:
+        stats.count("files_seen")
+        if not force and manifest.is_unchanged(book_path, stat):
+            stats.count("files_skipped")
+            continue
+        known_fingerprint = None if force else manifest.known_fingerprint(book_path)
+
+        if is_tar_path(book_path):
+            yield process_tar, (book_path, stat, known_fingerprint), (book_path, stat, None)
+            continue
 
+        if not book_path.endswith("fb2.zip"):
+            yield process_file, (book_path, stat, known_fingerprint), (book_path, stat, None)
+            continue
 
-def add_data_to_books(info_list: list, update: bool) -> None:
+        try:
+            fingerprint = file_fingerprint(book_path, stat.st_size)
+            # у архива, содержимое которого не изменилось, нужно только обновить запись манифеста
+            members = [] if fingerprint == known_fingerprint else zip_book_members(book_path)
+        except READ_ERRORS:
+            # ошибка попадет в сводку, когда process_file попробует прочитать архив еще раз
+            yield process_file, (book_path, stat, known_fingerprint), (book_path, stat, None)
+            continue
+
+        parts = split_members(members)
+        done = 0
+        for number, part in enumerate(parts, start=1):
+            done += len(part)
+            last_fingerprint = fingerprint if number == len(parts) else None
+            yield process_members, (book_path, part, last_fingerprint), (book_path, stat, (done, len(members)))
+
+
+def map_ordered(tasks, workers: int, pool=None):
+    """
+    Выполняет задачи и возвращает результаты в том же порядке, в котором были переданы задачи.
+    Если workers больше одного, задачи выполняются в пуле из workers процессов, при этом одновременно в работе
+    находится не больше MAX_TASKS_PER_WORKER задач на процесс, поэтому задачи берутся из итератора по мере
+    выполнения, а не все сразу.
+    Задача, функция которой - генератор, возвращает результат частями вместе с контекстом каждой части. Она
+    выполняется в текущем процессе после того, как получены результаты всех предыдущих задач, чтобы части можно было
+    обрабатывать, не дожидаясь конца задачи.
+    :param tasks: итерируемый объект с задачами (функция, аргументы, контекст), контекст в процесс не передается
+    :param workers: количество процессов
+    :param pool: уже созданный пул из workers процессов или None, тогда пул создается на время выполнения задач
+    :return: генератор кортежей (контекст, результат)
+    """
+    if workers == 1:
+        for func, args, context in tasks:
+            if inspect.isgeneratorfunction(func):
+                yield from func(*args)
+            else:
+                yield context, func(*args)
+        return
+
+    if pool is None:
+        with mp.Pool(workers) as pool:
+            yield from map_ordered(tasks, workers, pool)
+        return
+
+    max_pending = workers * MAX_TASKS_PER_WORKER
+    pending = deque()
+    for func, args, context in tasks:
+        if inspect.isgeneratorfunction(func):
+            while pending:
+                context, result = pending.popleft()
+                yield context, result.get()
+            yield from func(*args)
+            continue
+        pending.append((context, pool.apply_async(func, args)))
+        if len(pending) >= max_pending:
+            context, result = pending.popleft()
+            yield context, result.get()
+
+    while pending:
+        context, result = pending.popleft()
+        yield context, result.get()
+
+
+def parse_files(
+    files, writer: BatchWriter, manifest: Manifest, force: bool, workers: int, stats=NULL_STATS, pool=None
+) -> list:
+    """
+    Парсит книги, которые изменились с прошлого запуска, и передает информацию о них писателю для записи в базу
+    данных вместе с новыми записями манифеста. Чтение, распаковка и поиск информации выполняются в пуле из workers
+    процессов, если их больше одного, а запись в базу данных выполняет только текущий процесс, поэтому SQLite
+    используется одним писателем, а база данных заполняется так же, как при последовательном запуске.
+    Прогресс обработки архивов выводится в stderr. Если передана статистика запуска, то время обхода директорий
+    (walk), составления задач (plan), парсинга или ожидания результатов пула процессов (parse) и время каждой задачи
+    записываются в нее. Время задачи замеряется в процессе, который ее выполнил, отдельно для чтения и распаковки
+    файлов (read) и поиска информации в описаниях книг (scan).
+    Записи манифеста обработанных файлов обновляются сразу, поэтому при следующем вызове с тем же манифестом, например
+    при наблюдении за директорией, эти файлы не будут прочитаны снова.
+    :param files: итерируемый объект с кортежами (абсолютный путь до книги, результат stat)
+    :param writer: писатель, записывающий информацию о книгах в базу данных
+    :param manifest: манифест уже обработанных файлов
+    :param force: флаг, если True, то книги парсятся, даже если не изменились с прошлого запуска
+    :param workers: количество процессов для парсинга
+    :param stats: статистика запуска
+    :param pool: уже созданный пул из workers процессов или None, тогда пул создается на время парсинга
+    :return: список ошибок, ошибка - кортеж (путь до файла или книги в архиве, описание ошибки)
     """
-    Добавляет в таблицу книг информацию об авторе, названии, годе выпуска, языке, использованной программы, ссылки на
-    источник и версии. Если информации об авторе, годе или другом атрибуте кроме названия нет в тегах книги, то на их
-    местах в таблице будет стоять null.
-    Если сочетание название, автор, год уже есть в таблице, действуем в зависимости от флага update.
-    :param info_list: список из автора, названия книги, года выпуска, языка, использованной программы, ссылки и
-    версии
-    :param update: флаг, если True, то обновляем информацию по уже имеющейся книге в таблице, если False, ничего
-    не делаем
+    all_errors = []
+    tasks = plan_tasks(stats.iterate("walk", files), manifest, force, stats)
+    if stats.enabled:
+        tasks = (
+            (timed_parts if inspect.isgeneratorfunction(func) else timed_call, (func, args), context)
+            for func, args, context in tasks
+        )
+    results = stats.iterate("parse", map_ordered(stats.iterate("plan", tasks), workers, pool))
+
+    for (book_path, stat, progress), result in results:
+        if stats.enabled:
+            result, wall, cpu, scan = result
+            count_task(stats, book_path, stat, progress, result, wall, cpu, scan)
+        fingerprint, info_lists, errors = result
+        for info_list in info_lists or ():
+            writer.add(info_list, book_path)
+        all_errors.extend(errors)
+        if progress is not None and progress[1] is None:
+            click.echo(f"{book_path}: {progress[0]}", err=True)
+        elif progress is not None and progress[1]:
+            click.echo(f"{book_path}: {progress[0]}/{progress[1]}", err=True)
+        if fingerprint is not None:
+            writer.add_file(book_path, stat.st_size, stat.st_mtime_ns, fingerprint)
+            manifest.update(book_path, stat, fingerprint)
+
+    return all_errors
+
+
+def count_task(
+    stats: RunStats, book_path: str, stat: os.stat_result, progress, result: tuple, wall, cpu, scan: tuple
+) -> None:
     """
-    get_list = ["author_id", "title", "year"]
-    update_list = ["language", "program_used", "src_url", "version"]
-    with md.db:
-        author_id = md.Author.select().where(md.Author.name == info_list[0])
-        get_list_attrs = list(author_id)
+    Записывает в статистику время задачи и количество найденных книг и ошибок, а после последней задачи файла -
+    результат обработки файла.
+    :param stats: статистика запуска
+    :param book_path: путь до файла
+    :param stat: результат stat для файла
+    :param progress: прогресс обработки архива или None
+    :param result: результат задачи (отпечаток, список списков с информацией о книгах, список ошибок)
+    :param wall: время выполнения задачи в секундах
+    :param cpu: процессорное время задачи в секундах
+    :param scan: кортеж (время, процессорное время) поиска информации в описаниях книг в секундах
+    """
+    fingerprint, info_lists, errors = result
+    last = progress is None or progress[0] == progress[1]
+    stats.add_task(book_path, stat.st_size, wall, cpu, len(info_lists or ()), last, scan)
+    stats.count("books_found", len(info_lists or ()))
+    stats.count("read_errors", len(errors))
+    if not last:
+        return
+    if fingerprint is None:
+        stats.count("files_failed")
+    elif info_lists is None:
+        stats.count("files_content_unchanged")
+    else:
+        stats.count("files_parsed")
 
-        if not get_list_attrs:
-            get_list_attrs = [None]
-        get_list_attrs.extend(info_list[1:3])
 
-        get_keywords = dict(zip(get_list, get_list_attrs))
-        update_keywords = dict(zip(update_list, info_list[3:]))
+def report_errors(errors: list) -> None:
+    """
+    Выводит в stdout сводку ошибок чтения файлов.
+    :param errors: список ошибок, ошибка - кортеж (путь до файла или книги в архиве, описание ошибки)
+    """
+    if not errors:
+        return
 
-        try:
-            book_id = md.Book.get(**get_keywords).id
-            if update:
-                md.Book.update(**update_keywords).where(md.Book.id == book_id).execute()
-        except pw.DoesNotExist:
-            md.Book.insert(**get_keywords, **update_keywords).execute()
+    print(f"Не удалось прочитать книг и файлов: {len(errors)}")
+    for path, message in errors:
+        print(f"    {path}: {message}")
+
+
+def report_removed_files(manifest: Manifest, dir_path: str, purge: bool) -> None:
+    """
+    Выводит в stdout файлы, которые были обработаны раньше, но больше не лежат в директории или ее вложенных
+    директориях, и, если указан флаг purge, удаляет записи о них из манифеста вместе с книгами из этих файлов.
+    :param manifest: манифест уже обработанных файлов
+    :param dir_path: абсолютный путь до директории с книгами
+    :param purge: флаг, если True, то записи об удаленных файлах и книги из них удаляются
+    """
+    removed = manifest.removed(dir_path)
+    for path in removed:
+        print(f"Файл {path} был удален из директории")
+
+    if purge and removed:
+        print(f"Удалено книг из удаленных файлов: {Manifest.purge(removed)}")
+
+
+def watch_books(
+    watcher: TreeWatcher,
+    writer: BatchWriter,
+    manifest: Manifest,
+    force: bool,
+    workers: int,
+    interval: float,
+    stats=NULL_STATS,
+) -> None:
+    """
+    Опрашивает директорию каждые interval секунд и сразу записывает книги из новых и изменившихся файлов, которые
+    готовы к обработке, поэтому они становятся доступны для поиска через несколько секунд после появления. Работает,
+    пока не будет прерван с помощью Ctrl+C. Все записи выполняются через одно открытое подключение к базе данных, а
+    если workers больше одного, то пул процессов создается один раз на все время наблюдения.
+    :param watcher: наблюдатель за директорией с книгами
+    :param writer: писатель, записывающий информацию о книгах в базу данных
+    :param manifest: манифест уже обработанных файлов
+    :param force: флаг, если True, то книги парсятся, даже если не изменились с прошлого запуска
+    :param workers: количество процессов для парсинга
+    :param interval: время между опросами в секундах
+    :param stats: статистика запуска
+    """
+    is_unchanged = None if force else manifest.is_unchanged
+    try:
+        with md.db.connection_context(), (mp.Pool(workers) if workers > 1 else nullcontext()) as pool:
+            while True:
+                started = time.monotonic()
+                files = watcher.poll(is_unchanged)
+                if files:
+                    errors = parse_files(files, writer, manifest, force, workers, stats, pool)
+                    writer.flush()
+                    report_errors(errors)
+                    click.echo(f"Обработано файлов: {len(files)}", err=True)
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+
+
+@contextmanager
+def target_database(db_shard: str or None, rebuild: bool):
+    """
+    Контекстный менеджер, внутри которого модели подключены к базе данных, в которую записываются книги.
+    :param db_shard: название шарда или None для основной базы данных. Несуществующий шард создается
+    :param rebuild: флаг, если True, то шард строится заново в новом файле и заменяет предыдущую версию после записи
+    всех книг
+    :raises click.UsageError: если rebuild указан без шарда
+    """
+    if db_shard is None:
+        if rebuild:
+            raise click.UsageError("--rebuild можно использовать только вместе с --db-shard")
+        yield
+    elif rebuild:
+        with rebuilding_shard(db_shard):
+            yield
+    else:
+        use_shard(db_shard, create=True)
+        yield
 
 
 def check_directory_or_file(path: str) -> bool:
@@ -273,7 +568,16 @@ def check_directory_or_file(path: str) -> bool:
         return False
 
 
-@click.command()
+@click.group(cls=DefaultGroup, default_command="ingest", directory_first=True)
+def digger():
+    """
+    Команды для заполнения базы данных информацией о книгах. Если команда не указана, выполняется ingest, поэтому
+    "digger C:\\Books" и "digger ingest C:\\Books" работают одинаково. Существующая директория с названием
+    команды, например extract, тоже передается ingest.
+    """
+
+
+@digger.command()
 @click.argument("dir_path")
 @click.option(
     "--book_name",
@@ -292,22 +596,327 @@ def check_directory_or_file(path: str) -> bool:
     help="""флаг. Если он есть, то информация книгах с одинаковым автором, названием и годом
     будет обновлена, иначе ничего не происходит.""",
 )
-def digger(dir_path: str, book_name, update) -> None:
+@click.option(
+    "--workers",
+    "-w",
+    type=click.IntRange(min=1),
+    default=1,
+    help="""Количество процессов для парсинга книг. Если больше одного, то книги парсятся параллельно, а запись в
+    базу данных выполняет один процесс.""",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=500,
+    help="Максимальное количество книг, записываемых в базу данных в одной транзакции.",
+)
+@click.option(
+    "--flush-ms",
+    type=click.IntRange(min=0),
+    default=1000,
+    help="Максимальное время в миллисекундах, в течение которого книги накапливаются перед записью в базу данных.",
+)
+@click.option(
+    "--include",
+    multiple=True,
+    help=f"""Glob шаблон файлов, которые нужно обработать, можно указать несколько раз. По умолчанию
+    {", ".join(DEFAULT_INCLUDE)}.""",
+)
+@click.option(
+    "--exclude",
+    multiple=True,
+    help="Glob шаблон файлов или директорий, которые нужно пропустить, можно указать несколько раз.",
+)
+@click.option(
+    "--follow-symlinks",
+    is_flag=True,
+    help="Если этот флаг указан, то обходятся директории и файлы, на которые указывают символические ссылки.",
+)
+@click.option(
+    "--max-depth",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Максимальная глубина вложенных директорий, 0 - только сама директория. По умолчанию без ограничений.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Если этот флаг указан, то книги парсятся заново, даже если они не изменились с прошлого запуска.",
+)
+@click.option(
+    "--purge",
+    is_flag=True,
+    help="""Если этот флаг указан, то записи о файлах, удаленных из директории, удаляются из манифеста вместе с
+    книгами из этих файлов. Книга, которая есть и в других файлах, остается.""",
+)
+@click.option(
+    "--stats",
+    "show_stats",
+    is_flag=True,
+    help="""Если этот флаг указан, то после работы будет выведено время этапов, время по форматам файлов, количество
+    пропущенных, прочитанных, добавленных и обновленных книг и самые долгие файлы.""",
+)
+@click.option(
+    "--stats-file",
+    type=click.Path(dir_okay=False),
+    help="Файл, в который статистика будет сохранена в формате JSON.",
+)
+@click.option(
+    "--slowest",
+    type=click.IntRange(min=0),
+    default=10,
+    help="Сколько самых долгих файлов показать в статистике.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="""Если этот флаг указан, то после обработки директории digger продолжает работать и добавляет книги из
+    новых и изменившихся файлов, пока не будет прерван с помощью Ctrl+C.""",
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0.1),
+    default=2.0,
+    help="Время между опросами директории в секундах в режиме --watch.",
+)
+@click.option(
+    "--settle",
+    type=click.FloatRange(min=0),
+    default=2.0,
+    help="""Сколько секунд размер и время изменения файла не должны меняться, чтобы в режиме --watch файл был
+    обработан. Нужно, чтобы не читать файлы, которые еще копируются.""",
+)
+@click.option(
+    "--snapshot",
+    "make_snapshot",
+    is_flag=True,
+    help="""Если этот флаг указан, то после записи книг строится снимок каталога для seeker. Если снимок уже есть, он
+    обновляется и без этого флага.""",
+)
+@click.option(
+    "--db-shard",
+    callback=parse_shard_names,
+    help="""Название шарда каталога, в который записываются книги, вместо основной базы данных. Несуществующий шард
+    создается.""",
+)
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="""Если этот флаг указан, то шард строится заново в отдельном файле и заменяет предыдущую версию одним
+    переименованием после записи всех книг. Используется вместе с --db-shard.""",
+)
+def ingest(
+    dir_path: str,
+    book_name,
+    update,
+    workers,
+    batch_size,
+    flush_ms,
+    include,
+    exclude,
+    follow_symlinks,
+    max_depth,
+    force,
+    purge,
+    show_stats,
+    stats_file,
+    slowest,
+    watch,
+    interval,
+    settle,
+    make_snapshot,
+    db_shard,
+    rebuild,
+) -> None:
     """
-    Функция для заполнения базы данных информацией о книгах в формате fb2, fb2.zip и fb2.gz.
+    Функция для заполнения базы данных информацией о книгах в формате fb2, fb2.zip и fb2.gz, в том числе лежащих в
+    архивах tar, tar.gz, tar.bz2 и tar.xz. Книги ищутся в директории и во всех вложенных директориях. Книги, которые
+    не изменились с прошлого запуска, пропускаются.
+    На время записи книг используется профиль SQLite для массовой загрузки из config.ini, в режиме --watch - обычный
+    профиль. После записи обновляется снимок каталога, если он есть.
 
     dir_path: путь до директории с книгами
     """
-    dir_path = f"{dir_path}/"
+    if watch and book_name is not None:
+        raise click.UsageError("--watch нельзя использовать вместе с --book_name")
+    if watch and rebuild:
+        raise click.UsageError("--watch нельзя использовать вместе с --rebuild")
+
+    dir_path = os.path.abspath(dir_path)
+    # шард без книг не должен заменять предыдущую версию
+    if rebuild and not check_directory_or_file(os.path.join(dir_path, book_name or "")):
+        return
+    stats = RunStats(slowest) if show_stats or stats_file else NULL_STATS
+    errors = []
+    with target_database(db_shard, rebuild):
+        with stats.stage("manifest"):
+            manifest = Manifest.load()
+        start_generation = current_generation()
+
+        if watch:
+            if check_directory_or_file(dir_path):
+                watcher = TreeWatcher(
+                    dir_path, settle, include or DEFAULT_INCLUDE, exclude, follow_symlinks, max_depth
+                )
+                with BatchWriter(update, batch_size, flush_ms, stats=stats) as writer:
+                    watch_books(watcher, writer, manifest, force, workers, interval, stats)
+
+        else:
+            with bulk_load(), BatchWriter(update, batch_size, flush_ms, stats=stats) as writer:
+                if book_name is not None:
+                    full_book_path = os.path.join(dir_path, book_name)
+                    if check_directory_or_file(full_book_path):
+                        files = [(full_book_path, os.stat(full_book_path))]
+                        errors = parse_files(files, writer, manifest, force, workers, stats)
 
-    if book_name is not None:
-        full_book_path = dir_path + book_name
-        if check_directory_or_file(full_book_path):
-            parse_file(full_book_path, update)
+                else:
+                    if check_directory_or_file(dir_path):
+                        files = walk_books(dir_path, include or DEFAULT_INCLUDE, exclude, follow_symlinks, max_depth)
+                        errors = parse_files(files, writer, manifest, force, workers, stats)
 
-    else:
-        if check_directory_or_file(dir_path):
-            parse_files_from_directory(dir_path, update)
+        with stats.stage("snapshot"):
+            refresh_snapshot(start_generation, update, make_snapshot)
+
+    report_errors(errors)
+    if show_stats:
+        stats.report()
+    if stats_file:
+        stats.save(stats_file)
+
+    if book_name is None and os.path.isdir(dir_path):
+        report_removed_files(manifest, dir_path, purge)
+
+
+def extract_books(dir_paths, shard, workers: int, errors: list, **walk_options):
+    """
+    Извлекает информацию о книгах из всех файлов директорий, не обращаясь к базе данных и манифесту.
+    :param dir_paths: пути до директорий с книгами
+    :param shard: кортеж (K, N), если нужно обработать только часть K из N файлов, иначе None
+    :param workers: количество процессов для парсинга
+    :param errors: список, в который добавляются ошибки чтения файлов
+    :param walk_options: параметры обхода директорий для walk_books
+    :return: генератор списков с информацией о книгах
+    """
+    for dir_path in dir_paths:
+        root = os.path.abspath(dir_path)
+        files = (
+            (path, stat)
+            for path, stat in walk_books(root, **walk_options)
+            if in_shard(os.path.relpath(path, root), shard)
+        )
+        tasks = plan_tasks(files, Manifest({}), force=True)
+        for _, (_, info_lists, task_errors) in map_ordered(tasks, workers):
+            errors.extend(task_errors)
+            yield from info_lists or ()
+
+
+@digger.command("extract")
+@click.argument("dir_paths", nargs=-1, required=True, type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--output",
+    "-o",
+    default="-",
+    show_default=True,
+    help="Файл, в который записываются книги в формате JSON Lines, - для stdout. Файлы .gz сжимаются gzip.",
+)
+@click.option("--compress", is_flag=True, help="Если этот флаг указан, то вывод сжимается gzip.")
+@click.option(
+    "--shard",
+    callback=parse_shard,
+    help="""Обработать только часть K из N файлов в формате K/N, например 2/4. Файлы распределяются по частям по
+    хэшу пути относительно директории, поэтому N запусков с разными K обрабатывают каждый файл ровно один раз.""",
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Количество процессов для парсинга книг.",
+)
+@click.option("--include", multiple=True, help="Glob шаблон файлов, которые нужно обработать.")
+@click.option("--exclude", multiple=True, help="Glob шаблон файлов или директорий, которые нужно пропустить.")
+@click.option("--follow-symlinks", is_flag=True, help="Обходить символические ссылки.")
+@click.option(
+    "--max-depth",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Максимальная глубина вложенных директорий, 0 - только сама директория.",
+)
+def extract(dir_paths, output, compress, shard, workers, include, exclude, follow_symlinks, max_depth):
+    """
+    Извлекает информацию о книгах из директорий и записывает ее в формате JSON Lines, по одной книге в строке, без
+    обращения к базе данных. Результаты нескольких запусков, в том числе сжатые, можно объединить командой cat и
+    загрузить командой digger load.
+    """
+    errors = []
+    count = 0
+    walk_options = {
+        "include": include or DEFAULT_INCLUDE,
+        "exclude": exclude,
+        "follow_symlinks": follow_symlinks,
+        "max_depth": max_depth,
+    }
+    # сообщения об ошибках выводятся в stderr, чтобы не смешиваться с книгами в stdout
+    with open_output(output, compress) as file, redirect_stdout(sys.stderr):
+        for info_list in extract_books(dir_paths, shard, workers, errors, **walk_options):
+            file.write(info_to_record(info_list) + "\n")
+            count += 1
+        report_errors(errors)
+    click.echo(f"Извлечено книг: {count}", err=True)
+
+
+@digger.command("load")
+@click.argument("paths", nargs=-1, type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option(
+    "--update",
+    "-u",
+    is_flag=True,
+    help="Если этот флаг указан, то информация о книгах с одинаковым автором, названием и годом обновляется.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=LOAD_BATCH_SIZE,
+    show_default=True,
+    help="Максимальное количество книг, записываемых в базу данных в одной транзакции.",
+)
+@click.option(
+    "--snapshot",
+    "make_snapshot",
+    is_flag=True,
+    help="Если этот флаг указан, то после записи книг строится снимок каталога для seeker.",
+)
+@click.option(
+    "--db-shard",
+    callback=parse_shard_names,
+    help="""Название шарда каталога, в который записываются книги, вместо основной базы данных. Несуществующий шард
+    создается.""",
+)
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="""Если этот флаг указан, то шард строится заново в отдельном файле и заменяет предыдущую версию одним
+    переименованием после записи всех книг. Используется вместе с --db-shard.""",
+)
+def load(paths, update, batch_size, make_snapshot, db_shard, rebuild):
+    """
+    Загружает в базу данных книги из файлов в формате JSON Lines, созданных командой digger extract, в том числе
+    сжатых gzip. Если файлы не указаны, книги читаются из stdin. Книги записываются большими транзакциями с профилем
+    SQLite для массовой загрузки, уже имеющиеся книги пропускаются, поэтому прерванную загрузку можно повторить.
+    """
+    errors = []
+    count = 0
+    with target_database(db_shard, rebuild):
+        start_generation = current_generation()
+        with bulk_load(), BatchWriter(update, batch_size, LOAD_FLUSH_INTERVAL) as writer:
+            for path in paths or ["-"]:
+                for info_list in read_records(path, errors):
+                    writer.add(info_list)
+                    count += 1
+        refresh_snapshot(start_generation, update, make_snapshot)
+
+    report_errors(errors)
+    print(f"Прочитано книг: {count}")
 
 
 if __name__ == "__main__":
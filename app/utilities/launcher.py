@@ -0,0 +1,90 @@
+import sys
+
+import click
+
+from utilities.cli import LazyGroup
+
+# Команды и их краткие описания. Модуль команды импортируется только при ее вызове, поэтому запуск команды не
+# импортирует peewee, модели и модули других команд раньше, чем они нужны
+COMMANDS = {
+    "dig": ("utilities.digger:digger", "Заполнение базы данных информацией о книгах, как digger"),
+    "seek": ("utilities.seeker:seeker", "Поиск книг, как seeker"),
+    "wipe": ("utilities.wiper:wiper", "Удаление книг, как wiper"),
+    "migrate": ("db_and_migration.migration.migration:migration", "Обновление схемы базы данных, как migration"),
+    "export": ("utilities.catalog:export_command", "Выгрузка каталога в файл"),
+    "import": ("utilities.catalog:import_command", "Загрузка каталога из файла"),
+}
+# Слово, разделяющее команды, которые выполняются по очереди в одном процессе
+CHAIN_SEPARATOR = "then"
+
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
+def catalog():
+    """
+    Все команды для работы с каталогом книг в одной программе. Несколько команд, разделенных словом then,
+    выполняются по очереди в одном процессе, например "catalog dig C:\\Books then seek -a Автор", поэтому повторные
+    команды не тратят время на запуск Python и импорт модулей.
+    """
+
+
+def split_chain(args: list) -> list:
+    """
+    :param args: аргументы командной строки
+    :return: список аргументов каждой команды цепочки
+    """
+    commands = [[]]
+    for arg in args:
+        if arg == CHAIN_SEPARATOR:
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+    return commands
+
+
+def current_database() -> str or None:
+    """
+    :return: путь до базы данных, к которой подключены модели, или None, если модуль подключения еще не импортирован
+    """
+    connection = sys.modules.get("connection")
+    return connection.connection.database if connection is not None else None
+
+
+def restore_database(path: str or None) -> None:
+    """
+    Возвращает модели к базе данных, к которой они были подключены до команды, если команда переключила их на шард,
+    чтобы следующая команда цепочки начинала с той же базы данных, что и отдельный запуск. Модули проверяются в
+    sys.modules, так как импортированы они, только если их импортировала одна из команд.
+    :param path: результат current_database до команды
+    """
+    connection = sys.modules.get("connection")
+    if connection is None:
+        return
+    if path is None:
+        path = connection.database_path(connection.config)
+    shards = sys.modules.get("utilities.shards")
+    if shards is not None and connection.connection.database != path:
+        shards.switch_database(path)
+
+
+def main(args: list = None) -> None:
+    """
+    Выполняет команды цепочки по очереди. Если команда завершилась с ошибкой, следующие команды не выполняются.
+    :param args: аргументы командной строки, по умолчанию sys.argv
+    """
+    for command_args in split_chain(sys.argv[1:] if args is None else args):
+        database = current_database()
+        try:
+            exit_code = catalog.main(command_args, prog_name="catalog", standalone_mode=False)
+        except click.ClickException as error:
+            error.show()
+            sys.exit(error.exit_code)
+        except click.Abort:
+            click.echo("Aborted!", err=True)
+            sys.exit(1)
+        if isinstance(exit_code, int) and exit_code:
+            sys.exit(exit_code)
+        restore_database(database)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import hashlib
+import os
+
+import peewee as pw
+
+import db_and_migration.migration.models as md
+from utilities.cache import bump_generation
+from utilities.writer import MAX_QUERY_PARAMS, REMOVE_ORPHAN_AUTHORS, chunks
+
+# Размер фрагментов в начале и в конце файла, по которым считается отпечаток
+FINGERPRINT_SAMPLE_SIZE = 64 * 1024
+
+
+def file_fingerprint(path: str, size: int) -> str:
+    """
+    Считает отпечаток содержимого файла: хэш от размера файла, его первых и последних FINGERPRINT_SAMPLE_SIZE байт.
+    Этого достаточно, чтобы отличить перезаписанную книгу от книги, у которой изменилось только время изменения, и
+    при этом не читать целиком многогигабайтные архивы.
+    :param path: путь до файла
+    :param size: размер файла в байтах
+    :return: отпечаток в виде шестнадцатеричной строки
+    """
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as file:
+        digest.update(file.read(FINGERPRINT_SAMPLE_SIZE))
+        if size > 2 * FINGERPRINT_SAMPLE_SIZE:
+            file.seek(-FINGERPRINT_SAMPLE_SIZE, os.SEEK_END)
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Манифест уже обработанных файлов из таблицы manifest. Загружается один раз в начале запуска digger, после чего
+    проверка файла на изменения не требует обращений к базе данных. Записи о файлах, обработанных за запуск,
+    обновляются методом update.
+
+    entries: словарь, где ключ - абсолютный путь до файла, а значение - кортеж (размер, время изменения, отпечаток)
+    seen: множество путей до файлов, встреченных за текущий запуск
+    """
+
+    def __init__(self, entries: dict):
+        self.entries = entries
+        self.seen = set()
+
+    @classmethod
+    def load(cls):
+        """
+        Загружает манифест из базы данных.
+        :return: манифест
+        """
+        with md.db:
+            query = md.FileManifest.select(
+                md.FileManifest.path,
+                md.FileManifest.size,
+                md.FileManifest.mtime,
+                md.FileManifest.fingerprint,
+            ).tuples()
+            entries = {path: (size, mtime, fingerprint) for path, size, mtime, fingerprint in query}
+        return cls(entries)
+
+    def is_unchanged(self, path: str, stat: os.stat_result) -> bool:
+        """
+        Проверяет по размеру и времени изменения, что файл не изменился с прошлого запуска, и отмечает его как
+        встреченный.
+        :param path: абсолютный путь до файла
+        :param stat: результат stat для файла
+        :return: True, если файл уже есть в манифесте с теми же размером и временем изменения
+        """
+        self.seen.add(path)
+        entry = self.entries.get(path)
+        return entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns)
+
+    def known_fingerprint(self, path: str) -> str or None:
+        """
+        :param path: абсолютный путь до файла
+        :return: отпечаток файла из манифеста или None, если файл еще не обрабатывался
+        """
+        entry = self.entries.get(path)
+        return entry[2] if entry is not None else None
+
+    def update(self, path: str, stat: os.stat_result, fingerprint: str) -> None:
+        """
+        Обновляет запись о файле, переданном писателю для записи в таблицу manifest.
+        :param path: абсолютный путь до файла
+        :param stat: результат stat для файла
+        :param fingerprint: отпечаток файла
+        """
+        self.entries[path] = (stat.st_size, stat.st_mtime_ns, fingerprint)
+
+    def removed(self, dir_path: str) -> list:
+        """
+        Находит файлы из манифеста, которые лежали в указанной директории или ее вложенных директориях, но не были
+        встречены за текущий запуск и больше не существуют. Файлы, пропущенные из-за фильтров обхода, удаленными не
+        считаются.
+        :param dir_path: абсолютный путь до директории с книгами
+        :return: отсортированный список путей до удаленных файлов
+        """
+        prefix = os.path.join(dir_path, "")
+        return sorted(
+            path
+            for path in self.entries
+            if path.startswith(prefix) and path not in self.seen and not os.path.exists(path)
+        )
+
+    @staticmethod
+    def purge(paths: list) -> int:
+        """
+        Удаляет записи о файлах из таблицы manifest и книги, прочитанные из этих файлов, в одной транзакции. Книга,
+        которая есть и в других файлах, остается. После удаления книг удаляются авторы, у которых не осталось книг, и
+        увеличивается поколение каталога.
+        :param paths: пути до файлов
+        :return: количество удаленных книг
+        """
+        with md.db:
+            book_ids = set()
+            for part in chunks(paths, MAX_QUERY_PARAMS):
+                links = md.FileBook.select(md.FileBook.book_id).where(md.FileBook.path.in_(part))
+                book_ids.update(book_id for book_id, in links.tuples())
+                md.FileBook.delete().where(md.FileBook.path.in_(part)).execute()
+                md.FileManifest.delete().where(md.FileManifest.path.in_(part)).execute()
+
+            deleted = 0
+            other_files = md.FileBook.select().where(md.FileBook.book_id == md.Book.id)
+            for part in chunks(sorted(book_ids), MAX_QUERY_PARAMS):
+                deleted += md.Book.delete().where(md.Book.id.in_(part) & ~pw.fn.EXISTS(other_files)).execute()
+            if deleted:
+                md.db.execute_sql(REMOVE_ORPHAN_AUTHORS)
+                bump_generation()
+        return deleted
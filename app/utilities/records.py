@@ -0,0 +1,166 @@
+import gzip as gz
+import io
+import json
+import os
+import sys
+import zlib
+from contextlib import ExitStack, contextmanager
+
+import click
+
+from utilities.archives import describe_error
+
+# Поля записи о книге в том же порядке, что и в списке, который возвращает find_info
+RECORD_FIELDS = ["author", "title", "year", "language", "program_used", "src_url", "version"]
+GZIP_MAGIC = b"\x1f\x8b"
+# Допустимые значения года: 32-битное целое число со знаком, как в снимке каталога
+MAX_YEAR = 2**31 - 1
+# Ошибки поврежденного или оборванного файла, после которых файл дальше не читается
+STREAM_ERRORS = (OSError, EOFError, zlib.error)
+
+
+def parse_shard(ctx, param, value: str or None) -> tuple or None:
+    """
+    Разбирает номер части в формате K/N для опции click.
+    :param value: строка K/N, где N - количество частей, K - номер части от 1 до N
+    :return: кортеж (K, N) или None, если опция не указана
+    """
+    if value is None:
+        return None
+    number, slash, count = value.partition("/")
+    try:
+        number, count = int(number), int(count)
+    except ValueError:
+        raise click.BadParameter(f"{value} не имеет формат K/N") from None
+    if not slash or not 1 <= number <= count:
+        raise click.BadParameter(f"{value}: номер части должен быть от 1 до количества частей")
+    return number, count
+
+
+def in_shard(path: str, shard: tuple or None) -> bool:
+    """
+    Распределяет файлы по частям по хэшу пути, поэтому каждый файл попадает ровно в одну часть, а части можно
+    обрабатывать на разных машинах.
+    :param path: путь до файла относительно директории с книгами
+    :param shard: кортеж (K, N) или None
+    :return: True, если файл относится к части K из N или части не заданы
+    """
+    if shard is None:
+        return True
+    number, count = shard
+    return zlib.crc32(path.replace(os.sep, "/").encode("utf-8", "surrogateescape")) % count == number - 1
+
+
+def info_to_record(info_list: list) -> str:
+    """
+    :param info_list: список из автора, названия книги, года выпуска, языка, использованной программы, ссылки и версии
+    :return: запись о книге в формате JSON в одну строку
+    """
+    return json.dumps(dict(zip(RECORD_FIELDS, info_list)), ensure_ascii=False)
+
+
+def record_to_info(line: str) -> list:
+    """
+    :param line: запись о книге в формате JSON
+    :return: список в формате find_info или пустой список, если в записи нет названия книги
+    :raises ValueError: если строка не является объектом JSON, год не является целым числом от -MAX_YEAR до MAX_YEAR
+    или другое поле не является строкой
+    """
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("запись должна быть объектом JSON")
+    for field in RECORD_FIELDS:
+        value = record.get(field)
+        if field != "year" and value is not None and not isinstance(value, str):
+            raise ValueError(f"поле {field} {value!r} не является строкой")
+    if not record.get("title"):
+        return []
+    year = record.get("year")
+    if year is not None and (isinstance(year, bool) or not isinstance(year, int)):
+        raise ValueError(f"год {year!r} не является целым числом")
+    if year is not None and not -MAX_YEAR <= year <= MAX_YEAR:
+        raise ValueError(f"год {year} вне диапазона от {-MAX_YEAR} до {MAX_YEAR}")
+    return [record.get(field) for field in RECORD_FIELDS]
+
+
+@contextmanager
+def open_output(path: str, compress: bool):
+    """
+    Открывает файл для записи записей о книгах. Сжатые файлы можно объединять командой cat, результат остается
+    корректным файлом gzip.
+    :param path: путь до файла или "-" для stdout
+    :param compress: флаг, если True, то записи сжимаются gzip. Файлы с расширением .gz сжимаются всегда
+    :return: контекстный менеджер с текстовым файлом
+    """
+    binary = sys.stdout.buffer if path == "-" else open(path, "wb")
+    stream = gz.GzipFile(fileobj=binary, mode="wb", compresslevel=6) if compress or path.endswith(".gz") else binary
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="\n")
+    try:
+        yield text
+    finally:
+        text.flush()
+        text.detach()
+        if stream is not binary:
+            stream.close()
+        if path == "-":
+            binary.flush()
+        else:
+            binary.close()
+
+
+@contextmanager
+def open_input(path: str):
+    """
+    Открывает файл с записями о книгах. Сжатие gzip определяется по первым байтам файла, поэтому сжатые записи можно
+    передавать и через stdin. Файл открывается в бинарном режиме, чтобы строку с неверной кодировкой можно было
+    пропустить, не прерывая чтение файла.
+    :param path: путь до файла или "-" для stdin
+    :return: контекстный менеджер с бинарным файлом
+    """
+    binary = sys.stdin.buffer if path == "-" else open(path, "rb")
+    stream = gz.GzipFile(fileobj=binary, mode="rb") if binary.peek(2)[:2] == GZIP_MAGIC else binary
+    try:
+        yield stream
+    finally:
+        if stream is not binary:
+            stream.close()
+        if path != "-":
+            binary.close()
+
+
+def read_records(path: str, errors: list):
+    """
+    Читает записи о книгах. Строки, которые не удалось разобрать, в том числе строки с неверной кодировкой UTF-8,
+    добавляются в список ошибок и пропускаются. Если файл поврежден или обрывается, например испорчено сжатие gzip,
+    записи до этого места остаются, а в список ошибок добавляется строка, на которой чтение файла прервано. Файл,
+    который не удалось открыть, тоже добавляется в список ошибок, поэтому остальные файлы загружаются.
+    :param path: путь до файла или "-" для stdin
+    :param errors: список ошибок, ошибка - кортеж (файл:номер строки, описание ошибки)
+    :return: генератор списков в формате find_info
+    """
+    name = "stdin" if path == "-" else path
+    with ExitStack() as stack:
+        try:
+            file = stack.enter_context(open_input(path))
+        except OSError as error:
+            errors.append((name, f"файл не удалось открыть, {describe_error(error)}"))
+            return
+        number = 0
+        while True:
+            number += 1
+            try:
+                line = file.readline()
+            except STREAM_ERRORS as error:
+                errors.append((f"{name}:{number}", f"чтение файла прервано, {describe_error(error)}"))
+                return
+            if not line:
+                return
+            if not line.strip():
+                continue
+            try:
+                info_list = record_to_info(line.decode("utf-8"))
+            except ValueError as error:
+                errors.append((f"{name}:{number}", str(error)))
+                continue
+            if info_list:
+                yield info_list
@@ -0,0 +1,176 @@
+import html
+import re
+import time
+
+HEADER_END = b"</description>"
+CHUNK_SIZE = 8 * 1024
+# Если в книге нет тега </description>, читаем не больше этого количества байт
+MAX_HEADER_SIZE = 1024 * 1024
+DEFAULT_ENCODING = "utf8"
+
+PROLOG_PATTERN = re.compile(rb"""<\?xml[^>]*?encoding\s*=\s*["']([A-Za-z0-9._:-]+)["']""")
+FIELD_PATTERN = re.compile(
+    rb"<(book-title|author|year|lang|program-used|src-url|version)(?:\s[^>]*)?>(.*?)</\1\s*>",
+    re.S,
+)
+NAME_PATTERN = re.compile(rb"<(first-name|middle-name|last-name)(?:\s[^>]*)?>(.*?)</\1\s*>", re.S)
+YEAR_PATTERN = re.compile(r"\d{1,4}")
+# Время поиска информации в описаниях книг и количество прочитанных байт книг [время, процессорное время, байт].
+# Накапливается, только если это список, его устанавливает статистика digger в процессе, выполняющем задачу, чтобы
+# отделить время поиска информации от времени чтения и распаковки файлов
+scan_totals = None
+
+
+class CountingBook:
+    """
+    Обертка открытой книги, которая считает прочитанные байты. Книга читается только до конца описания, поэтому
+    прочитанных байт обычно намного меньше размера файла.
+
+    size: количество прочитанных байт
+    """
+
+    def __init__(self, book):
+        self.book = book
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.book.read(size)
+        self.size += len(data)
+        return data
+
+
+def read_header(book, chunk_size: int = CHUNK_SIZE) -> bytes:
+    """
+    Читает открытую в бинарном режиме книгу фрагментами по chunk_size байт, пока не встретит тег </description>,
+    которым заканчивается описание книги fb2. Строки не декодируются, поэтому ошибки кодировки не приводят к потере
+    информации.
+    :param book: открытая в бинарном режиме книга
+    :param chunk_size: размер читаемого фрагмента в байтах
+    :return: байты от начала книги до тега </description> включительно или все прочитанные байты, если тег не найден
+    """
+    header = bytearray()
+    while len(header) < MAX_HEADER_SIZE:
+        chunk = book.read(chunk_size)
+        if not chunk:
+            break
+        search_from = max(0, len(header) - len(HEADER_END) + 1)
+        header += chunk
+        end_pos = header.find(HEADER_END, search_from)
+        if end_pos != -1:
+            del header[end_pos + len(HEADER_END) :]
+            break
+
+    return bytes(header)
+
+
+def get_encoding(header: bytes) -> str:
+    """
+    Определяет кодировку книги по прологу XML.
+    :param header: начало книги
+    :return: название кодировки или utf8, если кодировка не указана или неизвестна
+    """
+    match = PROLOG_PATTERN.match(header.lstrip(b"\xef\xbb\xbf \t\r\n"))
+    if match is None:
+        return DEFAULT_ENCODING
+
+    encoding = match.group(1).decode("ascii")
+    try:
+        "".encode(encoding)
+    except LookupError:
+        return DEFAULT_ENCODING
+    return encoding
+
+
+def decode_value(value: bytes, encoding: str) -> str:
+    """
+    Декодирует значение тега, раскрывает сущности XML и заменяет последовательности пробельных символов одним
+    пробелом.
+    :param value: значение тега в байтах
+    :param encoding: кодировка книги
+    :return: строка
+    """
+    text = html.unescape(value.decode(encoding, errors="replace"))
+    return " ".join(text.split())
+
+
+def scan_header(header: bytes) -> dict:
+    """
+    За один проход по описанию книги находит первое вхождение каждого интересующего нас тега. Декодируются только
+    найденные значения.
+    :param header: описание книги, полученное функцией read_header
+    :return: словарь, где ключ - название тега, а значение - строка. Для тега author значением является словарь с
+    ключами first-name, middle-name и last-name
+    """
+    encoding = get_encoding(header)
+    fields = {}
+    for match in FIELD_PATTERN.finditer(header):
+        tag = match.group(1).decode("ascii")
+        if tag in fields:
+            continue
+        if tag == "author":
+            names = {}
+            for name_match in NAME_PATTERN.finditer(match.group(2)):
+                names.setdefault(name_match.group(1).decode("ascii"), decode_value(name_match.group(2), encoding))
+            fields[tag] = names
+        else:
+            fields[tag] = decode_value(match.group(2), encoding)
+
+    return fields
+
+
+def parse_year(year: str or None) -> int or None:
+    """
+    Получает год из значения тега year, например из строки "2013 г.".
+    :param year: значение тега year
+    :return: год или None, если в значении нет числа
+    """
+    match = YEAR_PATTERN.search(year or "")
+    return int(match.group()) if match else None
+
+
+def info_from_fields(fields: dict) -> list:
+    """
+    Составляет из найденных тегов список в том же формате, что и функция find_info из digger. Если атрибут не найден,
+    вместо него будет проставлено значение None.
+    :param fields: словарь, полученный функцией scan_header
+    :return: список из автора, названия книги, года выпуска, языка, использованной программы, ссылки и версии. Если
+    название книги не найдено, вернется пустой список
+    """
+    title = fields.get("book-title")
+    if not title:
+        return []
+
+    author = fields.get("author", {})
+    full_name = " ".join(
+        name for name in (author.get(tag) for tag in ("first-name", "middle-name", "last-name")) if name
+    )
+
+    return [
+        full_name or None,
+        title,
+        parse_year(fields.get("year")),
+        fields.get("lang") or None,
+        fields.get("program-used") or None,
+        fields.get("src-url") or None,
+        fields.get("version") or None,
+    ]
+
+
+def scan_book(book, chunk_size: int = CHUNK_SIZE) -> list:
+    """
+    Читает описание открытой в бинарном режиме книги и находит в нем автора, название, год и другую информацию.
+    :param book: открытая в бинарном режиме книга
+    :param chunk_size: размер читаемого фрагмента в байтах
+    :return: список с информацией о книге, если название книги не найдено, вернется пустой список
+    """
+    if scan_totals is None:
+        return info_from_fields(scan_header(read_header(book, chunk_size)))
+
+    book = CountingBook(book)
+    header = read_header(book, chunk_size)
+    wall, cpu = time.perf_counter(), time.process_time()
+    info_list = info_from_fields(scan_header(header))
+    scan_totals[0] += time.perf_counter() - wall
+    scan_totals[1] += time.process_time() - cpu
+    scan_totals[2] += book.size
+    return info_list
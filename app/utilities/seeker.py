@@ -1,8 +1,214 @@
+import csv
+import itertools
+import json
+import operator
+import sys
+
 import click
 import peewee as pw
-from tabulate import tabulate
 
 import db_and_migration.migration.models as md
+from db_and_migration.migration.migration import STATS_DIMENSIONS, rebuild_catalog_stats
+from utilities import cache, snapshot
+from utilities.cli import DefaultGroup
+from utilities.shards import fan_out, parse_shard_names, select_shards, switch_database
+
+
+FIELDS = ["id", "author", "title", "year", "language", "program_used", "src_url", "version"]
+HEADERS = ["Имя автора", "Название", "Год", "Язык", "Использованная программа", "Ссылка", "Версия"]
+OUTPUT_FORMATS = ["table", "csv", "tsv", "jsonl"]
+STATS_HEADERS = {"year": "Год", "language": "Язык", "author": "Имя автора", "program_used": "Использованная программа"}
+
+
+def make_match_expression(text: str) -> str:
+    """
+    Составляет выражение для полнотекстового поиска FTS5: каждое слово запроса ищется по префиксу, а найдены будут
+    книги, в которых есть все слова.
+    :param text: поисковый запрос
+    :return: выражение для MATCH
+    """
+    words = text.split()
+    return " ".join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def prefix_upper_bound(prefix: str) -> str or None:
+    """
+    Находит наименьшую строку, которая больше всех строк, начинающихся с prefix. Условие
+    prefix <= x < prefix_upper_bound(prefix) выбирает строки с префиксом и позволяет SQLite использовать индекс.
+    :param prefix: префикс
+    :return: верхняя граница или None, если ее нет
+    """
+    while prefix:
+        last_char = ord(prefix[-1])
+        if last_char < 0x10FFFF:
+            return prefix[:-1] + chr(last_char + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+def compare(field, ignore_case: bool):
+    """
+    :param field: поле модели
+    :param ignore_case: флаг, если True, то сравнение выполняется с учетом правила NOCASE
+    :return: поле или поле с правилом сравнения NOCASE
+    """
+    return field.collate("NOCASE") if ignore_case else field
+
+
+def prefix_condition(field, prefix: str, ignore_case: bool):
+    """
+    Составляет условие поиска по префиксу в виде диапазона, чтобы SQLite мог использовать индекс по полю.
+    :param field: поле модели
+    :param prefix: префикс
+    :param ignore_case: флаг, если True, то регистр латинских букв не учитывается
+    :return: условие для where
+    """
+    condition = compare(field, ignore_case) >= prefix
+    upper_bound = prefix_upper_bound(prefix)
+    if upper_bound is not None:
+        condition &= compare(field, ignore_case) < upper_bound
+    return condition
+
+
+def build_query(
+    author: str = None,
+    book_name: str = None,
+    year: int = None,
+    year_from: int = None,
+    year_to: int = None,
+    title_prefix: str = None,
+    author_prefix: str = None,
+    ignore_case: bool = False,
+    query: str = None,
+    limit: int = None,
+    after_id: int = None,
+    language: str = None,
+    src_url: str = None,
+):
+    """
+    Составляет запрос для поиска книг по переданным условиям. Условия, которые не переданы, не учитываются.
+    Запрос выбирает id книги, имя автора, название, год, язык, использованную программу, ссылку и версию, поэтому
+    автор не запрашивается отдельно для каждой книги. Книги сортируются по id, а при полнотекстовом поиске по
+    релевантности.
+    :param author: имя автора
+    :param book_name: название книги
+    :param year: год издания книги
+    :param year_from: минимальный год издания книги
+    :param year_to: максимальный год издания книги
+    :param title_prefix: начало названия книги
+    :param author_prefix: начало имени автора
+    :param ignore_case: флаг, если True, то имя автора и название сравниваются без учета регистра латинских букв
+    :param query: полнотекстовый поисковый запрос, результаты сортируются по релевантности
+    :param limit: максимальное количество книг в результате
+    :param after_id: id книги, после которой начинается результат, для постраничного вывода
+    :param language: язык книги
+    :param src_url: ссылка на источник книги
+    :return: запрос peewee
+    """
+    where_expr = []
+    if author:
+        where_expr.append(compare(md.Author.name, ignore_case) == author)
+    if book_name:
+        where_expr.append(compare(md.Book.title, ignore_case) == book_name)
+    if year:
+        where_expr.append(md.Book.year == year)
+    if year_from is not None:
+        where_expr.append(md.Book.year >= year_from)
+    if year_to is not None:
+        where_expr.append(md.Book.year <= year_to)
+    if title_prefix:
+        where_expr.append(prefix_condition(md.Book.title, title_prefix, ignore_case))
+    if author_prefix:
+        where_expr.append(prefix_condition(md.Author.name, author_prefix, ignore_case))
+    if after_id is not None:
+        where_expr.append(md.Book.id > after_id)
+    if language:
+        where_expr.append(md.Book.language == language)
+    if src_url:
+        where_expr.append(md.Book.src_url == src_url)
+
+    book_query = (
+        md.Book.select(
+            md.Book.id,
+            md.Author.name,
+            md.Book.title,
+            md.Book.year,
+            md.Book.language,
+            md.Book.program_used,
+            md.Book.src_url,
+            md.Book.version,
+        )
+        .join(md.Author, pw.JOIN.LEFT_OUTER)
+        .order_by(md.Book.id)
+    )
+
+    if query and query.strip():
+        book_query = (
+            book_query.switch(md.Book)
+            .join(md.BookIndex, on=(md.BookIndex.rowid == md.Book.id))
+            .where(md.BookIndex.match(make_match_expression(query)))
+            .order_by(md.BookIndex.bm25())
+        )
+    if where_expr:
+        book_query = book_query.where(*where_expr)
+    if limit:
+        book_query = book_query.limit(limit)
+
+    return book_query
+
+
+def stats_query(dimension: str, limit: int or None = None):
+    """
+    Составляет запрос к статистике каталога. Запрос читает только строки выбранного измерения, поэтому его время
+    зависит от количества разных значений, а не от количества книг.
+    :param dimension: измерение: year, language, author или program_used
+    :param limit: максимальное количество значений в результате
+    :return: запрос peewee, возвращающий значения и количество книг, отсортированные по убыванию количества книг
+    """
+    stat = md.CatalogStat
+    if dimension == "author":
+        query = stat.select(md.Author.name, stat.books).join(
+            md.Author, pw.JOIN.LEFT_OUTER, on=(md.Author.id == stat.value)
+        )
+    else:
+        query = stat.select(stat.value, stat.books)
+    query = query.where((stat.dimension == dimension) & (stat.books > 0)).order_by(stat.books.desc(), stat.value)
+    if limit:
+        query = query.limit(limit)
+    return query
+
+
+def search_shards(shards: dict, filters: dict):
+    """
+    Ищет книги во всех шардах одновременно и объединяет результаты в один поток: по id, как при поиске в одной базе
+    данных, а при полнотекстовом поиске по месту книги в результате своего шарда. Релевантность bm25 зависит от
+    статистики слов шарда, поэтому оценки разных шардов несравнимы, и результаты чередуются: сначала самые релевантные
+    книги каждого шарда, затем вторые и так далее. Id книг в разных шардах независимы, поэтому книга определяется
+    названием шарда и id.
+    :param shards: словарь, где ключ - название шарда, а значение - путь до его файла
+    :param filters: условия поиска для build_query
+    :return: генератор кортежей (шард, id, автор, название, год, язык, программа, ссылка, версия)
+    """
+    book_query = build_query(**filters)
+    if filters.get("query"):
+        # место книги по релевантности в своем шарде добавляется последним столбцом, по нему объединяются результаты
+        book_query = book_query.select_extend(pw.fn.ROW_NUMBER().over(order_by=[md.BookIndex.bm25()]))
+        key = operator.itemgetter(-1)
+    else:
+        key = operator.itemgetter(0)
+    sql, params = book_query.sql()
+    rows = ((name, *row[: len(FIELDS)]) for name, row in fan_out(shards, sql, params, key))
+    return itertools.islice(rows, filters["limit"]) if filters.get("limit") else rows
+
+
+def explain(query) -> None:
+    """
+    Выводит план выполнения запроса SQLite, по которому видно, какие индексы используются.
+    :param query: запрос peewee
+    """
+    sql, params = query.sql()
+    plan = md.db.execute_sql(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    make_table([[row[0], row[1], row[3]] for row in plan], ["id", "parent", "Шаг плана"])
 
 
 def make_table(table: list, headers: list) -> None:
@@ -11,10 +217,74 @@ def make_table(table: list, headers: list) -> None:
     :param table: подготовленный формат таблицы
     :param headers: загаловки таблицы
     """
+    from tabulate import tabulate
+
     print(tabulate(table, headers=headers, tablefmt="github"))
 
 
-@click.command()
+def write_delimited(rows, fields: list, delimiter: str) -> None:
+    """
+    Построчно выводит книги в stdout в формате csv или tsv, первой строкой выводятся названия полей.
+    :param rows: итерируемый объект со строками результата
+    :param fields: названия полей
+    :param delimiter: разделитель полей
+    """
+    writer = csv.writer(sys.stdout, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow(row)
+
+
+def write_jsonl(rows, fields: list) -> None:
+    """
+    Построчно выводит книги в stdout в формате JSON Lines, каждая книга - отдельный объект JSON.
+    :param rows: итерируемый объект со строками результата
+    :param fields: названия полей
+    """
+    for row in rows:
+        sys.stdout.write(json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n")
+
+
+def write_rows(rows, identifier: bool, output_format: str, with_shard: bool = False) -> None:
+    """
+    Выводит книги в выбранном формате. Форматы csv, tsv и jsonl выводят книги по мере чтения из базы данных, не
+    собирая результат в память, формат table собирает результат целиком, чтобы выровнять столбцы.
+    :param rows: итерируемый объект с кортежами (id, автор, название, год, язык, программа, ссылка, версия)
+    :param identifier: флаг, если True, то выводятся только id книг
+    :param output_format: формат вывода: table, csv, tsv или jsonl
+    :param with_shard: флаг, если True, то кортежи начинаются с названия шарда, которое выводится первым полем
+    """
+    shard_fields = ["shard"] if with_shard else []
+    shard_headers = ["Шард"] if with_shard else []
+    if identifier:
+        fields = shard_fields + FIELDS[:1]
+        rows = (row[: len(fields)] for row in rows)
+    else:
+        fields = shard_fields + FIELDS
+
+    if output_format == "csv":
+        write_delimited(rows, fields, ",")
+    elif output_format == "tsv":
+        write_delimited(rows, fields, "\t")
+    elif output_format == "jsonl":
+        write_jsonl(rows, fields)
+    elif identifier:
+        make_table([list(row) for row in rows], shard_headers + ["id книги"])
+    else:
+        # id книги в таблицу не выводится
+        skip = len(shard_fields)
+        make_table([[*row[:skip], *row[skip + 1 :]] for row in rows], shard_headers + HEADERS)
+
+
+@click.group(cls=DefaultGroup, default_command="search")
+def seeker():
+    """
+    Команды для поиска книг. Если команда не указана, выполняется search, поэтому "seeker -a Автор" и
+    "seeker search -a Автор" работают одинаково.
+    """
+
+
+@seeker.command()
 @click.option(
     "--author",
     "-a",
@@ -34,63 +304,255 @@ def make_table(table: list, headers: list) -> None:
     is_flag=True,
     help="Если этот флаг есть, то будут получены id книг, иначе все поля",
 )
-def seeker(author, book_name, year, identifier):
+@click.option(
+    "--query",
+    "-q",
+    type=str,
+    help="""Полнотекстовый поиск по названию, имени автора и языку. Регистр не учитывается, каждое слово ищется по
+    префиксу, результаты сортируются по релевантности""",
+)
+@click.option("--limit", "-l", type=click.IntRange(min=1), help="Максимальное количество книг в результате")
+@click.option("--year-from", type=int, help="Минимальный год издания книги")
+@click.option("--year-to", type=int, help="Максимальный год издания книги")
+@click.option("--title-prefix", type=str, help="Начало названия книги")
+@click.option("--author-prefix", type=str, help="Начало имени автора")
+@click.option(
+    "--ignore-case",
+    "-i",
+    is_flag=True,
+    help="""Если этот флаг есть, то имя автора и название книги, в том числе их начало, сравниваются без учета
+    регистра латинских букв""",
+)
+@click.option(
+    "--explain",
+    "show_plan",
+    is_flag=True,
+    help="Если этот флаг есть, то вместо книг будет выведен план выполнения запроса SQLite",
+)
+@click.option(
+    "--after-id",
+    type=int,
+    help="""id книги, после которой начинается результат. Вместе с --limit позволяет получать результат по страницам:
+    для следующей страницы нужно передать id последней книги текущей страницы""",
+)
+@click.option(
+    "--format",
+    "-f",
+    "output_format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="table",
+    show_default=True,
+    help="Формат вывода. csv, tsv и jsonl выводят книги сразу по мере чтения из базы данных и содержат id книг",
+)
+@click.option(
+    "--cache",
+    "use_cache",
+    is_flag=True,
+    help="""Если этот флаг есть, то результат берется из кэша, а если его там нет, сохраняется в кэш. Кэш
+    сбрасывается, когда digger или wiper изменяют книги""",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=1),
+    default=cache.DEFAULT_CACHE_SIZE,
+    show_default=True,
+    help="Максимальное количество результатов в кэше, давно не использовавшиеся результаты удаляются",
+)
+@click.option(
+    "--cache-stats",
+    is_flag=True,
+    help="Если этот флаг есть, то вместо книг будет выведена статистика кэша",
+)
+@click.option(
+    "--no-snapshot",
+    is_flag=True,
+    help="Если этот флаг есть, то книги ищутся в базе данных, даже если есть актуальный снимок каталога",
+)
+@click.option(
+    "--db-shard",
+    multiple=True,
+    callback=parse_shard_names,
+    help="""Название шарда каталога, в котором ищутся книги, вместо основной базы данных. Можно указать несколько
+    раз, как и для --all-shards, релевантность тогда считается в каждом шарде отдельно""",
+)
+@click.option(
+    "--all-shards",
+    is_flag=True,
+    help="""Если этот флаг есть, то книги ищутся во всех шардах. Релевантность полнотекстового поиска считается в
+    каждом шарде отдельно, поэтому результаты шардов чередуются по месту книги в своем шарде""",
+)
+def search(
+    author,
+    book_name,
+    year,
+    identifier,
+    query,
+    limit,
+    year_from,
+    year_to,
+    title_prefix,
+    author_prefix,
+    ignore_case,
+    show_plan,
+    after_id,
+    output_format,
+    use_cache,
+    cache_size,
+    cache_stats,
+    no_snapshot,
+    db_shard,
+    all_shards,
+):
     """
     Функция для поиска книг по их автору, названию или году выпуска. Если опциональные параметры не указаны, то
-    будет выведена вся информация.
+    будет выведена вся информация. Если снимок каталога актуален, книги ищутся в нем, иначе в базе данных. Если
+    указано несколько шардов, они опрашиваются одновременно, а результаты объединяются в общем порядке.
     """
-    where_expr = []
+    shards = select_shards(db_shard, all_shards)
+    if len(shards) == 1:
+        switch_database(*shards.values())
+
+    if cache_stats:
+        make_table([list(cache.stats().values())], ["Результатов", "Попаданий", "Промахов", "Поколение"])
+        return
+
+    if query and after_id is not None:
+        raise click.UsageError("--after-id нельзя использовать с --query, результаты поиска сортируются не по id")
+
+    filters = {
+        "author": author,
+        "book_name": book_name,
+        "year": year,
+        "year_from": year_from,
+        "year_to": year_to,
+        "title_prefix": title_prefix,
+        "author_prefix": author_prefix,
+        "ignore_case": ignore_case,
+        "query": query,
+        "limit": limit,
+        "after_id": after_id,
+    }
+
+    if len(shards) > 1:
+        if after_id is not None or show_plan or use_cache:
+            raise click.UsageError("--after-id, --explain и --cache нельзя использовать с несколькими шардами")
+        write_rows(search_shards(shards, filters), identifier, output_format, with_shard=True)
+        return
+
+    use_cache = use_cache and not show_plan
+    if use_cache:
+        key = cache.make_key(filters)
+        rows = cache.lookup(key)
+        if rows is not None:
+            write_rows(iter(rows), identifier, output_format)
+            return
+        generation = cache.current_generation()
+
+    book_snapshot = None if show_plan or no_snapshot else snapshot.fresh_snapshot(filters)
+    if book_snapshot is not None:
+        rows = book_snapshot.search(filters)
+        if use_cache:
+            rows = cache.caching(rows, key, generation, cache_size)
+        write_rows(rows, identifier, output_format)
+        return
+
     with md.db:
-        if author:
-            where_expr.append(md.Author.name == author)
-        if book_name:
-            where_expr.append(md.Book.title == book_name)
-        if year:
-            where_expr.append(md.Book.year == year)
-
-        if where_expr:
-            query = (
-                md.Book.select()
-                .join(md.Author, pw.JOIN.LEFT_OUTER)
-                .where(*where_expr)
-            )
-        else:
-            query = md.Book.select().join(md.Author, pw.JOIN.LEFT_OUTER)
+        book_query = build_query(**filters)
+        if show_plan:
+            explain(book_query)
+            return
+
+        rows = book_query.tuples().iterator()
+        if use_cache:
+            rows = cache.caching(rows, key, generation, cache_size)
+        write_rows(rows, identifier, output_format)
+
+
+@seeker.command("snapshot")
+def build_snapshot():
+    """
+    Строит снимок каталога рядом с базой данных. Снимок отображается в память, поэтому seeker ищет в нем книги без
+    запросов к базе данных. После изменения книг снимок устаревает, и seeker ищет в базе данных, пока digger или эта
+    команда не обновят снимок.
+    """
+    print(f"Книг в снимке каталога: {snapshot.build_snapshot()}")
 
-    table = []
 
-    for row in query:
-        if identifier:
-            table.append([row.id])
+@seeker.command("stats")
+@click.argument("dimension", type=click.Choice(list(STATS_DIMENSIONS)), required=False)
+@click.option(
+    "--rebuild",
+    is_flag=True,
+    help="Если этот флаг есть, то статистика пересчитывается по таблице книг",
+)
+@click.option("--limit", "-l", type=click.IntRange(min=1), help="Максимальное количество значений в результате")
+@click.option(
+    "--format",
+    "-f",
+    "output_format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="table",
+    help="Формат вывода: table, csv, tsv или jsonl",
+)
+def show_stats(dimension, rebuild, limit, output_format):
+    """
+    Выводит количество книг для каждого значения измерения DIMENSION: year, language, author или program_used.
+    Статистика хранится в отдельной таблице, которую digger и wiper обновляют в тех же транзакциях, что и книги.
+    """
+    if not dimension and not rebuild:
+        raise click.UsageError("Укажите измерение или --rebuild")
+
+    with md.db:
+        if rebuild:
+            rebuild_catalog_stats(md.db)
+            click.echo("Статистика каталога пересчитана", err=True)
+        if not dimension:
+            return
+
+        rows = stats_query(dimension, limit).tuples().iterator()
+        if output_format == "csv":
+            write_delimited(rows, [dimension, "books"], ",")
+        elif output_format == "tsv":
+            write_delimited(rows, [dimension, "books"], "\t")
+        elif output_format == "jsonl":
+            write_jsonl(rows, [dimension, "books"])
         else:
-            name = row.author_id.name if row.author_id is not None else None
-            table.append(
-                [
-                    name,
-                    row.title,
-                    row.year,
-                    row.language,
-                    row.program_used,
-                    row.src_url,
-                    row.version,
-                ]
-            )
+            make_table([list(row) for row in rows], [STATS_HEADERS[dimension], "Количество книг"])
 
-    if identifier:
-        headers = ["id книги"]
-        make_table(table, headers)
 
-    else:
-        headers = [
-            "Имя автора",
-            "Название",
-            "Год",
-            "Язык",
-            "Использованная программа",
-            "Ссылка",
-            "Версия",
-        ]
-        make_table(table, headers)
+@seeker.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="Адрес, на котором работает сервис")
+@click.option("--port", "-p", type=click.IntRange(1, 65535), default=8080, show_default=True, help="Порт сервиса")
+@click.option(
+    "--workers",
+    "-w",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Количество потоков, каждый со своим открытым подключением к базе данных",
+)
+@click.option(
+    "--max-pending",
+    type=click.IntRange(min=1),
+    default=64,
+    show_default=True,
+    help="Максимальное количество одновременных запросов поиска, на остальные сервис отвечает кодом 503",
+)
+@click.option(
+    "--max-limit",
+    type=click.IntRange(min=1),
+    default=1000,
+    show_default=True,
+    help="Максимальное количество книг в одном ответе",
+)
+def serve(host, port, workers, max_pending, max_limit):
+    """
+    Запускает HTTP сервис поиска книг. GET /search принимает те же условия поиска, что и команда search, и возвращает
+    книги в формате JSON, GET /metrics возвращает количество запросов и процентили времени ответа.
+    """
+    from utilities.server import run
+
+    run(host, port, workers, max_pending, max_limit)
 
 
 if __name__ == "__main__":
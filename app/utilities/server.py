@@ -0,0 +1,324 @@
+import asyncio
+import collections
+import concurrent.futures
+import json
+import math
+import time
+import urllib.parse
+
+import peewee as pw
+
+import db_and_migration.migration.models as md
+from utilities.seeker import FIELDS, build_query
+
+# Параметры запроса /search и функции для их преобразования
+SEARCH_PARAMS = {
+    "author": str,
+    "book_name": str,
+    "year": int,
+    "year_from": int,
+    "year_to": int,
+    "title_prefix": str,
+    "author_prefix": str,
+    "ignore_case": lambda value: value.lower() in ("1", "true", "yes"),
+    "query": str,
+    "limit": int,
+    "after_id": int,
+    "language": str,
+    "src_url": str,
+}
+# Сколько последних запросов учитывается в процентилях времени ответа
+LATENCY_WINDOW = 10_000
+# Сколько секунд ждать следующего запроса в открытом соединении
+KEEP_ALIVE_TIMEOUT = 30
+MAX_REQUEST_LINE = 8192
+# Ограничения заголовков запроса: количество и общий размер в байтах
+MAX_HEADERS = 100
+MAX_HEADERS_SIZE = 64 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class RequestError(Exception):
+    """
+    Ошибка в запросе клиента, которая возвращается ответом с кодом status.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class LatencyMetrics:
+    """
+    Метрики сервиса: количество запросов по кодам ответа, количество выполняющихся запросов и процентили времени
+    ответа по последним LATENCY_WINDOW запросам.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.started = time.monotonic()
+        self.statuses = collections.Counter()
+        self.in_flight = 0
+        self._latencies = collections.deque(maxlen=window)
+
+    def record(self, status: int, seconds: float) -> None:
+        """
+        :param status: код ответа
+        :param seconds: время ответа в секундах
+        """
+        self.statuses[status] += 1
+        self._latencies.append(seconds)
+
+    def summary(self) -> dict:
+        """
+        :return: словарь с метриками
+        """
+        latencies = sorted(self._latencies)
+
+        def percentile(percent: float) -> float or None:
+            if not latencies:
+                return None
+            return round(latencies[max(0, math.ceil(percent / 100 * len(latencies)) - 1)] * 1000, 3)
+
+        return {
+            "uptime_seconds": round(time.monotonic() - self.started, 1),
+            "requests": sum(self.statuses.values()),
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "in_flight": self.in_flight,
+            "latency_ms": {
+                "window": len(latencies),
+                "p50": percentile(50),
+                "p90": percentile(90),
+                "p99": percentile(99),
+                "max": percentile(100),
+            },
+        }
+
+
+def parse_search_params(query_string: str, max_limit: int) -> dict:
+    """
+    Преобразует параметры запроса /search в условия поиска для seeker.build_query.
+    :param query_string: строка параметров запроса
+    :param max_limit: максимальное количество книг в ответе, используется, если limit не указан или больше
+    :return: словарь с условиями поиска
+    :raises RequestError: если параметр неизвестен или его значение неверно, в том числе если limit меньше 1
+    """
+    filters = {}
+    for name, values in urllib.parse.parse_qs(query_string).items():
+        if name not in SEARCH_PARAMS:
+            raise RequestError(400, f"неизвестный параметр {name}")
+        try:
+            filters[name] = SEARCH_PARAMS[name](values[-1])
+        except ValueError:
+            raise RequestError(400, f"неверное значение параметра {name}")
+
+    if filters.get("query") and filters.get("after_id") is not None:
+        raise RequestError(400, "after_id нельзя использовать с query, результаты поиска сортируются не по id")
+    if filters.get("limit", 1) < 1:
+        raise RequestError(400, "limit должен быть не меньше 1")
+    filters["limit"] = min(filters.get("limit", max_limit), max_limit)
+    return filters
+
+
+def open_read_connection() -> None:
+    """
+    Открывает подключение к базе данных в текущем потоке пула. Подключения peewee хранятся отдельно для каждого потока,
+    поэтому каждый поток пула держит свое подключение открытым все время работы сервиса и не читает страницы базы
+    данных заново для каждого запроса. Подключение открывается только для чтения.
+    """
+    md.db.connect(reuse_if_open=True)
+    md.db.execute_sql("PRAGMA query_only = 1")
+
+
+def run_search(filters: dict) -> list:
+    """
+    Выполняет поиск в потоке пула на уже открытом подключении.
+    :param filters: условия поиска для seeker.build_query
+    :return: список словарей с информацией о книгах
+    """
+    md.db.connect(reuse_if_open=True)
+    with md.db.atomic():
+        rows = build_query(**filters).tuples()
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+
+class SearchServer:
+    """
+    HTTP сервис поиска книг на asyncio. Запросы принимаются в цикле событий, а поиск выполняется в пуле из workers
+    потоков, у каждого из которых свое постоянно открытое подключение к базе данных. Если запросов, ожидающих пул,
+    больше max_pending, сервис отвечает кодом 503, чтобы очередь не росла без ограничений.
+
+    GET /search?author=...&year=...: поиск с теми же условиями, что у seeker, ответ {"books": [...], "count": n}
+    GET /metrics: метрики сервиса
+    GET /health: {"status": "ok"}
+
+    workers: количество потоков с подключениями к базе данных
+    max_pending: максимальное количество одновременно выполняющихся и ожидающих запросов поиска
+    max_limit: максимальное количество книг в одном ответе
+    metrics: метрики сервиса
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 64, max_limit: int = 1000):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_limit = max_limit
+        self.metrics = LatencyMetrics()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="seeker", initializer=open_read_connection
+        )
+
+    def close(self) -> None:
+        """
+        Останавливает пул потоков.
+        """
+        self._executor.shutdown(wait=True)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Обрабатывает запросы одного соединения, пока клиент не закроет его или не истечет время ожидания.
+        """
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_TIMEOUT)
+                    if not request_line:
+                        break
+                    headers = await self.read_headers(reader)
+                except asyncio.TimeoutError:
+                    break
+                except (RequestError, ValueError) as error:
+                    # readline выбрасывает ValueError, если строка длиннее лимита StreamReader
+                    if not isinstance(error, RequestError):
+                        error = RequestError(400, "слишком длинная строка запроса или заголовка")
+                    self.metrics.record(error.status, 0.0)
+                    self.write_response(writer, error.status, {"error": str(error)}, keep_alive=False)
+                    await writer.drain()
+                    break
+
+                start = time.perf_counter()
+                status, body = await self.respond(request_line)
+                self.metrics.record(status, time.perf_counter() - start)
+
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self.write_response(writer, status, body, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def read_headers(reader: asyncio.StreamReader) -> dict:
+        """
+        :param reader: поток запроса
+        :return: словарь заголовков запроса с названиями в нижнем регистре
+        :raises RequestError: если заголовков больше MAX_HEADERS или их размер больше MAX_HEADERS_SIZE байт
+        """
+        headers = {}
+        count = size = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            count += 1
+            size += len(line)
+            if count > MAX_HEADERS or size > MAX_HEADERS_SIZE:
+                raise RequestError(400, "слишком много заголовков")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    async def respond(self, request_line: bytes) -> tuple:
+        """
+        Ошибки базы данных и другие непредвиденные ошибки возвращаются ответом с кодом 500, чтобы клиент получил ответ,
+        а ошибка попала в метрики.
+        :param request_line: первая строка запроса
+        :return: кортеж (код ответа, тело ответа в виде словаря)
+        """
+        try:
+            if len(request_line) > MAX_REQUEST_LINE:
+                raise RequestError(400, "слишком длинный запрос")
+            method, target, _ = request_line.decode("utf-8", "replace").split(" ", 2)
+            if method != "GET":
+                raise RequestError(405, "поддерживается только GET")
+
+            url = urllib.parse.urlsplit(target)
+            if url.path == "/search":
+                return 200, await self.search(parse_search_params(url.query, self.max_limit))
+            if url.path == "/metrics":
+                return 200, self.metrics.summary()
+            if url.path == "/health":
+                return 200, {"status": "ok"}
+            raise RequestError(404, f"неизвестный путь {url.path}")
+        except RequestError as error:
+            return error.status, {"error": str(error)}
+        except ValueError:
+            return 400, {"error": "неверная строка запроса"}
+        except pw.DatabaseError as error:
+            return 500, {"error": f"ошибка базы данных: {error}"}
+        except Exception as error:
+            return 500, {"error": f"внутренняя ошибка сервиса: {type(error).__name__}"}
+
+    async def search(self, filters: dict) -> dict:
+        """
+        Выполняет поиск в пуле потоков, не блокируя цикл событий.
+        :param filters: условия поиска для seeker.build_query
+        :return: тело ответа
+        """
+        if self.metrics.in_flight >= self.max_pending:
+            raise RequestError(503, "сервис перегружен, повторите запрос позже")
+
+        self.metrics.in_flight += 1
+        try:
+            books = await asyncio.get_running_loop().run_in_executor(self._executor, run_search, filters)
+        finally:
+            self.metrics.in_flight -= 1
+        return {"books": books, "count": len(books)}
+
+    @staticmethod
+    def write_response(writer: asyncio.StreamWriter, status: int, body: dict, keep_alive: bool) -> None:
+        """
+        Записывает ответ в формате JSON.
+        """
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + data)
+
+
+async def serve_forever(server: SearchServer, host: str, port: int) -> None:
+    """
+    Запускает сервис и обрабатывает запросы до остановки.
+    :param server: сервис поиска
+    :param host: адрес
+    :param port: порт
+    """
+    listener = await asyncio.start_server(server.handle_connection, host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+def run(host: str, port: int, workers: int, max_pending: int, max_limit: int) -> None:
+    """
+    Запускает сервис поиска и останавливает его по Ctrl+C.
+    """
+    server = SearchServer(workers, max_pending, max_limit)
+    print(f"Сервис поиска запущен на http://{host}:{port}, потоков: {workers}")
+    try:
+        asyncio.run(serve_forever(server, host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,342 @@
+import glob
+import heapq
+import os
+import queue
+import re
+import threading
+from contextlib import contextmanager
+
+import click
+import peewee as pw
+
+import db_and_migration.migration.models as md
+from connection import busy_timeout, connection, profiles, use_database
+from db_and_migration.migration.migration import upgrade
+from utilities import cache
+
+SHARD_NAME = re.compile(r"[\w-]+")
+# Файл шарда: название шарда и номер версии. Новая версия шарда строится в файле с суффиксом .building и становится
+# видимой после переименования
+SHARD_FILE = re.compile(r"(?P<name>[\w-]+)\.(?P<version>\d+)\.db")
+# Файлы рядом с базой данных, которые относятся к ней и переименовываются вместе с ней
+COMPANION_SUFFIXES = ["_cache.db", "_snapshot.bin"]
+# Количество строк, которые поток чтения шарда передает за один раз, и количество таких частей в очереди
+FAN_OUT_BATCH = 500
+FAN_OUT_QUEUE = 4
+
+
+def shards_dir(database_path: str) -> str:
+    """
+    :param database_path: путь до основной базы данных
+    :return: путь до директории с шардами, которая лежит рядом с основной базой данных
+    """
+    root, _ = os.path.splitext(database_path)
+    return f"{root}_shards"
+
+
+def parse_shard_names(ctx, param, value: str or tuple or None) -> str or tuple or None:
+    """
+    Проверяет название шарда или названия шардов для опции click.
+    :param value: название шарда, кортеж названий шардов или None, если опция не указана
+    :return: название шарда или кортеж названий шардов без повторов
+    """
+    names = (value,) if isinstance(value, str) else value or ()
+    for name in names:
+        if not SHARD_NAME.fullmatch(name):
+            raise click.BadParameter(f"{name}: название шарда может содержать только буквы, цифры, _ и -")
+    return value if isinstance(value, str) or value is None else tuple(dict.fromkeys(value))
+
+
+def shard_versions(directory: str) -> dict:
+    """
+    :param directory: директория с шардами
+    :return: словарь, где ключ - название шарда, а значение - отсортированный список номеров его готовых версий
+    """
+    versions = {}
+    for file_name in os.listdir(directory) if os.path.isdir(directory) else []:
+        match = SHARD_FILE.fullmatch(file_name)
+        if match:
+            versions.setdefault(match["name"], []).append(int(match["version"]))
+    return {name: sorted(numbers) for name, numbers in sorted(versions.items())}
+
+
+def shard_file(directory: str, name: str, version: int, building: bool = False) -> str:
+    """
+    :param directory: директория с шардами
+    :param name: название шарда
+    :param version: номер версии шарда
+    :param building: флаг, если True, то возвращается путь до строящейся версии
+    :return: путь до файла версии шарда
+    """
+    return os.path.join(directory, f"{name}.{version}{'.building' if building else ''}.db")
+
+
+def current_shard_file(name: str, database_path: str = None) -> str or None:
+    """
+    :param name: название шарда
+    :param database_path: путь до основной базы данных
+    :return: путь до последней готовой версии шарда или None, если шарда нет
+    """
+    directory = shards_dir(database_path or connection.database)
+    versions = shard_versions(directory).get(name)
+    return shard_file(directory, name, versions[-1]) if versions else None
+
+
+def select_shards(names: tuple, all_shards: bool) -> dict:
+    """
+    :param names: названия шардов
+    :param all_shards: флаг, если True, то выбираются все шарды
+    :return: словарь, где ключ - название шарда, а значение - путь до его последней версии. Пустой, если шарды не
+    указаны
+    :raises click.ClickException: если шарда нет
+    """
+    directory = shards_dir(connection.database)
+    versions = shard_versions(directory)
+    if all_shards:
+        if not versions:
+            raise click.ClickException(f"В директории {directory} нет шардов")
+        names = tuple(versions)
+    missing = [name for name in names if name not in versions]
+    if missing:
+        raise click.ClickException(f"Шарды не найдены: {', '.join(missing)}")
+    return {name: shard_file(directory, name, versions[name][-1]) for name in names}
+
+
+def switch_database(path: str) -> None:
+    """
+    Переключает модели и кэш текущего процесса на другой файл базы данных.
+    :param path: путь до базы данных
+    """
+    connection.close()
+    use_database(path)
+    cache.cache_db.init(None)
+
+
+def shard_lock(directory: str, name: str) -> str:
+    """
+    :param directory: директория с шардами
+    :param name: название шарда
+    :return: путь до файла блокировки, который существует, пока шард перестраивается
+    """
+    return os.path.join(directory, f"{name}.lock")
+
+
+def check_not_rebuilding(name: str) -> None:
+    """
+    Проверяет, что шард сейчас не перестраивается. Книги, записанные в предыдущую версию шарда во время перестройки,
+    пропали бы после замены версии, поэтому запись в шард во время перестройки запрещена.
+    :param name: название шарда
+    :raises click.ClickException: если шард перестраивается
+    """
+    lock = shard_lock(shards_dir(connection.database), name)
+    if os.path.exists(lock):
+        raise click.ClickException(
+            f"Шард {name} перестраивается, запись в него невозможна. Если перестройка прервана, удалите файл {lock}"
+        )
+
+
+def shard_generation(path: str) -> int or None:
+    """
+    :param path: путь до файла шарда
+    :return: поколение каталога шарда или None, если в шарде нет таблицы поколения
+    """
+    database = pw.SqliteDatabase(path, timeout=busy_timeout / 1000)
+    try:
+        with database.connection_context():
+            row = database.execute_sql("SELECT value FROM catalog_generation").fetchone()
+    except pw.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def use_shard(name: str, create: bool = False) -> str:
+    """
+    Переключает модели текущего процесса на последнюю версию шарда для записи.
+    :param name: название шарда
+    :param create: флаг, если True, то несуществующий шард создается, иначе это ошибка
+    :return: путь до файла шарда
+    :raises click.ClickException: если шарда нет и create равен False или шард перестраивается
+    """
+    check_not_rebuilding(name)
+    path = current_shard_file(name)
+    if path is None:
+        if not create:
+            raise click.ClickException(f"Шард {name} не найден")
+        directory = shards_dir(connection.database)
+        os.makedirs(directory, exist_ok=True)
+        path = shard_file(directory, name, 1)
+        switch_database(path)
+        with md.db.connection_context():
+            upgrade(md.db)
+        return path
+
+    switch_database(path)
+    return path
+
+
+def remove_files(pattern: str) -> None:
+    """
+    Удаляет файлы, подходящие под шаблон glob. Файлы, которые не удалось удалить, например открытые другим процессом
+    в Windows, пропускаются и удаляются при следующей перестройке шарда.
+    :param pattern: шаблон glob
+    """
+    for path in glob.glob(pattern):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def rebuilding_shard(name: str):
+    """
+    Контекстный менеджер, внутри которого модели подключены к новой пустой версии шарда. Версия строится в отдельном
+    файле, поэтому seeker продолжает читать предыдущую версию, а разные шарды строятся одновременно разными процессами
+    без общей блокировки записи. После успешного выхода новая версия становится видимой одним переименованием файла, а
+    предыдущие версии удаляются. Если внутри возникла ошибка, строящаяся версия удаляется.
+    Пока шард перестраивается, существует файл блокировки шарда: вторая перестройка и запись в шард на месте
+    отклоняются. Если предыдущая версия все же изменилась во время перестройки, например запись началась раньше
+    перестройки, новая версия не заменяет ее, чтобы записанные книги не пропали.
+    :param name: название шарда
+    :return: контекстный менеджер с путем до строящегося файла
+    :raises click.ClickException: если шард уже перестраивается или его предыдущая версия изменилась во время
+    перестройки
+    """
+    main_path = connection.database
+    directory = shards_dir(main_path)
+    os.makedirs(directory, exist_ok=True)
+    lock = shard_lock(directory, name)
+    try:
+        descriptor = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise click.ClickException(
+            f"Шард {name} уже перестраивается. Если перестройка прервана, удалите файл {lock}"
+        ) from None
+    with os.fdopen(descriptor, "w") as file:
+        file.write(str(os.getpid()))
+
+    try:
+        previous = shard_versions(directory).get(name, [])
+        previous_path = shard_file(directory, name, previous[-1]) if previous else None
+        previous_generation = shard_generation(previous_path) if previous else None
+        version = (previous[-1] if previous else 0) + 1
+        building = shard_file(directory, name, version, building=True)
+        building_root, _ = os.path.splitext(building)
+        remove_files(os.path.join(directory, f"{glob.escape(name)}.*.building*"))
+
+        switch_database(building)
+        try:
+            with md.db.connection_context():
+                upgrade(md.db)
+            yield building
+            connection.close()
+            # журнал WAL удаляется при закрытии последнего подключения, содержимое записывается на диск до
+            # переименования, так как профиль массовой загрузки не ждет записи на диск
+            with open(building, "rb+") as file:
+                os.fsync(file.fileno())
+            if previous and shard_generation(previous_path) != previous_generation:
+                raise click.ClickException(
+                    f"Шард {name} изменился во время перестройки, новая версия не сохранена, повторите перестройку"
+                )
+        except BaseException:
+            connection.close()
+            remove_files(f"{glob.escape(building_root)}*")
+            use_database(main_path)
+            cache.cache_db.init(None)
+            raise
+
+        replace_version(directory, name, version, previous)
+    finally:
+        os.remove(lock)
+    switch_database(shard_file(directory, name, version))
+
+
+def replace_version(directory: str, name: str, version: int, previous: list) -> None:
+    """
+    Делает построенную версию шарда видимой одним переименованием файла и удаляет предыдущие версии.
+    :param directory: директория с шардами
+    :param name: название шарда
+    :param version: номер построенной версии
+    :param previous: номера предыдущих версий
+    """
+    building_root, _ = os.path.splitext(shard_file(directory, name, version, building=True))
+    final = shard_file(directory, name, version)
+    final_root, _ = os.path.splitext(final)
+    for suffix in COMPANION_SUFFIXES:
+        if os.path.exists(building_root + suffix):
+            os.replace(building_root + suffix, final_root + suffix)
+    os.replace(building_root + ".db", final)
+    for old in previous:
+        old_root, _ = os.path.splitext(shard_file(directory, name, old))
+        remove_files(f"{glob.escape(old_root)}.db*")
+        remove_files(f"{glob.escape(old_root)}_*")
+
+
+def read_shard(path: str, sql: str, params: tuple, rows: queue.Queue, stop: threading.Event) -> None:
+    """
+    Выполняет запрос к шарду и передает результат в очередь частями. В конце в очередь передается None, а при ошибке
+    - исключение.
+    :param path: путь до файла шарда
+    :param sql: запрос SQL
+    :param params: параметры запроса
+    :param rows: очередь для частей результата
+    :param stop: событие, после которого чтение прекращается, так как результат больше не нужен
+    """
+    database = pw.SqliteDatabase(path, pragmas=profiles["default"], timeout=busy_timeout / 1000)
+    try:
+        with database.connection_context():
+            cursor = database.execute_sql(sql, params)
+            while not stop.is_set():
+                part = cursor.fetchmany(FAN_OUT_BATCH)
+                if not part:
+                    break
+                rows.put(part)
+        rows.put(None)
+    except Exception as error:
+        rows.put(error)
+
+
+def fan_out(shards: dict, sql: str, params: tuple, key):
+    """
+    Выполняет один и тот же запрос ко всем шардам одновременно, каждый шард в своем потоке, и объединяет
+    отсортированные результаты шардов в один отсортированный поток. Потоки читают результат частями через
+    ограниченные очереди, поэтому память не зависит от размера результата.
+    :param shards: словарь, где ключ - название шарда, а значение - путь до его файла
+    :param sql: запрос SQL, результат которого отсортирован по key
+    :param params: параметры запроса
+    :param key: функция от строки результата, по которой отсортирован результат
+    :return: генератор кортежей (название шарда, строка результата)
+    """
+    stop = threading.Event()
+    queues = []
+    threads = []
+    for name, path in shards.items():
+        rows = queue.Queue(FAN_OUT_QUEUE)
+        thread = threading.Thread(target=read_shard, args=(path, sql, params, rows, stop), daemon=True)
+        thread.start()
+        queues.append((name, rows))
+        threads.append(thread)
+
+    def shard_rows(name: str, rows: queue.Queue):
+        while True:
+            part = rows.get()
+            if part is None:
+                return
+            if isinstance(part, Exception):
+                raise part
+            for row in part:
+                yield name, row
+
+    try:
+        yield from heapq.merge(*(shard_rows(name, rows) for name, rows in queues), key=lambda item: key(item[1]))
+    finally:
+        stop.set()
+        for _, rows in queues:
+            # освобождает место в очереди, чтобы поток, ожидающий записи, увидел событие stop и завершился
+            while True:
+                try:
+                    rows.get_nowait()
+                except queue.Empty:
+                    break
+        for thread in threads:
+            thread.join(timeout=1)
@@ -0,0 +1,412 @@
+import mmap
+import os
+import struct
+from array import array
+
+import peewee as pw
+
+import db_and_migration.migration.models as md
+from connection import connection
+from utilities import cache
+
+# Версия 02: год хранится 64-битным числом, снимки версии 01 не открываются и строятся заново
+MAGIC = b"LTSNAP02"
+# Заголовок: метка формата, поколение каталога, количество книг, количество строк, размер строк в байтах
+HEADER = struct.Struct("=8sqqqq")
+# Столбцы книг в порядке записи в файл. Книги хранятся по возрастанию id, строки заменены номерами в общем
+# отсортированном списке строк, поэтому порядок номеров совпадает с порядком строк
+COLUMNS = [
+    ("ids", "q"),
+    ("author_ids", "q"),
+    ("authors", "i"),
+    ("titles", "i"),
+    ("years", "q"),
+    ("languages", "i"),
+    ("programs", "i"),
+    ("src_urls", "i"),
+    ("versions", "i"),
+    ("title_order", "i"),
+    ("author_order", "i"),
+]
+# Столбцы со строками и их номера в строке результата запроса catalog_rows
+TEXT_COLUMNS = [("authors", 2), ("titles", 3), ("languages", 5), ("programs", 6), ("src_urls", 7), ("versions", 8)]
+# Значение вместо NULL: в столбцах со строками и author_ids - NO_VALUE, в years - NO_YEAR. Год в SQLite - 64-битное
+# число, поэтому столбец years тоже 64-битный, а NO_YEAR - наименьшее 64-битное число
+NO_VALUE = -1
+NO_YEAR = -(2**63)
+
+
+def snapshot_path(database_path: str) -> str:
+    """
+    :param database_path: путь до основной базы данных
+    :return: путь до снимка каталога, который лежит рядом с основной базой данных
+    """
+    root, _ = os.path.splitext(database_path)
+    return f"{root}_snapshot.bin"
+
+
+def lower_bound(count: int, key, value) -> int:
+    """
+    Двоичный поиск в отсортированной последовательности, заданной функцией.
+    :param count: длина последовательности
+    :param key: функция, возвращающая элемент последовательности по номеру
+    :param value: искомое значение
+    :return: номер первого элемента, который не меньше value
+    """
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if key(middle) < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def catalog_rows(after_id: int = 0):
+    """
+    :param after_id: id книги, после которой начинаются книги
+    :return: итератор кортежей (id, id автора, автор, название, год, язык, программа, ссылка, версия) по возрастанию id
+    """
+    return (
+        md.Book.select(
+            md.Book.id,
+            md.Book.author_id,
+            md.Author.name,
+            md.Book.title,
+            md.Book.year,
+            md.Book.language,
+            md.Book.program_used,
+            md.Book.src_url,
+            md.Book.version,
+        )
+        .join(md.Author, pw.JOIN.LEFT_OUTER)
+        .where(md.Book.id > after_id)
+        .order_by(md.Book.id)
+        .tuples()
+        .iterator()
+    )
+
+
+class SnapshotBuilder:
+    """
+    Собирает снимок каталога из книг, добавляемых по возрастанию id. Одинаковые строки хранятся один раз: пока книги
+    добавляются, строкам выдаются номера по порядку появления, а при записи строки сортируются и номера в столбцах
+    заменяются номерами в отсортированном списке.
+
+    columns: столбцы книг
+    """
+
+    def __init__(self):
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS[:-2]}
+        self._strings = {}
+
+    def _intern(self, value: str or None) -> int:
+        """
+        :param value: строка или None
+        :return: номер строки по порядку появления или NO_VALUE
+        """
+        if value is None:
+            return NO_VALUE
+        return self._strings.setdefault(value, len(self._strings))
+
+    def add(self, row: tuple) -> None:
+        """
+        Добавляет книгу в снимок.
+        :param row: кортеж (id, id автора, автор, название, год, язык, программа, ссылка, версия)
+        """
+        self.columns["ids"].append(row[0])
+        self.columns["author_ids"].append(NO_VALUE if row[1] is None else row[1])
+        self.columns["years"].append(NO_YEAR if row[4] is None else row[4])
+        for name, position in TEXT_COLUMNS:
+            self.columns[name].append(self._intern(row[position]))
+
+    def write(self, path: str, generation: int) -> None:
+        """
+        Записывает снимок во временный файл и заменяет им старый снимок, поэтому процессы, которые уже отобразили
+        старый снимок в память, дочитывают его без ошибок.
+        :param path: путь до снимка
+        :param generation: поколение каталога, прочитанное до чтения книг
+        """
+        strings = list(self._strings)
+        order = sorted(range(len(strings)), key=strings.__getitem__)
+        numbers = array("i", bytes(4 * len(strings)))
+        for number, index in enumerate(order):
+            numbers[index] = number
+        strings = [strings[index].encode("utf-8") for index in order]
+
+        columns = dict(self.columns)
+        for name, _ in TEXT_COLUMNS:
+            columns[name] = array("i", (NO_VALUE if index < 0 else numbers[index] for index in columns[name]))
+        book_count = len(columns["ids"])
+        columns["title_order"] = array("i", sorted(range(book_count), key=columns["titles"].__getitem__))
+        columns["author_order"] = array("i", sorted(range(book_count), key=columns["authors"].__getitem__))
+
+        offsets = array("q", [0])
+        for value in strings:
+            offsets.append(offsets[-1] + len(value))
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, generation, book_count, len(strings), offsets[-1]))
+            offsets.tofile(file)
+            for name, _ in COLUMNS:
+                columns[name].tofile(file)
+                file.write(bytes(-file.tell() % 8))
+            for value in strings:
+                file.write(value)
+        os.replace(temp_path, path)
+
+
+class CatalogSnapshot:
+    """
+    Снимок каталога, отображенный в память. Столбцы читаются из файла без копирования, поэтому снимок открывается
+    сразу, а несколько процессов используют одни и те же страницы памяти. Книги ищутся по отсортированным индексам
+    названий и имен авторов или просмотром столбцов.
+
+    generation: поколение каталога, для которого построен снимок
+    book_count: количество книг
+    string_count: количество разных строк
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, self.book_count, self.string_count, blob_size = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} не является снимком каталога")
+
+        view = memoryview(self._map)
+        offset = HEADER.size
+        self._offsets = view[offset : offset + 8 * (self.string_count + 1)].cast("q")
+        offset += self._offsets.nbytes
+        for name, typecode in COLUMNS:
+            size = struct.calcsize(typecode) * self.book_count
+            setattr(self, name, view[offset : offset + size].cast(typecode))
+            offset += size + (-(offset + size) % 8)
+        self._blob = view[offset : offset + blob_size]
+        self._decoded = {}
+
+    @property
+    def max_id(self) -> int:
+        """
+        :return: наибольший id книги в снимке или 0, если книг нет
+        """
+        return self.ids[-1] if self.book_count else 0
+
+    def string(self, number: int) -> str or None:
+        """
+        :param number: номер строки
+        :return: строка или None для NO_VALUE
+        """
+        if number < 0:
+            return None
+        value = self._decoded.get(number)
+        if value is None:
+            value = str(self._blob[self._offsets[number] : self._offsets[number + 1]], "utf-8")
+            self._decoded[number] = value
+        return value
+
+    def string_range(self, text: str, prefix: bool = False) -> tuple:
+        """
+        :param text: строка или ее начало
+        :param prefix: флаг, если True, то ищутся строки, начинающиеся с text
+        :return: диапазон номеров строк (начало, конец), конец не входит в диапазон
+        """
+        low = lower_bound(self.string_count, self.string, text)
+        if not prefix:
+            return low, low + 1 if low < self.string_count and self.string(low) == text else low
+
+        def outside(number: int) -> bool:
+            return not self.string(low + number).startswith(text)
+
+        # Строки с началом text идут подряд, поэтому конец диапазона - первая строка после low без этого начала
+        return low, low + lower_bound(self.string_count - low, outside, True)
+
+    def row(self, position: int) -> tuple:
+        """
+        :param position: номер книги в снимке
+        :return: кортеж (id, автор, название, год, язык, программа, ссылка, версия), как в запросе seeker.build_query
+        """
+        year = self.years[position]
+        return (
+            self.ids[position],
+            self.string(self.authors[position]),
+            self.string(self.titles[position]),
+            None if year == NO_YEAR else year,
+            self.string(self.languages[position]),
+            self.string(self.programs[position]),
+            self.string(self.src_urls[position]),
+            self.string(self.versions[position]),
+        )
+
+    def rows(self):
+        """
+        :return: генератор всех книг снимка в формате catalog_rows
+        """
+        for position in range(self.book_count):
+            author_id = self.author_ids[position]
+            book_id, *values = self.row(position)
+            yield (book_id, None if author_id == NO_VALUE else author_id, *values)
+
+    @staticmethod
+    def supports(filters: dict) -> bool:
+        """
+        :param filters: условия поиска для seeker.build_query
+        :return: True, если поиск по этим условиям можно выполнить по снимку. Полнотекстовый поиск и сравнение без
+        учета регистра выполняются только в SQLite
+        """
+        query = filters.get("query")
+        return not (query and query.strip()) and not filters.get("ignore_case")
+
+    def _index_range(self, order, column, low: int, high: int) -> tuple:
+        """
+        :param order: номера книг, отсортированные по столбцу column
+        :param column: столбец с номерами строк
+        :param low: начало диапазона номеров строк
+        :param high: конец диапазона номеров строк, не входит в диапазон
+        :return: диапазон позиций в order (начало, конец) книг, у которых номер строки в диапазоне
+        """
+        def key(index: int) -> int:
+            return column[order[index]]
+
+        return lower_bound(self.book_count, key, low), lower_bound(self.book_count, key, high)
+
+    def search(self, filters: dict):
+        """
+        Находит книги по условиям поиска, результат совпадает с запросом seeker.build_query с теми же условиями.
+        Если указано имя автора или название книги, в том числе их начало, книги выбираются по индексу с меньшим
+        количеством книг, иначе просматриваются все книги после after_id.
+        :param filters: условия поиска для seeker.build_query, кроме query и ignore_case
+        :return: генератор кортежей (id, автор, название, год, язык, программа, ссылка, версия) по возрастанию id
+        """
+        conditions = []
+        indexed = []
+        for column, order, exact, prefix in [
+            (self.authors, self.author_order, filters.get("author"), filters.get("author_prefix")),
+            (self.titles, self.title_order, filters.get("book_name"), filters.get("title_prefix")),
+        ]:
+            for text, is_prefix in [(exact, False), (prefix, True)]:
+                if text:
+                    low, high = self.string_range(text, is_prefix)
+                    conditions.append((column, low, high))
+                    indexed.append((order, *self._index_range(order, column, low, high)))
+        for name in ["language", "src_url"]:
+            if filters.get(name):
+                conditions.append((getattr(self, f"{name}s"), *self.string_range(filters[name])))
+
+        year_low, year_high = NO_YEAR + 1, float("inf")
+        if filters.get("year"):
+            year_low, year_high = filters["year"], filters["year"] + 1
+        if filters.get("year_from") is not None:
+            year_low = max(year_low, filters["year_from"])
+        if filters.get("year_to") is not None:
+            year_high = min(year_high, filters["year_to"] + 1)
+        if (year_low, year_high) != (NO_YEAR + 1, float("inf")):
+            conditions.append((self.years, year_low, year_high))
+
+        if any(low >= high for _, low, high in conditions):
+            return
+
+        start = 0
+        if filters.get("after_id") is not None:
+            start = lower_bound(self.book_count, self.ids.__getitem__, filters["after_id"] + 1)
+
+        if indexed:
+            order, low, high = min(indexed, key=lambda item: item[2] - item[1])
+            positions = sorted(position for position in order[low:high] if position >= start)
+        else:
+            positions = range(start, self.book_count)
+
+        limit = filters.get("limit")
+        found = 0
+        for position in positions:
+            if all(low <= column[position] < high for column, low, high in conditions):
+                yield self.row(position)
+                found += 1
+                if found == limit:
+                    return
+
+
+def open_snapshot() -> CatalogSnapshot or None:
+    """
+    :return: снимок каталога, лежащий рядом с основной базой данных, или None, если его нет
+    """
+    path = snapshot_path(connection.database)
+    try:
+        return CatalogSnapshot(path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def fresh_snapshot(filters: dict) -> CatalogSnapshot or None:
+    """
+    :param filters: условия поиска для seeker.build_query
+    :return: снимок каталога, если он есть, построен для текущего поколения каталога и поиск по условиям можно
+    выполнить по нему, иначе None, и поиск выполняется в SQLite
+    """
+    if not CatalogSnapshot.supports(filters):
+        return None
+    snapshot = open_snapshot()
+    if snapshot is None or snapshot.generation != cache.current_generation():
+        return None
+    return snapshot
+
+
+def build_snapshot() -> int:
+    """
+    Строит снимок каталога из всех книг базы данных.
+    :return: количество книг в снимке
+    """
+    generation = cache.current_generation()
+    builder = SnapshotBuilder()
+    with md.db:
+        for row in catalog_rows():
+            builder.add(row)
+    builder.write(snapshot_path(connection.database), generation)
+    return len(builder.columns["ids"])
+
+
+def refresh_snapshot(start_generation: int, update: bool, create: bool = False) -> str or None:
+    """
+    Обновляет снимок каталога после добавления книг. Если снимок был актуален до начала добавления, а книги не
+    обновлялись и не удалялись, то из базы данных читаются только книги с id больше наибольшего id снимка, остальные
+    берутся из старого снимка. Иначе снимок строится заново.
+    :param start_generation: поколение каталога до начала добавления книг
+    :param update: флаг, если True, то книги могли обновиться, и снимок строится заново
+    :param create: флаг, если True, то снимок строится, даже если его еще нет
+    :return: "incremental" или "full" в зависимости от способа обновления или None, если снимок уже актуален или
+    его нет
+    """
+    old = open_snapshot()
+    generation = cache.current_generation()
+    if old is None and not create or old is not None and old.generation == generation:
+        return None
+
+    builder = None
+    if old is not None and old.generation == start_generation and not update:
+        builder = extend_snapshot(old)
+    # Старый снимок закрывается до замены файла
+    del old
+    if builder is None:
+        build_snapshot()
+        return "full"
+    builder.write(snapshot_path(connection.database), generation)
+    return "incremental"
+
+
+def extend_snapshot(old: CatalogSnapshot) -> SnapshotBuilder or None:
+    """
+    :param old: снимок каталога
+    :return: сборщик снимка с книгами старого снимка и книгами с id больше наибольшего id снимка или None, если
+    книги с id из старого снимка были удалены
+    """
+    builder = SnapshotBuilder()
+    with md.db:
+        if md.Book.select().where(md.Book.id <= old.max_id).count() != old.book_count:
+            return None
+        for row in old.rows():
+            builder.add(row)
+        for row in catalog_rows(old.max_id):
+            builder.add(row)
+    return builder
@@ -0,0 +1,303 @@
+import contextlib
+import heapq
+import json
+import time
+from collections import Counter
+
+from utilities import scanner
+from utilities.archives import is_tar_path
+
+
+def file_format(path: str) -> str:
+    """
+    :param path: путь до файла
+    :return: формат файла для статистики: fb2, zip, gz или tar
+    """
+    lower_path = path.lower()
+    if lower_path.endswith(".zip"):
+        return "zip"
+    if lower_path.endswith(".gz") and not is_tar_path(lower_path):
+        return "gz"
+    if is_tar_path(lower_path):
+        return "tar"
+    return "fb2"
+
+
+def timed_call(func, args: tuple) -> tuple:
+    """
+    Вызывает функцию и замеряет время ее выполнения, а также отдельно время поиска информации в описаниях книг функцией
+    scanner.scan_book и количество прочитанных ею байт книг. Используется для задач, которые выполняются в пуле
+    процессов, поэтому время замеряется в процессе, выполнившем задачу.
+    :param func: функция
+    :param args: аргументы функции
+    :return: кортеж (результат, время выполнения в секундах, процессорное время в секундах, кортеж (время поиска
+    информации, процессорное время поиска информации, количество прочитанных байт книг))
+    """
+    scanner.scan_totals = [0.0, 0.0, 0]
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        result = func(*args)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    finally:
+        scan, scanner.scan_totals = tuple(scanner.scan_totals), None
+    return result, wall, cpu, scan
+
+
+def timed_parts(func, args: tuple):
+    """
+    Вызывает функцию-генератор, которая возвращает результат частями, и замеряет время получения каждой части. Время,
+    пока генератор ждет обработки части, не учитывается.
+    :param func: функция-генератор, которая возвращает кортежи (контекст, результат)
+    :param args: аргументы функции
+    :return: генератор кортежей (контекст, результат timed_call для части)
+    """
+    parts = func(*args)
+    while True:
+        try:
+            (context, result), *timings = timed_call(next, (parts,))
+        except StopIteration:
+            return
+        yield context, (result, *timings)
+
+
+class NullStats:
+    """
+    Статистика, которая ничего не записывает. Используется, когда статистика не запрошена: вызовы ее методов ничего не
+    делают, а stage возвращает один и тот же пустой контекстный менеджер, поэтому время работы digger не меняется.
+
+    enabled: флаг, если False, то статистика не собирается и код, который готовит для нее данные, можно пропустить
+    """
+
+    enabled = False
+
+    def stage(self, name: str):
+        """
+        :param name: название этапа
+        :return: контекстный менеджер, время выполнения блока которого относится к этапу
+        """
+        return NULL_STAGE
+
+    def iterate(self, name: str, iterable):
+        """
+        :param name: название этапа
+        :param iterable: итерируемый объект
+        :return: итерируемый объект, время получения элементов которого относится к этапу
+        """
+        return iterable
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Увеличивает счетчик.
+        :param name: название счетчика
+        :param value: на сколько увеличить счетчик
+        """
+
+    def add_task(
+        self, path: str, size: int, wall: float, cpu: float, books: int, last: bool, scan: tuple = (0.0, 0.0, 0)
+    ) -> None:
+        """
+        Учитывает время обработки задачи пула процессов.
+        :param path: путь до файла
+        :param size: размер файла в байтах
+        :param wall: время выполнения задачи в секундах
+        :param cpu: процессорное время задачи в секундах
+        :param books: количество найденных книг
+        :param last: флаг, если True, то это последняя задача файла
+        :param scan: кортеж (время, процессорное время, количество прочитанных байт книг) поиска информации в
+        описаниях книг, время входит во время задачи
+        """
+
+
+NULL_STAGE = contextlib.nullcontext()
+NULL_STATS = NullStats()
+
+
+class RunStats(NullStats):
+    """
+    Статистика запуска digger: время и процессорное время этапов, время обработки файлов каждого формата, счетчики
+    файлов и книг и самые долгие файлы. Время вложенных этапов не входит во время внешнего этапа. Объект можно передать
+    в digger.parse_files и BatchWriter из своего кода, например при профилировании.
+    Этапы задач замеряются в процессах, которые выполняют задачи, и складываются по всем задачам: read - чтение,
+    распаковка файлов и остальная работа задачи, scan - поиск информации в описаниях книг. При нескольких процессах
+    этап parse текущего процесса - это ожидание результатов, а время работы процессов видно по этапам задач.
+
+    slowest_size: сколько самых долгих файлов запоминать
+    stages: словарь, где ключ - название этапа, а значение - список [время, процессорное время, количество вызовов]
+    task_stages: этапы задач в том же формате, что и stages, количество вызовов - количество задач
+    counts: счетчики файлов и книг
+    formats: словарь, где ключ - формат файла, а значение - словарь с количеством файлов, байт, книг и временем
+    """
+
+    enabled = True
+
+    def __init__(self, slowest_size: int = 10):
+        self.slowest_size = slowest_size
+        self.stages = {}
+        self.task_stages = {"read": [0.0, 0.0, 0], "scan": [0.0, 0.0, 0]}
+        self.counts = Counter()
+        self.formats = {}
+        self._slowest = []
+        self._stack = []
+        self._current = None
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        self._stack.append([0.0, 0.0])
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            child_wall, child_cpu = self._stack.pop()
+            record = self.stages.setdefault(name, [0.0, 0.0, 0])
+            record[0] += wall - child_wall
+            record[1] += cpu - child_cpu
+            record[2] += 1
+            if self._stack:
+                self._stack[-1][0] += wall
+                self._stack[-1][1] += cpu
+
+    def iterate(self, name: str, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counts[name] += value
+
+    def add_task(
+        self, path: str, size: int, wall: float, cpu: float, books: int, last: bool, scan: tuple = (0.0, 0.0, 0)
+    ) -> None:
+        for record, (stage_wall, stage_cpu) in zip(
+            self.task_stages.values(), [(wall - scan[0], cpu - scan[1]), scan[:2]]
+        ):
+            record[0] += stage_wall
+            record[1] += stage_cpu
+            record[2] += 1
+
+        # задачи одного архива zip идут подряд, поэтому время файла накапливается, пока не придет последняя задача
+        if self._current is None or self._current[0] != path:
+            self._current = [path, 0.0, 0.0, 0, 0]
+        self._current[1] += wall
+        self._current[2] += cpu
+        self._current[3] += books
+        self._current[4] += scan[2]
+        if not last:
+            return
+
+        path, wall, cpu, books, bytes_read = self._current
+        self._current = None
+        fmt = file_format(path)
+        record = self.formats.setdefault(
+            fmt, {"files": 0, "file_bytes": 0, "bytes_read": 0, "books": 0, "wall": 0.0, "cpu": 0.0}
+        )
+        record["files"] += 1
+        record["file_bytes"] += size
+        record["bytes_read"] += bytes_read
+        record["books"] += books
+        record["wall"] += wall
+        record["cpu"] += cpu
+
+        item = (wall, path, fmt)
+        if len(self._slowest) < self.slowest_size:
+            heapq.heappush(self._slowest, item)
+        elif self._slowest and item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def summary(self) -> dict:
+        """
+        :return: словарь со статистикой запуска, который можно сохранить в формате JSON
+        """
+        wall = time.perf_counter() - self._started
+        files = sum(record["files"] for record in self.formats.values())
+        # скорость считается по байтам, которые прочитал поиск информации, а не по размеру файлов, так как книги
+        # читаются только до конца описания
+        size = sum(record["bytes_read"] for record in self.formats.values())
+        return {
+            "wall_seconds": round(wall, 3),
+            "cpu_seconds": round(time.process_time() - self._cpu_started, 3),
+            "files_per_sec": round(files / wall, 1) if wall else None,
+            "bytes_per_sec": round(size / wall, 1) if wall else None,
+            "stages": {
+                name: {"wall_seconds": round(stage_wall, 3), "cpu_seconds": round(stage_cpu, 3), "calls": calls}
+                for name, (stage_wall, stage_cpu, calls) in self.stages.items()
+            },
+            "task_stages": {
+                name: {"wall_seconds": round(stage_wall, 3), "cpu_seconds": round(stage_cpu, 3), "calls": calls}
+                for name, (stage_wall, stage_cpu, calls) in self.task_stages.items()
+            },
+            "formats": {
+                fmt: {
+                    "files": record["files"],
+                    "file_bytes": record["file_bytes"],
+                    "bytes_read": record["bytes_read"],
+                    "books": record["books"],
+                    "wall_seconds": round(record["wall"], 3),
+                    "cpu_seconds": round(record["cpu"], 3),
+                    "files_per_sec": round(record["files"] / record["wall"], 1) if record["wall"] else None,
+                }
+                for fmt, record in sorted(self.formats.items())
+            },
+            "counts": dict(sorted(self.counts.items())),
+            "slowest": [
+                {"path": path, "format": fmt, "wall_seconds": round(seconds, 3)}
+                for seconds, path, fmt in sorted(self._slowest, reverse=True)
+            ],
+        }
+
+    def report(self) -> None:
+        """
+        Выводит статистику запуска в stdout.
+        """
+        from tabulate import tabulate
+
+        summary = self.summary()
+        print(
+            f"Время: {summary['wall_seconds']} с, процессорное время: {summary['cpu_seconds']} с, "
+            f"файлов в секунду: {summary['files_per_sec']}, прочитано байт в секунду: {summary['bytes_per_sec']}"
+        )
+        stages = [[name, *stage.values()] for name, stage in summary["stages"].items()]
+        print(tabulate(stages, headers=["Этап", "Время, с", "Процессорное время, с", "Вызовов"], tablefmt="github"))
+        task_stages = [[name, *stage.values()] for name, stage in summary["task_stages"].items()]
+        print(
+            tabulate(
+                task_stages,
+                headers=["Этап задач", "Время, с", "Процессорное время, с", "Задач"],
+                tablefmt="github",
+            )
+        )
+        formats = [[fmt, *record.values()] for fmt, record in summary["formats"].items()]
+        print(
+            tabulate(
+                formats,
+                headers=[
+                    "Формат",
+                    "Файлов",
+                    "Размер файлов, байт",
+                    "Прочитано байт",
+                    "Книг",
+                    "Время, с",
+                    "Процессорное время, с",
+                    "Файлов в секунду",
+                ],
+                tablefmt="github",
+            )
+        )
+        print(tabulate(summary["counts"].items(), headers=["Счетчик", "Значение"], tablefmt="github"))
+        slowest = [[item["path"], item["format"], item["wall_seconds"]] for item in summary["slowest"]]
+        print(tabulate(slowest, headers=["Самые долгие файлы", "Формат", "Время, с"], tablefmt="github"))
+
+    def save(self, path: str) -> None:
+        """
+        Сохраняет статистику запуска в файл в формате JSON.
+        :param path: путь до файла
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, ensure_ascii=False, indent=2)
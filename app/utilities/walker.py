@@ -0,0 +1,109 @@
+import fnmatch
+import os
+
+DEFAULT_INCLUDE = (
+    "*.fb2",
+    "*.fb2.zip",
+    "*.fb2.gz",
+    "*.tar",
+    "*.tar.gz",
+    "*.tgz",
+    "*.tar.bz2",
+    "*.tbz2",
+    "*.tar.xz",
+    "*.txz",
+)
+
+
+def matches(name: str, patterns) -> bool:
+    """
+    Проверяет, подходит ли имя файла хотя бы под один glob шаблон.
+    :param name: имя файла или путь относительно корня обхода
+    :param patterns: glob шаблоны
+    :return: True, если имя подходит хотя бы под один шаблон
+    """
+    return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def scan_directory(dir_path: str, prefix_len: int, include, exclude, follow_symlinks: bool):
+    """
+    Читает одну директорию с помощью os.scandir и возвращает записи по мере чтения, поэтому обработку первых книг
+    можно начинать, пока большая директория еще читается. Ошибка stat для одной записи выводится в stdout и
+    пропускает только эту запись, ошибка чтения самой директории передается вызывающему.
+    :param dir_path: путь до директории
+    :param prefix_len: длина пути до корня обхода вместе с разделителем, по ней считается относительный путь
+    :param include: glob шаблоны файлов, которые нужно вернуть
+    :param exclude: glob шаблоны файлов и директорий, которые нужно пропустить
+    :param follow_symlinks: флаг, если True, то символические ссылки не пропускаются
+    :return: генератор кортежей (путь до книги, результат stat) для книг и (путь до директории, None) для вложенных
+    директорий
+    """
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            try:
+                if not follow_symlinks and entry.is_symlink():
+                    continue
+                rel_path = entry.path[prefix_len:]
+                if exclude and (matches(entry.name, exclude) or matches(rel_path, exclude)):
+                    continue
+
+                if entry.is_dir(follow_symlinks=follow_symlinks):
+                    item = entry.path, None
+                elif entry.is_file(follow_symlinks=follow_symlinks) and (
+                    matches(entry.name, include) or matches(rel_path, include)
+                ):
+                    item = entry.path, entry.stat(follow_symlinks=follow_symlinks)
+                else:
+                    continue
+            except OSError as error:
+                print(f"Произошла ошибка во время чтения файла {entry.path}: {error.strerror}")
+                continue
+            yield item
+
+
+def walk_books(
+    root: str,
+    include=DEFAULT_INCLUDE,
+    exclude=(),
+    follow_symlinks: bool = False,
+    max_depth: int or None = None,
+):
+    """
+    Лениво обходит директорию и все вложенные директории с помощью os.scandir и возвращает пути до книг по мере
+    чтения директорий, поэтому обработку первых книг можно начинать, пока обход еще не закончен.
+    Шаблоны include и exclude сравниваются и с именем файла, и с путем относительно root, поэтому исключить можно как
+    файл по маске, так и целую директорию, например "old/*". Директории, подходящие под exclude, не обходятся.
+    Ошибки чтения директорий и отдельных файлов выводятся в stdout и не прерывают обход.
+    :param root: абсолютный путь до директории с книгами
+    :param include: glob шаблоны файлов, которые нужно вернуть
+    :param exclude: glob шаблоны файлов и директорий, которые нужно пропустить
+    :param follow_symlinks: флаг, если True, то обходятся директории и файлы, на которые указывают символические
+    ссылки, иначе ссылки пропускаются. Каждая директория обходится не больше одного раза
+    :param max_depth: максимальная глубина вложенности, 0 - только сама директория root, None - без ограничений
+    :return: генератор кортежей (путь до книги, результат stat)
+    """
+    root = root.rstrip(os.sep) or os.sep
+    prefix_len = len(os.path.join(root, ""))
+    visited = set()
+    stack = [(root, 0)]
+
+    while stack:
+        dir_path, depth = stack.pop()
+        subdirs = []
+        try:
+            if follow_symlinks:
+                dir_stat = os.stat(dir_path)
+                if (dir_stat.st_dev, dir_stat.st_ino) in visited:
+                    continue
+                visited.add((dir_stat.st_dev, dir_stat.st_ino))
+
+            for path, stat in scan_directory(dir_path, prefix_len, include, exclude, follow_symlinks):
+                if stat is None:
+                    subdirs.append(path)
+                else:
+                    yield path, stat
+        except OSError as error:
+            print(f"Произошла ошибка во время чтения директории {dir_path}: {error.strerror}")
+
+        if max_depth is None or depth < max_depth:
+            stack.extend((path, depth + 1) for path in reversed(subdirs))
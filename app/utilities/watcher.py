@@ -0,0 +1,147 @@
+import os
+import time
+
+from utilities.walker import DEFAULT_INCLUDE, scan_directory
+
+# Директория, изменившаяся меньше указанного количества наносекунд назад, перечитывается при следующем опросе, даже
+# если ее время изменения не поменялось: на файловых системах с грубым временем изменения файл, добавленный сразу
+# после чтения директории, может не изменить время изменения директории
+RECENT_CHANGE_NS = 2_000_000_000
+# Через сколько секунд директории перечитываются целиком, даже если их время изменения не менялось. Время изменения
+# директории меняется при добавлении, удалении и переименовании файлов, но не при перезаписи файла на месте
+FULL_RESCAN_INTERVAL = 300
+
+
+class TreeWatcher:
+    """
+    Следит за директорией с книгами опросом: при каждом опросе для каждой директории вызывается stat, а читаются
+    только директории, время изменения которых поменялось с прошлого опроса, поэтому опрос неизменившегося дерева
+    почти не нагружает процессор. Новый или изменившийся файл считается готовым, когда его размер и время изменения
+    не меняются settle секунд, чтобы не читать файлы, которые еще копируются.
+
+    root: абсолютный путь до директории с книгами
+    settle: сколько секунд размер и время изменения файла не должны меняться
+    known: словарь, где ключ - путь до файла, а значение - кортеж (размер, время изменения), с которыми файл был
+    передан на обработку или признан уже обработанным
+    pending: словарь, где ключ - путь до файла, ожидающего окончания записи, а значение - кортеж (размер, время
+    изменения, результат stat, время, с которого размер и время изменения не менялись)
+    """
+
+    def __init__(
+        self,
+        root: str,
+        settle: float,
+        include=DEFAULT_INCLUDE,
+        exclude=(),
+        follow_symlinks: bool = False,
+        max_depth: int or None = None,
+    ):
+        self.root = root.rstrip(os.sep) or os.sep
+        self.settle = settle
+        self.include = include
+        self.exclude = exclude
+        self.follow_symlinks = follow_symlinks
+        self.max_depth = max_depth
+        self.known = {}
+        self.pending = {}
+        self._dirs = {}
+        self._failed = set()
+        self._last_rescan = None
+
+    def poll(self, is_unchanged=None, now: float = None) -> list:
+        """
+        Опрашивает дерево директорий и возвращает файлы, готовые к обработке.
+        :param is_unchanged: функция (путь, результат stat) -> bool, которая сообщает, что файл уже обработан и
+        ждать окончания его записи не нужно, например Manifest.is_unchanged
+        :param now: текущее время в секундах по time.monotonic
+        :return: список кортежей (путь до книги, результат stat)
+        """
+        now = time.monotonic() if now is None else now
+        rescan = self._last_rescan is None or now - self._last_rescan >= FULL_RESCAN_INTERVAL
+        if rescan:
+            self._last_rescan = now
+
+        observed = set()
+        for path, stat in self._walk(rescan):
+            observed.add(path)
+            self._observe(path, stat, now, is_unchanged)
+        if rescan:
+            # при полном обходе встречены все файлы, остальные были удалены
+            self.known = {path: key for path, key in self.known.items() if path in observed}
+        for path in list(self.pending):
+            if path in observed:
+                continue
+            try:
+                self._observe(path, os.stat(path), now, is_unchanged)
+            except OSError:
+                del self.pending[path]
+
+        ready = []
+        for path, (size, mtime, stat, since) in list(self.pending.items()):
+            if now - since >= self.settle:
+                ready.append((path, stat))
+                self.known[path] = (size, mtime)
+                del self.pending[path]
+        return ready
+
+    def _observe(self, path: str, stat: os.stat_result, now: float, is_unchanged) -> None:
+        """
+        Запоминает размер и время изменения файла. Если они изменились, файл снова ждет окончания записи.
+        :param path: путь до файла
+        :param stat: результат stat для файла
+        :param now: текущее время
+        :param is_unchanged: функция, которая сообщает, что файл уже обработан, или None
+        """
+        key = (stat.st_size, stat.st_mtime_ns)
+        if self.known.get(path) == key:
+            return
+        if path not in self.known and path not in self.pending and is_unchanged and is_unchanged(path, stat):
+            self.known[path] = key
+            return
+        pending = self.pending.get(path)
+        if pending is None or pending[:2] != key:
+            self.pending[path] = (*key, stat, now)
+
+    def _walk(self, rescan: bool):
+        """
+        Обходит дерево директорий. Директория читается, если ее время изменения поменялось с прошлого опроса или если
+        rescan, иначе используется список вложенных директорий с прошлого чтения.
+        :param rescan: флаг, если True, то читаются все директории
+        :return: генератор кортежей (путь до книги, результат stat) из прочитанных директорий
+        """
+        prefix_len = len(os.path.join(self.root, ""))
+        visited = set()
+        dirs = {}
+        stack = [(self.root, 0)]
+
+        while stack:
+            dir_path, depth = stack.pop()
+            subdirs = []
+            try:
+                dir_stat = os.stat(dir_path)
+                if (dir_stat.st_dev, dir_stat.st_ino) in visited:
+                    continue
+                visited.add((dir_stat.st_dev, dir_stat.st_ino))
+
+                cached = self._dirs.get(dir_path)
+                if not rescan and cached is not None and cached[0] == dir_stat.st_mtime_ns:
+                    subdirs = cached[1]
+                else:
+                    entries = scan_directory(dir_path, prefix_len, self.include, self.exclude, self.follow_symlinks)
+                    for path, stat in entries:
+                        if stat is None:
+                            subdirs.append(path)
+                        else:
+                            yield path, stat
+                recent = time.time_ns() - dir_stat.st_mtime_ns < RECENT_CHANGE_NS
+                dirs[dir_path] = (None if recent else dir_stat.st_mtime_ns, subdirs)
+                self._failed.discard(dir_path)
+            except OSError as error:
+                if dir_path not in self._failed:
+                    print(f"Произошла ошибка во время чтения директории {dir_path}: {error.strerror}")
+                    self._failed.add(dir_path)
+
+            if self.max_depth is None or depth < self.max_depth:
+                stack.extend((path, depth + 1) for path in reversed(subdirs))
+
+        self._dirs = dirs
@@ -1,37 +1,253 @@
 import click
 
 import db_and_migration.migration.models as md
+from utilities.cache import bump_generation
+from utilities.seeker import build_query
+from utilities.shards import check_not_rebuilding, parse_shard_names, select_shards, switch_database
+from utilities.writer import MAX_QUERY_PARAMS, REMOVE_ORPHAN_AUTHORS, chunks
+
+# Количество книг, удаляемых в одной транзакции
+DELETE_CHUNK_SIZE = 1000
+
+
+def parse_ids(values) -> tuple:
+    """
+    Разбирает id книг: каждое значение может содержать несколько id или диапазонов через запятую, например
+    "1,5,10-20". Диапазон включает обе границы.
+    :param values: итерируемый объект со строками
+    :return: кортеж (список id, список диапазонов (начало, конец))
+    """
+    ids = []
+    ranges = []
+    for value in values:
+        for item in value.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            start, dash, end = item.partition("-")
+            try:
+                if dash:
+                    ranges.append((int(start), int(end)))
+                else:
+                    ids.append(int(item))
+            except ValueError:
+                raise click.BadParameter(f"{item} не является id книги или диапазоном id")
+    return ids, ranges
+
+
+def merge_ranges(ids: list, ranges: list) -> list:
+    """
+    Объединяет id и диапазоны id в непересекающиеся диапазоны, поэтому каждая книга выбирается один раз, даже если
+    она указана и отдельно, и в диапазоне. Пересекающиеся и соседние диапазоны сливаются, пустые диапазоны, у которых
+    начало больше конца, пропускаются.
+    :param ids: список id книг
+    :param ranges: список диапазонов id (начало, конец)
+    :return: отсортированный список непересекающихся диапазонов (начало, конец)
+    """
+    merged = []
+    for start, end in sorted([(book_id, book_id) for book_id in ids] + [item for item in ranges if item[0] <= item[1]]):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def delete_chunk(ids: list) -> int:
+    """
+    Удаляет книги в одной транзакции. Если книги были удалены, в той же транзакции увеличивается поколение каталога.
+    :param ids: id книг
+    :return: количество удаленных книг
+    """
+    deleted = 0
+    with md.db.atomic():
+        for part in chunks(ids, MAX_QUERY_PARAMS):
+            deleted += md.Book.delete().where(md.Book.id.in_(part)).execute()
+        if deleted:
+            bump_generation()
+    return deleted
+
+
+def select_chunks(condition, filters: dict, chunk_size: int):
+    """
+    Находит id книг, подходящих под условие и условия поиска seeker, частями по возрастанию id. Следующая часть
+    ищется после последнего id предыдущей части, поэтому части можно удалять по мере получения.
+    :param condition: дополнительное условие для where или None
+    :param filters: условия поиска для seeker.build_query
+    :param chunk_size: количество id в части
+    :return: генератор списков id
+    """
+    last_id = 0
+    while True:
+        query = build_query(**filters, after_id=last_id, limit=chunk_size).select(md.Book.id)
+        if condition is not None:
+            query = query.where(condition)
+        ids = [book_id for book_id, in query.tuples()]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def select_books(ids: list, ranges: list, filters: dict, delete_all: bool, chunk_size: int):
+    """
+    Находит книги для удаления частями. Книги из списка id и из диапазонов объединяются функцией merge_ranges, поэтому
+    каждая книга выбирается один раз, а условия поиска сужают результат. Если id и диапазоны не указаны, выбираются
+    все книги, подходящие под условия поиска.
+    :param ids: список id книг
+    :param ranges: список диапазонов id (начало, конец)
+    :param filters: условия поиска для seeker.build_query, пустые условия не учитываются
+    :param delete_all: флаг, если True, то выбираются все книги
+    :param chunk_size: количество id в части
+    :return: генератор списков id
+    """
+    if delete_all:
+        yield from select_chunks(None, {}, chunk_size)
+        return
+
+    merged = merge_ranges(ids, ranges)
+    # отдельные id ищутся частями запросом IN (...), а диапазоны - запросом BETWEEN
+    single = [start for start, end in merged if start == end]
+    for part in chunks(single, min(chunk_size, MAX_QUERY_PARAMS)):
+        yield from select_chunks(md.Book.id.in_(part), filters, chunk_size)
+    for start, end in merged:
+        if start != end:
+            yield from select_chunks(md.Book.id.between(start, end), filters, chunk_size)
+    if not ids and not ranges and any(value is not None for value in filters.values()):
+        yield from select_chunks(None, filters, chunk_size)
+
+
+def delete_books(ids=(), ranges=(), filters: dict = None, delete_all=False, chunk_size=DELETE_CHUNK_SIZE) -> tuple:
+    """
+    Удаляет книги частями по chunk_size книг, каждая часть удаляется в отдельной транзакции, поэтому удаление большого
+    количества книг не блокирует базу данных надолго. После удаления книг одним запросом удаляются авторы, у которых
+    не осталось книг. Поколение каталога увеличивается в транзакции каждой части, поэтому результаты поиска из кэша
+    seeker становятся недействительными вместе с удалением книг. При удалении всех книг также очищается манифест,
+    чтобы digger снова добавил книги из файлов.
+    :param ids: список id книг
+    :param ranges: список диапазонов id (начало, конец)
+    :param filters: условия поиска для seeker.build_query
+    :param delete_all: флаг, если True, то удаляются все книги
+    :param chunk_size: количество книг в одной транзакции
+    :return: кортеж (количество удаленных книг, количество удаленных авторов)
+    """
+    deleted = 0
+    with md.db.connection_context():
+        for part in select_books(list(ids), list(ranges), filters or {}, delete_all, chunk_size):
+            deleted += delete_chunk(part)
+
+        with md.db.atomic():
+            authors = md.db.execute_sql(REMOVE_ORPHAN_AUTHORS).rowcount
+            if delete_all:
+                md.FileManifest.delete().execute()
+    return deleted, authors
+
+
+def count_books(ids=(), ranges=(), filters: dict = None, delete_all=False) -> int:
+    """
+    :return: количество книг, которые будут удалены функцией delete_books с теми же параметрами
+    """
+    with md.db.connection_context():
+        return sum(len(part) for part in select_books(list(ids), list(ranges), filters or {}, delete_all, 10_000))
 
 
 @click.command()
-@click.option("--number", "-n", help="id книги, которую требуется удалить")
+@click.option(
+    "--number",
+    "-n",
+    multiple=True,
+    help="""id книг, которые требуется удалить: один id, несколько id или диапазонов через запятую, например
+    1,5,10-20. Можно указать несколько раз""",
+)
+@click.option(
+    "--ids-file",
+    type=click.File("r", encoding="utf-8"),
+    help="Файл с id книг или диапазонами id, по одному или через запятую на строке, - для stdin",
+)
 @click.option(
     "--delete_all",
     "-a",
     is_flag=True,
-    help="Если этот флаг указан, удаляет все записи из таблицы авторов и книг",
+    help="Если этот флаг указан, удаляет все записи из таблицы авторов и книг и очищает манифест",
 )
-def wiper(number, delete_all):
+@click.option("--author", type=str, help="Удалить книги автора с этим именем")
+@click.option("--year", "-y", type=int, help="Удалить книги этого года издания")
+@click.option("--year-from", type=int, help="Удалить книги, изданные не раньше этого года")
+@click.option("--year-to", type=int, help="Удалить книги, изданные не позже этого года")
+@click.option("--language", type=str, help="Удалить книги на этом языке")
+@click.option("--src-url", type=str, help="Удалить книги с этой ссылкой на источник")
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=DELETE_CHUNK_SIZE,
+    show_default=True,
+    help="Количество книг, удаляемых в одной транзакции",
+)
+@click.option("--dry-run", is_flag=True, help="Если этот флаг указан, то выводится количество книг без удаления")
+@click.option(
+    "--db-shard",
+    multiple=True,
+    callback=parse_shard_names,
+    help="""Название шарда каталога, из которого удаляются книги, вместо основной базы данных. Можно указать несколько
+    раз""",
+)
+@click.option("--all-shards", is_flag=True, help="Если этот флаг указан, то книги удаляются из всех шардов")
+def wiper(
+    number,
+    ids_file,
+    delete_all,
+    author,
+    year,
+    year_from,
+    year_to,
+    language,
+    src_url,
+    chunk_size,
+    dry_run,
+    db_shard,
+    all_shards,
+):
     """
-    Функция для удаления записей из таблиц. Если id автора у указанной книги еще встречается где либо в таблице, то
-    этот автор не будет удален, иначе также удаляется автор из таблицы авторов по его id.
+    Функция для удаления записей из таблиц. Книги можно указать списком id и диапазонами id, файлом с id или условиями
+    поиска, условия поиска вместе с id сужают список книг. Книги удаляются частями в отдельных транзакциях, после чего
+    одним запросом удаляются авторы, у которых не осталось книг. Шарды обрабатываются по очереди, каждый в своих
+    транзакциях.
     """
-    if delete_all:
-        md.Author.delete().execute()
-        md.Book.delete().execute()
+    ids, ranges = parse_ids(number)
+    if ids_file is not None:
+        file_ids, file_ranges = parse_ids(ids_file)
+        ids += file_ids
+        ranges += file_ranges
 
-    if number:
-        query = md.Book.select(md.Book.author_id).where(md.Book.id == number)
-        author_id = 0
+    filters = {
+        "author": author,
+        "year": year,
+        "year_from": year_from,
+        "year_to": year_to,
+        "language": language,
+        "src_url": src_url,
+    }
+    if not (delete_all or ids or ranges or any(value is not None for value in filters.values())):
+        raise click.UsageError("Укажите id книг, условия поиска или флаг -a")
 
-        for row in query:
-            author_id = row.author_id
+    shards = select_shards(db_shard, all_shards)
+    if (ids or ranges) and len(shards) > 1:
+        raise click.UsageError("id книг в разных шардах не совпадают, вместе с id укажите один шард")
+    if not dry_run:
+        for name in shards:
+            check_not_rebuilding(name)
 
-        md.Book.delete().where(md.Book.id == number).execute()
-        rest_authors = md.Book.select().where(md.Book.author_id == author_id)
+    for name, path in shards.items() or [(None, None)]:
+        prefix = ""
+        if path is not None:
+            switch_database(path)
+            prefix = f"{name}: "
+        if dry_run:
+            print(f"{prefix}Будет удалено книг: {count_books(ids, ranges, filters, delete_all)}")
+            continue
 
-        if len(rest_authors) == 0:
-            md.Author.delete().where(md.Author.id == author_id).execute()
+        books, authors = delete_books(ids, ranges, filters, delete_all, chunk_size)
+        print(f"{prefix}Удалено книг: {books}, авторов: {authors}")
 
 
 if __name__ == "__main__":
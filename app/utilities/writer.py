@@ -0,0 +1,284 @@
+import time
+from collections import OrderedDict
+from functools import reduce
+
+import peewee as pw
+
+import db_and_migration.migration.models as md
+from utilities.cache import bump_generation
+from utilities.stats import NULL_STATS
+
+BOOK_KEY_FIELDS = ["author_id", "title", "year"]
+BOOK_UPDATE_FIELDS = ["language", "program_used", "src_url", "version"]
+# Выражения уникального индекса books_unique, NULL заменяется на 0, так как в уникальном индексе NULL не совпадают
+BOOK_CONFLICT_TARGET = [
+    pw.fn.IFNULL(md.Book.author_id, pw.SQL("0")),
+    md.Book.title,
+    pw.fn.IFNULL(md.Book.year, pw.SQL("0")),
+]
+
+# Ограничение на количество параметров в одном запросе с IN (...), чтобы не упереться в лимит SQLite
+MAX_QUERY_PARAMS = 500
+
+# Связывает файлы с книгами по сочетанию автор, название, год. Условие совпадает с выражениями индекса books_unique,
+# поэтому книга находится по индексу
+LINK_FILE_BOOKS = """INSERT OR IGNORE INTO manifest_books (path, book_id)
+SELECT source.column1, books.id FROM (VALUES {values}) AS source
+JOIN books ON IFNULL(books.author_id, 0) = IFNULL(source.column2, 0) AND books.title = source.column3
+AND IFNULL(books.year, 0) = IFNULL(source.column4, 0)"""
+
+REMOVE_ORPHAN_AUTHORS = """DELETE FROM authors
+WHERE NOT EXISTS (SELECT 1 FROM books WHERE books.author_id = authors.id)"""
+
+
+def chunks(items: list, size: int):
+    """
+    Делит список на части указанного размера.
+    :param items: список
+    :param size: максимальный размер части
+    :return: генератор частей списка
+    """
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+class AuthorCache:
+    """
+    LRU кэш соответствия имени автора и его id в таблице авторов. Id из кэша - только подсказка: другой процесс,
+    например wiper, может удалить автора без книг, поэтому перед записью каждой пачки id из кэша проверяются одним
+    запросом по id, а не ищутся по имени.
+
+    maxsize: максимальное количество авторов в кэше, при переполнении удаляется давно не использовавшийся автор
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._ids = OrderedDict()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, name: str) -> int or None:
+        """
+        Возвращает id автора, если он есть в кэше.
+        :param name: имя автора
+        :return: id автора или None
+        """
+        author_id = self._ids.get(name)
+        if author_id is not None:
+            self._ids.move_to_end(name)
+        return author_id
+
+    def put(self, name: str, author_id: int) -> None:
+        """
+        Добавляет автора в кэш.
+        :param name: имя автора
+        :param author_id: id автора в таблице авторов
+        """
+        self._ids[name] = author_id
+        self._ids.move_to_end(name)
+        if len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+
+class BatchWriter:
+    """
+    Накапливает информацию о книгах и записывает ее в базу данных пачками, каждая пачка записывается в одной
+    транзакции. Пачка записывается, когда в ней набирается batch_size книг или когда с прошлой записи прошло
+    flush_interval миллисекунд (проверяется при добавлении книги), а также при выходе из контекстного менеджера.
+    Результат совпадает с поочередной записью каждой книги: если сочетание автор, название, год уже есть в таблице,
+    информация обновляется только при флаге update. Уникальность сочетания обеспечивает индекс books_unique, поэтому
+    книги записываются запросом INSERT ... ON CONFLICT без предварительного поиска.
+
+    update: флаг, если True, то обновляем информацию по уже имеющейся книге в таблице, если False, ничего не делаем
+    batch_size: максимальное количество книг в одной транзакции
+    flush_interval: максимальное время в миллисекундах между записями пачек
+    authors: кэш id авторов, которые проверяются в транзакции каждой пачки
+    stats: статистика запуска, в нее записывается время записи (write) и количество добавленных, обновленных и
+    пропущенных книг
+    """
+
+    def __init__(
+        self,
+        update: bool,
+        batch_size: int = 500,
+        flush_interval: int = 1000,
+        cache_size: int = 100_000,
+        stats=NULL_STATS,
+    ):
+        self.update = update
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.authors = AuthorCache(cache_size)
+        self.stats = stats
+        self._pending = []
+        self._links = []
+        self._files = []
+        self._last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def add(self, info_list: list, path: str = None) -> None:
+        """
+        Добавляет информацию о книге в пачку и записывает пачку, если она заполнилась или истекло время ожидания.
+        :param info_list: список из автора, названия книги, года выпуска, языка, использованной программы, ссылки и
+        версии, если список пустой, ничего не происходит
+        :param path: абсолютный путь до файла, из которого прочитана книга. Если указан, книга связывается с файлом,
+        чтобы ее можно было удалить вместе с файлом
+        """
+        if info_list:
+            self._pending.append(info_list)
+            if path is not None:
+                self._links.append((path, info_list))
+        self._flush_if_needed()
+
+    def add_file(self, path: str, size: int, mtime: int, fingerprint: str) -> None:
+        """
+        Добавляет в пачку запись манифеста об обработанном файле. Запись попадает в базу данных в одной транзакции с
+        книгами из этого файла, поэтому прерванный запуск не оставит в манифесте файлы, книги из которых не записаны.
+        :param path: абсолютный путь до файла
+        :param size: размер файла в байтах
+        :param mtime: время последнего изменения файла в наносекундах
+        :param fingerprint: отпечаток содержимого файла
+        """
+        self._files.append((path, size, mtime, fingerprint))
+        self._flush_if_needed()
+
+    def _flush_if_needed(self) -> None:
+        """
+        Записывает пачку, если она заполнилась или истекло время ожидания.
+        """
+        elapsed = (time.monotonic() - self._last_flush) * 1000
+        if len(self._pending) + len(self._files) >= self.batch_size or elapsed >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Записывает накопленные книги, их авторов и записи манифеста в базу данных в одной транзакции. Если книги были
+        добавлены или обновлены, в той же транзакции увеличивается поколение каталога, чтобы результаты поиска из кэша
+        seeker и снимок каталога стали недействительными.
+        """
+        pending, self._pending = self._pending, []
+        links, self._links = self._links, []
+        files, self._files = self._files, []
+        self._last_flush = time.monotonic()
+        if not pending and not files:
+            return
+
+        with self.stats.stage("write"), md.db:
+            # книги связей - это книги той же пачки
+            author_ids = self._resolve_authors([info_list[0] for info_list in pending])
+            if pending:
+                last_id = self._last_book_id() if self.stats.enabled else None
+                written = self._write_books(pending, author_ids)
+                if written:
+                    bump_generation()
+                if self.stats.enabled:
+                    inserted = self._last_book_id() - last_id
+                    self.stats.count("books_inserted", inserted)
+                    self.stats.count("books_updated", written - inserted)
+                    self.stats.count("books_unchanged", len(pending) - written)
+            if links:
+                self._write_links(links, author_ids)
+            if files:
+                self._write_files(files)
+
+    def _resolve_authors(self, names: list) -> dict:
+        """
+        Находит id авторов пачки в транзакции записи пачки. Id из кэша проверяются запросом по id, так как автора мог
+        удалить другой процесс, а авторов, которых нет в кэше или которые были удалены, добавляет в таблицу авторов
+        запрос INSERT ... ON CONFLICT DO NOTHING, после чего их id загружаются по имени. Результат - отдельный словарь
+        пачки, поэтому вытеснение авторов из кэша не влияет на пачку, даже если в ней больше авторов, чем вмещает кэш.
+        :param names: имена авторов в порядке появления, пустые имена пропускаются
+        :return: словарь, где ключ - имя автора, а значение - его id
+        """
+        names = list(dict.fromkeys(name for name in names if name))
+        hints = {name: self.authors.get(name) for name in names if name in self.authors}
+        author_ids = {}
+        for part in chunks(list(hints.values()), MAX_QUERY_PARAMS):
+            query = md.Author.select(md.Author.id, md.Author.name).where(md.Author.id.in_(part)).tuples()
+            for author_id, name in query:
+                if hints.get(name) == author_id:
+                    author_ids[name] = author_id
+
+        missing = [name for name in names if name not in author_ids]
+        for part in chunks(missing, MAX_QUERY_PARAMS):
+            md.Author.insert_many([(name,) for name in part], fields=[md.Author.name]).on_conflict(
+                conflict_target=[md.Author.name], action="NOTHING"
+            ).execute()
+            query = md.Author.select(md.Author.id, md.Author.name).where(md.Author.name.in_(part)).tuples()
+            author_ids.update((name, author_id) for author_id, name in query)
+
+        for name in names:
+            self.authors.put(name, author_ids[name])
+        return author_ids
+
+    @staticmethod
+    def _last_book_id() -> int:
+        """
+        :return: наибольший id книги или 0, если книг нет. Новые книги получают id больше наибольшего, поэтому по
+        разнице наибольших id до и после записи считается количество добавленных книг
+        """
+        return md.Book.select(pw.fn.MAX(md.Book.id)).scalar() or 0
+
+    def _write_books(self, pending: list, author_ids: dict) -> int:
+        """
+        Записывает книги запросами insert_many. Если книга уже есть в таблице, при флаге update ее информация
+        обновляется, если она изменилась, иначе книга пропускается.
+        :param pending: список списков с информацией о книгах
+        :param author_ids: id авторов пачки, полученные функцией _resolve_authors
+        :return: количество добавленных и обновленных книг
+        """
+        rows = [(author_ids.get(info_list[0]), *info_list[1:]) for info_list in pending]
+        fields = [getattr(md.Book, name) for name in BOOK_KEY_FIELDS + BOOK_UPDATE_FIELDS]
+        written = 0
+        for part in chunks(rows, MAX_QUERY_PARAMS // len(fields)):
+            query = md.Book.insert_many(part, fields=fields).on_conflict(**self._on_conflict())
+            written += query.as_rowcount().execute()
+        return written
+
+    def _on_conflict(self) -> dict:
+        """
+        :return: параметры on_conflict для записи книг в соответствии с флагом update
+        """
+        if not self.update:
+            return {"conflict_target": BOOK_CONFLICT_TARGET, "action": "NOTHING"}
+
+        update_fields = [getattr(md.Book, name) for name in BOOK_UPDATE_FIELDS]
+        changed = [
+            pw.Expression(field, pw.OP.IS_NOT, getattr(pw.EXCLUDED, field.column_name)) for field in update_fields
+        ]
+        return {
+            "conflict_target": BOOK_CONFLICT_TARGET,
+            "update": {field: getattr(pw.EXCLUDED, field.column_name) for field in update_fields},
+            "where": reduce(lambda left, right: left | right, changed),
+        }
+
+    def _write_links(self, links: list, author_ids: dict) -> None:
+        """
+        Связывает книги с файлами, из которых они прочитаны. Книга, которая уже была в таблице, тоже связывается с
+        файлом, поэтому книга из нескольких файлов удаляется только вместе с последним из них.
+        :param links: список кортежей (путь до файла, список с информацией о книге)
+        :param author_ids: id авторов пачки, полученные функцией _resolve_authors
+        """
+        rows = [(path, author_ids.get(info_list[0]), *info_list[1:3]) for path, info_list in links]
+        for part in chunks(rows, MAX_QUERY_PARAMS // 4):
+            values = ", ".join(["(?, ?, ?, ?)"] * len(part))
+            md.db.execute_sql(LINK_FILE_BOOKS.format(values=values), [value for row in part for value in row])
+
+    @staticmethod
+    def _write_files(files: list) -> None:
+        """
+        Добавляет или заменяет записи манифеста об обработанных файлах.
+        :param files: список кортежей (путь, размер, время изменения, отпечаток)
+        """
+        fields = [md.FileManifest.path, md.FileManifest.size, md.FileManifest.mtime, md.FileManifest.fingerprint]
+        for part in chunks(files, MAX_QUERY_PARAMS // len(fields)):
+            md.FileManifest.insert_many(part, fields=fields).on_conflict_replace().execute()